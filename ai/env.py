@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from random import Random
+
+import numpy as np
+
+from ai.observation import ObservationEncoder
+from game.core import apply_actions, update
+from game.input import ActionTable
+from game.level import BlockPlace, Level, LevelSnapshot, Player
+from game.settings import Settings
+from game.utility import Vector2D
+
+
+class LevelEnv(object):
+    """
+    Gym style environment of one headless Level with its Players.
+
+    Every player is controlled by one discrete action per step, see ACTIONS.
+    Observations hold one row of OBSERVATION_FEATURES per player, written by an
+    ObservationEncoder registered on the level. Rewards are the change of health
+    of every player in a step.
+    """
+
+    ACTIONS: (str,) = ('none', 'move_left', 'move_right')
+    ACTION_BITS: [int] = [0, ActionTable.bit('move_left'), ActionTable.bit('move_right')]  # by index of ACTIONS
+    OBSERVATION_FEATURES: (str,) = ('x', 'y', 'dx', 'dy', 'health', 'armor')
+
+    def __init__(self, level_factory: () = BlockPlace, num_players: int = 2, seed: int = None,
+                 max_steps: int = 3600, dt: float = None, spawn_jitter: float = None, rebuild: bool = False):
+        """
+        Creates a new LevelEnv, reset has to be called before stepping.
+            :param level_factory: Function returning a new Level, called on every reset.
+            :param num_players: Number of players in the level, at most the number of spawn points.
+            :param seed: Seed of the random generator of this environment.
+            :param max_steps: Steps after which an episode ends.
+            :param dt: Simulated time of every step, the tick_rate setting is used if None.
+            :param spawn_jitter: Largest random horizontal offset of the spawn positions,
+            a quarter of the player width if None.
+            :param rebuild: If every reset builds a new level, otherwise the level is built once
+            and later resets restore a snapshot of its first state.
+        """
+        if Settings.settings is None:
+            Settings.init(headless=True)
+
+        self.level_factory: () = level_factory
+        self.num_players: int = num_players
+        self.max_steps: int = max_steps
+        self.dt: float = Settings.compiled().tick_dt if dt is None else dt
+        self.spawn_jitter: float = Player.standard_width() / 4 if spawn_jitter is None else spawn_jitter
+        self.rng: Random = Random(seed)  # own generator, environments never share random state
+        self.rebuild: bool = rebuild
+        self.level: Level = None
+        self._start: LevelSnapshot = None  # state of the level before the players were moved to their spawns
+        self.steps: int = 0
+        self._health: np.ndarray = np.zeros(num_players)  # health at the start of the step
+        self.encoder: ObservationEncoder = ObservationEncoder(num_players)
+
+    @property
+    def observation_shape(self) -> (int, int):
+        return self.encoder.shape
+
+    def seed(self, seed: int = None):
+        self.rng.seed(seed)
+
+    def reset(self, seed: int = None) -> np.ndarray:
+        """
+        Starts a new episode, in a fresh level or the first state of the current one.
+            :param seed: Reseeds the random generator if given.
+            :return: The first observation.
+        """
+        if seed is not None:
+            self.seed(seed)
+
+        if self.level is None or self.rebuild:
+            level = self.level_factory()
+            if self.num_players > len(level.spawn_points):
+                raise ValueError(f'{level.name} has {len(level.spawn_points)} spawn points, '
+                                 f'{self.num_players} players do not fit')
+            for spawn_point in level.spawn_points[:self.num_players]:
+                level.add(Player(x=spawn_point.x, y=spawn_point.y))
+            self.level = level
+            self._start = level.snapshot()
+            self.encoder.attach(level)
+        else:
+            level = self.level
+            level.restore(self._start)
+
+        for player, spawn_point in zip(level.players, level.spawn_points):
+            offset = Vector2D.random((2 * self.spawn_jitter, 0), rng=self.rng) - (self.spawn_jitter, 0)
+            player.x = spawn_point.x + offset.x
+        self.encoder.encode()
+        self.steps = 0
+        self._health[:] = [player.health for player in level.players]
+        return self.observe()
+
+    def step(self, actions) -> (np.ndarray, np.ndarray, bool, {}):
+        """
+        Applies one action per player and advances the level by one step.
+            :param actions: Index into ACTIONS for every player.
+            :return: Observation, reward of every player, if the episode is done, and an info dict.
+        """
+        rewards, done, info = self._advance(actions)
+        return self.observe(), rewards, done, info
+
+    def _advance(self, actions) -> (np.ndarray, bool, {}):
+        """
+        Step without building the observation.
+        """
+        bits = self.ACTION_BITS
+        apply_actions(self.level, [bits[action] for action in np.asarray(actions).tolist()])
+        update(self.level, self.dt)
+        self.steps += 1
+
+        health = np.array([player.health for player in self.level.players], dtype=float)
+        rewards = health - self._health
+        self._health = health
+        done = bool(np.any(health <= 0)) or self.steps >= self.max_steps
+        return rewards, done, {'steps': self.steps}
+
+    def observe(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        Copies the observation the encoder wrote after the last step.
+            :param out: Array of observation_shape to write into, a new one if None.
+            :return: The observation.
+        """
+        if out is None:
+            return self.encoder.buffer.copy()
+        out[:] = self.encoder.buffer
+        return out
+
+
+class VectorEnv(object):
+    """
+    Runs several independent LevelEnvs and batches their results into NumPy arrays.
+
+    Environments whose episode ended are reset automatically, the observation returned
+    for them is the first one of the new episode.
+    """
+
+    def __init__(self, num_envs: int, seed: int = None, **env_kwargs):
+        """
+        Creates a new VectorEnv.
+            :param num_envs: Number of environments.
+            :param seed: Seed of the first environment, the others get the following seeds.
+            :param env_kwargs: Arguments for every LevelEnv.
+        """
+        self.envs: [LevelEnv] = [LevelEnv(seed=None if seed is None else seed + i, **env_kwargs)
+                                 for i in range(num_envs)]
+        self.num_envs: int = num_envs
+        shape = (num_envs,) + self.envs[0].observation_shape
+        self._observations: np.ndarray = np.zeros(shape, dtype=np.float32)
+        self._rewards: np.ndarray = np.zeros(shape[:2], dtype=np.float32)
+        self._dones: np.ndarray = np.zeros(num_envs, dtype=bool)
+
+    def reset(self, seed: int = None) -> np.ndarray:
+        """
+        Starts a new episode in every environment.
+            :param seed: Reseeds the environments with seed, seed + 1, ... if given.
+            :return: (num_envs, num_players, features) observations.
+        """
+        for i, env in enumerate(self.envs):
+            env.reset(None if seed is None else seed + i)
+            env.observe(self._observations[i])
+        return self._observations.copy()
+
+    def step(self, actions, observations: np.ndarray = None, rewards: np.ndarray = None,
+             dones: np.ndarray = None) -> (np.ndarray, np.ndarray, np.ndarray, [{}]):
+        """
+        Steps every environment with its actions.
+
+        The results are written into the given arrays without copying, for example
+        into shared memory, otherwise copies of internal buffers are returned.
+            :param actions: (num_envs, num_players) action indexes.
+            :param observations: Optional (num_envs, num_players, features) array to write the observations into.
+            :param rewards: Optional (num_envs, num_players) array to write the rewards into.
+            :param dones: Optional (num_envs,) array to write the done flags into.
+            :return: Observations, (num_envs, num_players) rewards, (num_envs,) done flags and info dicts.
+        """
+        observations = self._observations if observations is None else observations
+        rewards = self._rewards if rewards is None else rewards
+        dones = self._dones if dones is None else dones
+
+        infos = []
+        for i, (env, env_actions) in enumerate(zip(self.envs, np.asarray(actions))):
+            rewards[i], done, info = env._advance(env_actions)
+            dones[i] = done
+            if done:
+                env.reset()
+            env.observe(observations[i])
+            infos.append(info)
+        return (observations.copy() if observations is self._observations else observations,
+                rewards.copy() if rewards is self._rewards else rewards,
+                dones.copy() if dones is self._dones else dones, infos)
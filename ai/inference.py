@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from concurrent.futures import Future
+from time import perf_counter
+
+import numpy as np
+
+from ai.env import LevelEnv
+from ai.observation import ObservationEncoder
+from game.input import InputSource
+
+
+class Histogram(object):
+    """
+    Counts of values in fixed buckets, for latencies and batch sizes.
+    """
+
+    def __init__(self, edges: [float]):
+        """
+        Creates a new, empty Histogram.
+            :param edges: Ascending upper edges (inclusive) of the buckets, larger values go into one more bucket.
+        """
+        self.edges: [float] = [float(edge) for edge in edges]
+        self.counts: np.ndarray = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.count: int = 0
+        self.total: float = 0
+        self.max: float = 0
+
+    @staticmethod
+    def log_edges(low: float, high: float, per_decade: int = 10) -> [float]:
+        """
+        Logarithmically spaced edges, for values spanning several orders of magnitude.
+        """
+        decades = np.log10(high / low)
+        return np.geomspace(low, high, int(np.ceil(decades * per_decade)) + 1).tolist()
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper edge of the bucket holding the q-th percentile, at most the largest value.
+            :param q: Percentile in [0, 100].
+        """
+        if self.count == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        return min(self.edges[bucket], self.max) if bucket < len(self.edges) else self.max
+
+    def summary(self) -> {str: float}:
+        """
+        :return: Dict with count, mean, p50, p90, p99 and max.
+        """
+        return {'count': self.count, 'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99),
+                'max': self.max}
+
+
+class InferenceBackend(ABC):
+    """
+    A model that maps a batch of observations to one action per observation.
+    """
+
+    @abstractmethod
+    def predict(self, observations: np.ndarray) -> np.ndarray:
+        """
+        Runs the model once for a whole batch.
+            :param observations: (batch, ...) observations.
+            :return: (batch,) indexes into LevelEnv.ACTIONS.
+        """
+
+
+class NumpyBackend(InferenceBackend):
+    """
+    Small tanh MLP in pure NumPy, picks the action with the highest score.
+
+    Stands in for a real model in tests and benchmarks, the weights are random unless given.
+    """
+
+    def __init__(self, observation_size: int, num_actions: int = len(LevelEnv.ACTIONS), hidden: int = 32,
+                 seed: int = None, weights: [np.ndarray] = None):
+        """
+        Creates a new NumpyBackend.
+            :param observation_size: Values in one flattened observation.
+            :param num_actions: Number of actions to pick from.
+            :param hidden: Width of the hidden layer.
+            :param seed: Seed of the random weights.
+            :param weights: (w1, b1, w2, b2) to use instead of random weights.
+        """
+        if weights is None:
+            rng = np.random.default_rng(seed)
+            weights = (rng.normal(0, 1 / np.sqrt(observation_size), (observation_size, hidden)), np.zeros(hidden),
+                       rng.normal(0, 1 / np.sqrt(hidden), (hidden, num_actions)), np.zeros(num_actions))
+        self.w1, self.b1, self.w2, self.b2 = (np.asarray(w, dtype=np.float32) for w in weights)
+
+    def predict(self, observations: np.ndarray) -> np.ndarray:
+        x = observations.reshape(len(observations), -1)
+        return np.argmax(np.tanh(x @ self.w1 + self.b1) @ self.w2 + self.b2, axis=1)
+
+
+class InferenceServer(object):
+    """
+    Batches observations of many players into few model calls.
+
+    Requests are queued, the oldest waiting request starts a micro-batch that collects
+    more requests until max_batch is reached or its latency_budget is used up, then the
+    backend is called once and every waiting request gets its action. Asyncio clients
+    await infer, other threads, like the game loop, use submit and never wait.
+    """
+
+    def __init__(self, backend: InferenceBackend, latency_budget: float = 0.002, max_batch: int = 256):
+        """
+        Creates a new InferenceServer, serve or start has to run it.
+            :param backend: The model.
+            :param latency_budget: Seconds the oldest request of a batch waits for more requests.
+            :param max_batch: Most requests per model call.
+        """
+        self.backend: InferenceBackend = backend
+        self.latency_budget: float = latency_budget
+        self.max_batch: int = max_batch
+
+        self.latency: Histogram = Histogram(Histogram.log_edges(1e-5, 10))  # request to answer, seconds
+        self.model_time: Histogram = Histogram(Histogram.log_edges(1e-6, 10))  # per model call, seconds
+        self.batch_size: Histogram = Histogram(range(1, max_batch + 1))
+
+        self._queue: asyncio.Queue = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+        self._task: asyncio.Task = None
+
+    async def infer(self, observation: np.ndarray) -> int:
+        """
+        Queues one observation and waits for its action, must run in the loop of the server.
+            :param observation: The observation, it must not be changed until the action arrives.
+            :return: Index into LevelEnv.ACTIONS.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._get_queue().put_nowait((observation, future, perf_counter()))
+        return await future
+
+    def submit(self, observations: [np.ndarray]) -> [Future]:
+        """
+        Queues observations from another thread without waiting, the server must be started.
+            :param observations: The observations, they must not be changed until the actions arrive.
+            :return: Future of the action of every observation.
+        """
+        queued = perf_counter()
+        requests = [(observation, Future(), queued) for observation in observations]
+        self._loop.call_soon_threadsafe(self._put, requests)
+        return [future for _, future, _ in requests]
+
+    def _put(self, requests: [(np.ndarray, Future, float)]):
+        for request in requests:
+            self._queue.put_nowait(request)
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def serve(self):
+        """
+        Answers requests until cancelled.
+        """
+        queue = self._get_queue()
+        while True:
+            batch = [await queue.get()]
+            deadline = batch[0][2] + self.latency_budget
+            while len(batch) < self.max_batch:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: [(np.ndarray, asyncio.Future | Future, float)]):
+        start = perf_counter()
+        try:
+            actions = self.backend.predict(np.stack([observation for observation, _, _ in batch])).tolist()
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        end = perf_counter()
+        self.model_time.add(end - start)
+        self.batch_size.add(len(batch))
+        for (_, future, queued), action in zip(batch, actions):
+            if not future.done():  # the client may have been cancelled
+                future.set_result(action)
+            self.latency.add(end - queued)
+
+    def start(self):
+        """
+        Runs the server on its own event loop in a daemon thread.
+        """
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._queue = asyncio.Queue()
+            self._task = self._loop.create_task(self.serve())
+            self._loop.call_soon(ready.set)
+            try:
+                self._loop.run_until_complete(self._task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='inference-server', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        """
+        Stops the server thread started by start.
+        """
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> {str: {str: float}}:
+        """
+        :return: Summaries of the latency, model_time and batch_size histograms.
+        """
+        return {'latency': self.latency.summary(), 'model_time': self.model_time.summary(),
+                'batch_size': self.batch_size.summary()}
+
+
+class AsyncPolicyInput(InputSource):
+    """
+    Players controlled by an InferenceServer, without ever waiting for it.
+
+    Every tick a player without an outstanding request sends its current observation,
+    and keeps doing the last action it got until the answer arrives, so the actions
+    lag behind by at least one tick. A failed request is counted in errors and the
+    player keeps its last action, so a bad batch costs stale actions instead of the game.
+    """
+
+    def __init__(self, server: InferenceServer, encoder: ObservationEncoder, players: [int]):
+        """
+        Creates a new AsyncPolicyInput.
+            :param server: The started server.
+            :param encoder: Encoder attached to the level, the observation of a player is its row or view.
+            :param players: Indexes of the players it controls.
+        """
+        super(AsyncPolicyInput, self).__init__(players)
+        self.server: InferenceServer = server
+        self.encoder: ObservationEncoder = encoder
+        self.bits: {int: int} = {player: 0 for player in self.players}  # last answered actions
+        self._pending: {int: Future} = {}
+        self.errors: int = 0  # requests that failed
+        self.last_error: BaseException = None  # exception of the last failed request
+
+    def write(self, actions: [int]):
+        ready = []
+        for player in self.players:
+            future = self._pending.get(player)
+            if future is None or future.done():
+                if future is not None:
+                    error = future.exception()
+                    if error is None:
+                        self.bits[player] = LevelEnv.ACTION_BITS[future.result()]
+                    else:
+                        self.errors += 1
+                        self.last_error = error
+                ready.append(player)
+            actions[player] = self.bits[player]
+        if ready:
+            buffer = self.encoder.buffer
+            for player, future in zip(ready, self.server.submit([buffer[player].copy() for player in ready])):
+                self._pending[player] = future
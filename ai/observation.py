@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import numpy as np
+
+from game.level import Level, PhysicalObject
+
+
+class ObservationEncoder(object):
+    """
+    Writes the state of a Level into one preallocated float32 array after every step.
+
+    The encoder is registered as an update hook of the level, so buffer always holds the
+    observation of the last step and is the same array for the whole life of the encoder.
+    Every player gets one row of the selected FEATURES, in the order of Level.players.
+
+    With egocentric views the buffer holds one (num_players, size) view per player:
+    its own row comes first and keeps absolute positions, the positions of the other
+    players are relative to it.
+    """
+
+    FEATURES: {str: int} = {
+        'position': 2,  # x, y
+        'velocity': 2,  # dx.x, dx.y
+        'health': 1,
+        'armor': 1,
+        'platforms': 2,  # offset to the closest point of each platform, times max_platforms
+    }
+
+    def __init__(self, num_players: int = 2, features: (str,) = ('position', 'velocity', 'health', 'armor'),
+                 egocentric: bool = False, max_platforms: int = 4):
+        """
+        Creates a new ObservationEncoder.
+            :param num_players: Number of players of the observed levels, missing players are left zero.
+            :param features: Names of the FEATURES to encode, in column order.
+            :param egocentric: If every player gets its own view with the others relative to it.
+            :param max_platforms: Number of platforms encoded by the 'platforms' feature.
+        """
+        for feature in features:
+            if feature not in self.FEATURES:
+                raise ValueError(f"unknown observation feature '{feature}', use one of {list(self.FEATURES)}")
+
+        self.num_players: int = num_players
+        self.features: (str,) = tuple(features)
+        self.egocentric: bool = egocentric
+        self.max_platforms: int = max_platforms
+
+        self._columns: {str: slice} = {}
+        start = 0
+        for feature in self.features:
+            width = self.FEATURES[feature] * (max_platforms if feature == 'platforms' else 1)
+            self._columns[feature] = slice(start, start + width)
+            start += width
+        self.size: int = start  # values per player
+
+        self._rows: np.ndarray = np.zeros((num_players, self.size), dtype=np.float32)  # absolute rows
+        if egocentric:
+            self.buffer: np.ndarray = np.zeros((num_players, num_players, self.size), dtype=np.float32)
+            self._order: np.ndarray = np.array([[i] + [j for j in range(num_players) if j != i]
+                                                for i in range(num_players)], dtype=np.intp)
+        else:
+            self.buffer: np.ndarray = self._rows
+        self.level: Level = None
+        self._platforms: np.ndarray = np.zeros((0, 4))  # AABBs of the static collidables
+        self._platforms_from: int = -1  # number of collidables the platforms were collected from
+
+    @property
+    def shape(self) -> (int,):
+        return self.buffer.shape
+
+    def columns(self, feature: str) -> slice:
+        """
+        The columns of a feature in every row.
+            :param feature: Name of the feature.
+        """
+        return self._columns[feature]
+
+    def attach(self, level: Level) -> np.ndarray:
+        """
+        Registers the encoder on a level, the buffer is written after every step of it.
+            :param level: The level to observe.
+            :return: The buffer, already holding the current state.
+        """
+        self.detach()
+        self.level = level
+        level.update_hooks.append(self.encode)
+        return self.encode(level)
+
+    def detach(self):
+        if self.level is not None:
+            self.level.update_hooks.remove(self.encode)
+            self.level = None
+
+    def encode(self, level: Level = None) -> np.ndarray:
+        """
+        Writes the observation of the current state of a level into the buffer.
+            :param level: The level, the attached one if None.
+            :return: The buffer.
+        """
+        level = self.level if level is None else level
+        players = level.players[:self.num_players]
+        n = len(players)
+        rows = self._rows
+        rows[n:] = 0
+        if n == 0:
+            self.buffer[...] = 0
+            return self.buffer
+
+        world = level.world
+        indexes = [player._index for player in players]
+        pos = world.pos[indexes]
+        for feature in self.features:
+            columns = self._columns[feature]
+            if feature == 'position':
+                rows[:n, columns] = pos
+            elif feature == 'velocity':
+                rows[:n, columns] = world.vel[indexes]
+            elif feature == 'health':
+                rows[:n, columns.start] = [player.health for player in players]
+            elif feature == 'armor':
+                rows[:n, columns.start] = [player._armor for player in players]
+            elif feature == 'platforms':
+                rows[:n, columns] = self._platform_offsets(level, pos).reshape(n, -1)
+
+        if self.egocentric:
+            np.take(rows, self._order, axis=0, out=self.buffer)
+            if 'position' in self._columns:
+                position = self._columns['position']
+                self.buffer[:n, 1:, position] -= rows[:n, None, position]  # others relative to the viewer
+            if n < self.num_players:  # missing players stay zero, also relative to a viewer and as viewers
+                self.buffer[self._order >= n] = 0
+                self.buffer[n:] = 0
+        return self.buffer
+
+    def _platform_offsets(self, level: Level, pos: np.ndarray) -> np.ndarray:
+        """
+        Offsets from every player to the closest point of every platform, zero for missing platforms.
+            :return: (players, max_platforms, 2) array.
+        """
+        if self._platforms_from != len(level.collidables):
+            boxes = [obj.aabb for obj in level.collidables
+                     if not isinstance(obj, PhysicalObject) and obj.aabb is not None]
+            self._platforms = np.array(boxes[:self.max_platforms], dtype=float).reshape(-1, 4)
+            self._platforms_from = len(level.collidables)
+
+        offsets = np.zeros((len(pos), self.max_platforms, 2))
+        boxes = self._platforms
+        if len(boxes):
+            closest = np.clip(pos[:, None, :], boxes[None, :, :2], boxes[None, :, 2:])
+            offsets[:, :len(boxes)] = closest - pos[:, None, :]
+        return offsets
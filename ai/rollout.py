@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import multiprocessing
+from multiprocessing import shared_memory
+from time import perf_counter, sleep
+
+import numpy as np
+
+from ai.env import LevelEnv, VectorEnv
+from ai.observation import ObservationEncoder
+
+
+class RolloutRing(object):
+    """
+    Single producer, single consumer ring of rollout steps in shared memory.
+
+    A worker process writes the actions of every step together with the observations,
+    rewards and done flags they led to, the trainer reads them as NumPy views of the
+    same memory without copying or pickling. The worker waits while the ring is full.
+    A step with actions of -1 holds the first observations after a worker (re)started.
+    """
+
+    _HEAD, _TAIL, _STEPS, _STOP = range(4)  # fields of the control block
+    _START, _LAST, _BUSY = range(3)  # fields of the timing block, _BUSY is the time spent stepping
+
+    def __init__(self, capacity: int, num_envs: int, observation_shape: (int, int), name: str = None):
+        """
+        Creates a new ring, or attaches to the existing one with the given name.
+            :param capacity: Number of steps the ring holds.
+            :param num_envs: Number of environments written every step.
+            :param observation_shape: (num_players, features) of one environment.
+            :param name: Name of the shared memory to attach to, a new block is created if None.
+        """
+        self.capacity: int = capacity
+        self.num_envs: int = num_envs
+        self.observation_shape: (int, int) = tuple(observation_shape)
+
+        num_players = self.observation_shape[0]
+        layout = [('control', (4,), np.int64), ('timing', (3,), np.float64),
+                  ('observations', (capacity, num_envs) + self.observation_shape, np.float32),
+                  ('rewards', (capacity, num_envs, num_players), np.float32),
+                  ('actions', (capacity, num_envs, num_players), np.int64),
+                  ('dones', (capacity, num_envs), np.bool_)]
+        size = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize + 8 for _, shape, dtype in layout)
+
+        self.shm: shared_memory.SharedMemory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        offset = 0
+        for field, shape, dtype in layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            setattr(self, field, array)
+            offset += array.nbytes + (-array.nbytes) % 8  # keep every array 8 byte aligned
+        if name is None:
+            self.control[:] = 0
+            self.timing[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def head(self) -> int:
+        return int(self.control[self._HEAD])
+
+    @property
+    def tail(self) -> int:
+        return int(self.control[self._TAIL])
+
+    @property
+    def stopped(self) -> bool:
+        return bool(self.control[self._STOP])
+
+    def stop(self):
+        self.control[self._STOP] = 1
+
+    # -------------- PRODUCER -------------- #
+
+    def full(self) -> bool:
+        return self.head - self.tail >= self.capacity
+
+    def slot(self) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+        """
+        Views of the slot the next step is written to, only valid while the ring is not full.
+            :return: The observations, rewards, actions and dones arrays of the slot.
+        """
+        i = self.head % self.capacity
+        return self.observations[i], self.rewards[i], self.actions[i], self.dones[i]
+
+    def commit(self, busy: float = 0, stepped: bool = True):
+        """
+        Publishes the slot returned by slot, and counts its environment steps.
+            :param busy: Time spent producing the step.
+            :param stepped: If the environments were stepped for the slot, False for reset observations.
+        """
+        if stepped:
+            self.control[self._STEPS] += self.num_envs
+        self.timing[self._LAST] = perf_counter()
+        self.timing[self._BUSY] += busy
+        self.control[self._HEAD] += 1
+
+    # -------------- CONSUMER -------------- #
+
+    def available(self) -> int:
+        return self.head - self.tail
+
+    def read(self, max_steps: int = None) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+        """
+        Views of the oldest unread steps, they stay valid until release is called.
+        Only contiguous steps are returned, so a read at the end of the ring can return fewer steps.
+            :param max_steps: Most steps to return, all available if None.
+            :return: The observations, rewards, actions and dones of the steps, with the step as first axis.
+        """
+        tail = self.tail
+        count = self.head - tail
+        if max_steps is not None:
+            count = min(count, max_steps)
+        start = tail % self.capacity
+        end = start + min(count, self.capacity - start)
+        return self.observations[start:end], self.rewards[start:end], self.actions[start:end], self.dones[start:end]
+
+    def release(self, steps: int):
+        """
+        Marks read steps as consumed, their slots are written again afterwards.
+            :param steps: Number of steps to release.
+        """
+        self.control[self._TAIL] += steps
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _policy_random(observations: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    return rng.integers(0, len(LevelEnv.ACTIONS), size=observations.shape[:2])
+
+
+def _run_worker(ring_name: str, capacity: int, num_envs: int, observation_shape: (int, int), seed: int,
+                policy: (), env_kwargs: {}):
+    """
+    Main function of a rollout worker process, steps its environments until the ring is stopped.
+    """
+    ring = RolloutRing(capacity, num_envs, observation_shape, name=ring_name)
+    env = VectorEnv(num_envs, seed=seed, **env_kwargs)
+    rng = np.random.default_rng(seed)
+    policy = _policy_random if policy is None else policy
+
+    ring.control[RolloutRing._STEPS] = 0
+    ring.timing[:] = 0
+    ring.timing[RolloutRing._START] = ring.timing[RolloutRing._LAST] = perf_counter()
+    try:
+        while ring.full() and not ring.stopped:
+            sleep(0.0005)
+        observations, rewards, actions, dones = ring.slot()
+        observations[:] = env.reset()
+        rewards[:] = 0
+        actions[:] = -1
+        dones[:] = False
+        ring.commit(stepped=False)
+
+        while not ring.stopped:
+            if ring.full():
+                sleep(0.0005)
+                continue
+            start = perf_counter()
+            slot_observations, slot_rewards, slot_actions, slot_dones = ring.slot()
+            slot_actions[:] = policy(observations, rng)
+            env.step(slot_actions, slot_observations, slot_rewards, slot_dones)
+            observations = slot_observations
+            ring.commit(perf_counter() - start)
+    finally:
+        ring.close()
+
+
+class RolloutPool(object):
+    """
+    Pool of worker processes that step shards of environments into shared memory rings.
+
+    Every worker owns a VectorEnv and one RolloutRing. Dead workers are restarted by poll,
+    their ring keeps all committed steps. Use the pool as a context manager, or call
+    close, so the shared memory is freed.
+    """
+
+    def __init__(self, num_workers: int, envs_per_worker: int, capacity: int = 256, seed: int = 0,
+                 policy: () = None, max_restarts: int = 3, start_method: str = None, **env_kwargs):
+        """
+        Creates a new RolloutPool, start has to be called before reading.
+            :param num_workers: Number of worker processes.
+            :param envs_per_worker: Number of environments stepped by every worker.
+            :param capacity: Steps every ring holds.
+            :param seed: Base seed, every worker and every restart gets its own seed from it.
+            :param policy: Picklable function (observations, rng) -> actions used by the workers,
+            random actions if None.
+            :param max_restarts: Restarts allowed per worker before poll raises.
+            :param start_method: multiprocessing start method, the platform default if None.
+            :param env_kwargs: Arguments for every LevelEnv.
+        """
+        self.num_workers: int = num_workers
+        self.envs_per_worker: int = envs_per_worker
+        self.seed: int = seed
+        self.policy: () = policy
+        self.max_restarts: int = max_restarts
+        self.env_kwargs: {} = env_kwargs
+        self._context = multiprocessing.get_context(start_method)
+
+        observation_shape = ObservationEncoder(env_kwargs.get('num_players', 2)).shape
+        self.rings: [RolloutRing] = [RolloutRing(capacity, envs_per_worker, observation_shape)
+                                     for _ in range(num_workers)]
+        self.processes: [multiprocessing.Process] = [None] * num_workers
+        self.restarts: [int] = [0] * num_workers
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        for worker in range(self.num_workers):
+            self._spawn(worker)
+
+    def _spawn(self, worker: int):
+        ring = self.rings[worker]
+        seed = self.seed + worker + self.num_workers * self.restarts[worker]
+        process = self._context.Process(target=_run_worker, daemon=True, name=f'rollout-{worker}',
+                                        args=(ring.name, ring.capacity, ring.num_envs, ring.observation_shape,
+                                              seed, self.policy, self.env_kwargs))
+        process.start()
+        self.processes[worker] = process
+
+    def poll(self) -> [int]:
+        """
+        Restarts workers that died.
+            :return: The restarted workers.
+            :raise RuntimeError: If a worker died more often than max_restarts.
+        """
+        restarted = []
+        for worker, process in enumerate(self.processes):
+            if process is None or process.is_alive() or self.rings[worker].stopped:
+                continue
+            if self.restarts[worker] >= self.max_restarts:
+                raise RuntimeError(f'rollout worker {worker} died {self.restarts[worker] + 1} times, '
+                                   f'last exit code {process.exitcode}')
+            self.restarts[worker] += 1
+            self._spawn(worker)
+            restarted.append(worker)
+        return restarted
+
+    def read(self, worker: int, max_steps: int = None) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+        """
+        Zero copy views of the unread steps of a worker, see RolloutRing.read.
+        """
+        return self.rings[worker].read(max_steps)
+
+    def release(self, worker: int, steps: int):
+        self.rings[worker].release(steps)
+
+    def stats(self) -> [{str: float}]:
+        """
+        Throughput of every worker since it was (re)started.
+
+        steps_per_second only counts the time spent stepping, time waiting for the trainer
+        to release a full ring shows up as a lower utilization instead.
+            :return: Dicts with worker, alive, restarts, steps, steps_per_second and utilization.
+        """
+        stats = []
+        for worker, (ring, process) in enumerate(zip(self.rings, self.processes)):
+            steps = int(ring.control[RolloutRing._STEPS])
+            busy = float(ring.timing[RolloutRing._BUSY])
+            elapsed = float(ring.timing[RolloutRing._LAST] - ring.timing[RolloutRing._START])
+            stats.append({'worker': worker, 'alive': process is not None and process.is_alive(),
+                          'restarts': self.restarts[worker], 'steps': steps,
+                          'steps_per_second': steps / busy if busy > 0 else 0.0,
+                          'utilization': busy / elapsed if elapsed > 0 else 0.0})
+        return stats
+
+    def close(self, timeout: float = 5):
+        """
+        Stops all workers and frees the shared memory.
+            :param timeout: Seconds to wait for every worker before it is terminated.
+        """
+        for ring in self.rings:
+            ring.stop()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        for ring in self.rings:
+            ring.close()
+            ring.unlink()
+        self.rings = []
@@ -0,0 +1,298 @@
+"""
+Benchmark suite of the engine hot paths and startup, runs headless.
+
+Runs every benchmark and writes the results with environment metadata as JSON:
+
+    python benchmarks/suite.py run -o results.json
+    python benchmarks/suite.py run --only do_update,collision
+
+Compares two result files and exits with 1 if a metric got slower by more than the threshold:
+
+    python benchmarks/suite.py compare base.json results.json --threshold 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from time import perf_counter
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+GAME_DIR = ROOT / 'game'  # the settings and resources are found relative to it
+
+
+def best_of(func: (), number: int, repeat: int) -> float:
+    """
+    Times a function like timeit.
+        :param func: Function without arguments.
+        :param number: Calls per timing.
+        :param repeat: Timings, the fastest one is kept.
+        :return: Seconds per call.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def metric(value: float, unit: str, better: str = 'lower') -> {str}:
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+# -------------- BENCHMARKS -------------- #
+
+def bench_vector2d(quick: bool) -> {str: {str}}:
+    """
+    Vector2D operators, nanoseconds per operation.
+    """
+    import vector2d
+
+    results = vector2d.measure(vector2d.load_vector_class(), number=20000 if quick else 200000, repeat=5)
+    return {f'vector2d.{name}': metric(value, 'ns') for name, value in results.items() if value is not None}
+
+
+def _level_with_bodies(count: int):
+    """
+    BlockPlace with count players, the first two on the spawn points and the others spread randomly above it.
+    """
+    from game.level import BlockPlace, Player
+    from game.settings import Settings
+
+    level = BlockPlace()
+    compiled = Settings.compiled()
+    rng = random.Random(count)
+    for spawn_point in level.spawn_points[:min(count, 2)]:
+        level.add(Player(x=spawn_point.x, y=spawn_point.y))
+    for _ in range(count - len(level.players)):
+        level.add(Player(x=rng.uniform(compiled.width * 0.1, compiled.width * 0.9),
+                         y=rng.uniform(compiled.height * 0.3, compiled.height)))
+    return level
+
+
+def bench_do_update(quick: bool) -> {str: {str}}:
+    """
+    Level.do_update with 2, 50 and 500 physical objects, microseconds per step.
+    """
+    from game.core import update
+
+    results = {}
+    for count in (2, 50, 500):
+        level = _level_with_bodies(count)
+        dt = 1 / 60
+        for _ in range(10):  # let the bodies settle on the platform first
+            update(level, dt)
+        number = max(5, (200 if quick else 2000) // count)
+        results[f'do_update.{count}_objects'] = metric(best_of(lambda: update(level, dt), number, 5) * 1e6, 'us')
+    return results
+
+
+def bench_collision(quick: bool) -> {str: {str}}:
+    """
+    Broad phase queries, candidate pairs and narrow phase tests of a level with 500 bodies.
+    """
+    from game.collision import NarrowPhase
+
+    level = _level_with_bodies(500)
+    level.do_update(1 / 60)
+    broad_phase = level.broad_phase
+    rng = random.Random(0)
+    boxes = []
+    for _ in range(100):
+        x, y = rng.uniform(0, 1920), rng.uniform(0, 1080)
+        boxes.append((x, y, x + 200, y + 200))
+    player, platform = level.players[0], level.collidables[0]
+    pairs, rows_a, rows_b, boxes_a, boxes_b = broad_phase.candidates()
+
+    number = 20 if quick else 200
+    return {
+        'collision.query_aabb': metric(best_of(lambda: [broad_phase.query(box) for box in boxes], number, 5)
+                                       / len(boxes) * 1e6, 'us'),
+        'collision.candidates_500': metric(best_of(broad_phase.candidates, number, 5) * 1e6, 'us'),
+        'collision.narrow_phase_500': metric(best_of(lambda: NarrowPhase.collide(pairs, boxes_a, boxes_b),
+                                                     number, 5) * 1e6, 'us'),
+        'collision.is_colliding': metric(best_of(lambda: player.is_colliding(platform), number * 10, 5) * 1e6,
+                                         'us'),
+    }
+
+
+def bench_settings(quick: bool) -> {str: {str}}:
+    """
+    Settings.load and Settings.save of a copy of the config file.
+    """
+    from game.settings import Settings
+
+    original = Settings.file_path
+    with tempfile.TemporaryDirectory() as directory:
+        Settings.file_path = str(Path(directory) / 'config.txt')
+        shutil.copy(original, Settings.file_path)
+        try:
+            number = 100 if quick else 1000
+            load = best_of(Settings.load, number, 5)
+            save = best_of(Settings.save, number, 5)
+        finally:
+            Settings.file_path = original
+            Settings.load()
+    return {'settings.load': metric(load * 1e6, 'us'), 'settings.save': metric(save * 1e6, 'us')}
+
+
+def bench_import(quick: bool) -> {str: {str}}:
+    """
+    Cold import of game.core in a fresh interpreter, milliseconds.
+    """
+    code = 'import time; t = time.perf_counter(); import game.core; print(time.perf_counter() - t)'
+    env = dict(os.environ, PYTHONPATH=str(ROOT), PYTHONDONTWRITEBYTECODE='1')
+    times = []
+    for _ in range(3 if quick else 10):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=GAME_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        times.append(float(output.split()[-1]))
+    times.sort()
+    return {'import.game_core': metric(times[len(times) // 2] * 1e3, 'ms')}
+
+
+def bench_match(quick: bool) -> {str: {str}}:
+    """
+    Headless BlockPlace match of two players with random inputs, steps per second.
+    """
+    from game.core import apply_actions, update
+    from game.input import ActionTable
+
+    level = _level_with_bodies(2)
+    rng = random.Random(0)
+    choices = [0, ActionTable.bit('move_left'), ActionTable.bit('move_right')]
+    steps = 600 if quick else 6000
+    actions = [[rng.choice(choices), rng.choice(choices)] for _ in range(steps)]
+    dt = 1 / 60
+    start = perf_counter()
+    for tick_actions in actions:
+        apply_actions(level, tick_actions)
+        update(level, dt)
+    return {'match.block_place_steps_per_second': metric(steps / (perf_counter() - start), 'steps/s', 'higher')}
+
+
+BENCHMARKS: {str: ()} = {
+    'vector2d': bench_vector2d,
+    'do_update': bench_do_update,
+    'collision': bench_collision,
+    'settings': bench_settings,
+    'import': bench_import,
+    'match': bench_match,
+}
+
+
+# -------------- RESULTS -------------- #
+
+def environment() -> {str}:
+    """
+    Metadata of the machine and the code the benchmarks ran on.
+    """
+    import numpy
+
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    try:
+        import pyglet
+        pyglet_version = pyglet.version
+    except ImportError:
+        pyglet_version = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': numpy.__version__,
+        'pyglet': pyglet_version,
+        'git_revision': git('rev-parse', 'HEAD'),
+        'git_dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    }
+
+
+def run(names: [str], quick: bool) -> {str}:
+    os.chdir(GAME_DIR)
+    from game.settings import Settings
+    Settings.init(headless=True)
+
+    results = {}
+    for name in names:
+        start = perf_counter()
+        results.update(BENCHMARKS[name](quick))
+        print(f'{name:12}{perf_counter() - start:8.1f} s', file=sys.stderr)
+    return {'environment': environment(), 'quick': quick, 'results': results}
+
+
+def compare(base: {str}, new: {str}, threshold: float) -> [str]:
+    """
+    Prints the change of every metric in both result files.
+        :param threshold: Percentage a metric may get worse before it counts as a regression.
+        :return: Names of the regressed metrics.
+    """
+    regressions = []
+    print(f'{"metric":48}{"base":>12}{"":9}{"new":>12}{"":9}{"change":>9}')
+    for name, result in new['results'].items():
+        if name not in base['results']:
+            continue
+        old_value, value = base['results'][name]['value'], result['value']
+        if not old_value:
+            continue
+        change = (value - old_value) / old_value * 100
+        worse = change if result.get('better', 'lower') == 'lower' else -change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif worse < -threshold:
+            flag = '  improved'
+        unit = result['unit']
+        print(f'{name:48}{old_value:>12.2f} {unit:8}{value:>12.2f} {unit:8}{change:>+8.1f}%{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('-o', '--output', help='JSON file to write, stdout if not given')
+    run_parser.add_argument('--only', help=f'comma separated benchmarks out of {",".join(BENCHMARKS)}')
+    run_parser.add_argument('--quick', action='store_true', help='fewer iterations, for smoke testing')
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10, help='allowed slowdown in percent')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        names = list(BENCHMARKS) if args.only is None else args.only.split(',')
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            parser.error(f'unknown benchmarks {unknown}')
+        path = None if args.output is None else Path(args.output).absolute()  # run changes the working directory
+        output = json.dumps(run(names, args.quick), indent=2)
+        if path is None:
+            print(output)
+        else:
+            path.write_text(output + '\n')
+    else:
+        with open(args.base) as base, open(args.new) as new:
+            regressions = compare(json.load(base), json.load(new), args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) over {args.threshold}%')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
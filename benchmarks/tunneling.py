@@ -0,0 +1,94 @@
+"""
+Check that fast bodies do not tunnel through static objects at coarse timesteps, runs headless.
+
+Drops a player onto the platform of BlockPlace and fires a small body at a thin wall, both
+far faster than their hitbox per step, and exits with 1 if either ends up on the far side:
+
+    python benchmarks/tunneling.py
+    python benchmarks/tunneling.py --dt 0.1 --speed 30000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+GAME_DIR = ROOT / 'game'  # the settings and resources are found relative to it
+
+
+def drop(dt: float, speed: float, steps: int) -> [str]:
+    """
+    A player falling onto the platform of BlockPlace.
+        :param dt: Differential time of every step.
+        :param speed: Falling speed in pixels per second.
+        :param steps: Steps to simulate.
+        :return: Descriptions of the failures, empty if it landed on the platform.
+    """
+    from game.core import update
+    from game.level import BlockPlace, Player
+    from game.utility import Vector2D
+
+    level = BlockPlace()
+    left, bottom, right, top = level.collidables[0].aabb
+    player = Player(x=(left + right) / 2, y=top + 300)
+    level.add(player)
+    player.dx = Vector2D(0, -speed)
+    for tick in range(steps):
+        update(level, dt)
+        if player.aabb[1] < bottom:
+            return [f'drop: the player fell through the platform in step {tick}, at y {player.y:.1f}']
+    if abs(player.aabb[1] - top) > 1:
+        return [f'drop: the player ended at y {player.y:.1f}, not on the platform top {top:.1f}']
+    return []
+
+
+def bullet(dt: float, speed: float, steps: int) -> [str]:
+    """
+    A 10 px body fired at a 4 px wall standing on the platform of BlockPlace.
+        :param dt: Differential time of every step.
+        :param speed: Horizontal speed in pixels per second.
+        :param steps: Steps to simulate.
+        :return: Descriptions of the failures, empty if it stopped at the wall.
+    """
+    from game.core import update
+    from game.level import BlockPlace, Collidable2D, PhysicalObject
+    from game.utility import Vector2D
+
+    level = BlockPlace()
+    left, bottom, right, top = level.collidables[0].aabb
+    wall = Collidable2D(x=left + 200, y=top + 100, width=4, height=200)
+    level.add(wall)
+    body = PhysicalObject(img=None, width=10, height=10, x=left + 100, y=top + 100)
+    level.add(body)
+    body.dx = Vector2D(speed, 0)
+    for tick in range(steps):
+        update(level, dt)
+        if body.aabb[2] > wall.aabb[2]:
+            return [f'bullet: the body passed the wall in step {tick}, at x {body.x:.1f}']
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dt', type=float, default=1 / 15, help='differential time of every step')
+    parser.add_argument('--speed', type=float, default=30000, help='speed of the bodies in pixels per second')
+    parser.add_argument('--steps', type=int, default=30, help='steps to simulate')
+    args = parser.parse_args()
+
+    os.chdir(GAME_DIR)
+    from game.settings import Settings
+    Settings.init(headless=True)
+
+    failures = drop(args.dt, args.speed, args.steps) + bullet(args.dt, args.speed / 10, args.steps)
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print(f'no tunneling at dt {args.dt:g} and {args.speed:g} px/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Microbenchmark of the per operation cost of game.utility.Vector2D.
+
+Compares the Vector2D of the working tree with the one of a git revision:
+
+    python benchmarks/vector2d.py --ref HEAD~1
+"""
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import timeit
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# statement run per operation, with the vectors a, b and c and the float s in scope
+OPERATIONS: {str: str} = {
+    'construct': 'Vector2D(1.5, 2.5)',
+    'vector + vector': 'a + b',
+    'vector - vector': 'a - b',
+    'vector * float': 'a * s',
+    'vector / float': 'a / s',
+    'vector += vector': 'c += b',
+    'vector *= float': 'c *= 1.0',
+    'dot_product': 'a.dot_product(b)',
+    'get_length': 'a.get_length()',
+    'get_normalized': 'a.get_normalized()',
+    'velocity update (dx += f / m)': 'c += b / s',
+    'velocity update (add_scaled)': 'c.add_scaled(b, 1 / s)',
+}
+
+
+def load_vector_class(ref: str = None):
+    """
+    Loads Vector2D from the working tree, or from game/utility.py of a git revision.
+        :param ref: The git revision, None for the working tree.
+        :return: The Vector2D class.
+    """
+    if ref is None:
+        from game.utility import Vector2D
+        return Vector2D
+
+    source = subprocess.run(['git', 'show', f'{ref}:game/utility.py'], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    module = types.ModuleType(f'utility_{ref}')
+    exec(compile(source, f'{ref}:game/utility.py', 'exec'), module.__dict__)
+    return module.Vector2D
+
+
+def measure(vector_class, number: int, repeat: int) -> {str: float}:
+    """
+    Times every operation that the class supports.
+        :param vector_class: The Vector2D class to time.
+        :param number: Executions per timing.
+        :param repeat: Timings per operation, the fastest one is kept.
+        :return: Nanoseconds per operation by operation name, None for unsupported operations.
+    """
+    results = {}
+    for name, statement in OPERATIONS.items():
+        scope = {'Vector2D': vector_class, 'a': vector_class(3.0, 4.0), 'b': vector_class(0.5, -1.5),
+                 'c0': vector_class(0.0, 0.0), 's': 2.0}
+        try:
+            exec(f'c = c0\n{statement}', dict(scope))
+        except (AttributeError, TypeError):
+            results[name] = None
+            continue
+        timer = timeit.Timer(statement, setup='c = c0', globals=scope)
+        results[name] = min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ref', default=None, help='git revision to compare the working tree with')
+    parser.add_argument('--number', type=int, default=200000, help='executions per timing')
+    parser.add_argument('--repeat', type=int, default=5, help='timings per operation')
+    args = parser.parse_args()
+
+    current = measure(load_vector_class(), args.number, args.repeat)
+    reference = measure(load_vector_class(args.ref), args.number, args.repeat) if args.ref else None
+
+    def cell(value):
+        return f'{value:10.1f}' if value is not None else f'{"n/a":>10}'
+
+    header = f'{"operation":32}{"ns/op":>10}'
+    if reference is not None:
+        header += f'{args.ref + " ns/op":>16}{"speedup":>10}'
+    print(header)
+    for name, value in current.items():
+        line = f'{name:32}{cell(value)}'
+        if reference is not None:
+            ref_value = reference[name]
+            speedup = f'{ref_value / value:9.2f}x' if ref_value is not None and value else f'{"":>10}'
+            line += f'{cell(ref_value):>16}{speedup}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
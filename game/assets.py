@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from game.settings import Settings
+
+if TYPE_CHECKING:  # the view layer of pyglet needs a display, it is imported on first use
+    from pyglet.image import AbstractImage, TextureRegion
+    from pyglet.image.atlas import TextureBin
+
+
+class AssetCache(object):
+    """
+    Loads sprite images into shared texture atlases and hands out scaled variants of them.
+
+    Every image is packed into the atlas once, so the Sprites of a batch use the same
+    texture and are drawn with one bind. Scaled variants are separate TextureRegions
+    of the packed image, cached by (image, width, height) and anchored at their center.
+    The regions are shared by every Sprite that uses them and must not be modified.
+    """
+
+    def __init__(self, atlas_size: int = 2048, border: int = 1):
+        """
+        Creates a new, empty AssetCache, no textures are made before the first image is used.
+            :param atlas_size: Width and height of every atlas texture.
+            :param border: Blank pixels around every packed image, against bleeding when scaled.
+        """
+        self.atlas_size: int = atlas_size
+        self.border: int = border
+        self._bin: TextureBin = None
+        self._images: {str | AbstractImage: TextureRegion} = {}  # packed image by resource name or source image
+        self._scaled: {(str | AbstractImage, int, int): TextureRegion} = {}
+
+    def image(self, img: str | AbstractImage) -> TextureRegion:
+        """
+        The packed, unscaled form of an image.
+            :param img: Resource name of the image, or an image that is packed as given.
+            :return: The region of the atlas holding the image, images too large for it get their own texture.
+        """
+        packed = self._images.get(img)
+        if packed is None:
+            import pyglet
+            from pyglet.image.atlas import AllocatorException, TextureBin
+
+            source = img
+            if isinstance(img, str):
+                try:
+                    source = pyglet.image.load(str(Settings.manifest().path(img)))
+                except KeyError:  # not a file of the manifest, pyglet may know it
+                    source = Settings.pyglet_resource().image(img, atlas=False)
+            if self._bin is None:
+                self._bin = TextureBin(self.atlas_size, self.atlas_size)
+            try:
+                packed = self._bin.add(source.get_image_data(), border=self.border)
+            except AllocatorException:
+                packed = source.get_texture()
+            self._images[img] = packed
+        return packed
+
+    def preload(self, images: [str | AbstractImage]):
+        """
+        Packs images, tallest first, which packs them more densely than packing them as they are used.
+            :param images: Resource names or images.
+        """
+        missing = [img for img in set(images) if img not in self._images]
+        sizes = {img: Settings.manifest().image_size(img) if isinstance(img, str) else (img.width, img.height)
+                 for img in missing}
+        for img in sorted(missing, key=lambda i: -(sizes[i] or (0, 0))[1]):
+            self.image(img)
+
+    def scaled(self, img: str | AbstractImage, width: float = None, height: float = None) -> TextureRegion:
+        """
+        An image drawn at the given size, anchored at its center, without changing the image itself.
+            :param img: Resource name of the image, or an image.
+            :param width: Width to draw, the width of the image if None.
+            :param height: Height to draw, the height of the image if None.
+            :return: A shared TextureRegion, the same object for the same image and size.
+        """
+        packed = self.image(img)
+        width = packed.width if width is None else int(round(width))
+        height = packed.height if height is None else int(round(height))
+        key = (img, width, height)
+        region = self._scaled.get(key)
+        if region is None:
+            region = packed.get_region(0, 0, packed.width, packed.height)
+            region.width = width
+            region.height = height
+            region.anchor_x = width / 2
+            region.anchor_y = height / 2
+            self._scaled[key] = region
+        return region
+
+    def clear(self):
+        """
+        Drops all cached images and the atlas, Sprites made from them keep their textures alive.
+        """
+        self._bin = None
+        self._images.clear()
+        self._scaled.clear()
+
+
+assets: AssetCache = AssetCache()  # the images of the game
@@ -0,0 +1,594 @@
+from __future__ import annotations
+
+from math import floor
+
+import numpy as np
+
+
+class SpatialHash(object):
+    """
+    Uniform grid that maps every cell to the objects whose AABB overlaps it.
+
+    Cells and their contents are kept in insertion order so queries are deterministic.
+    """
+
+    def __init__(self, cell_size: float):
+        """
+        Creates a new, empty SpatialHash.
+            :param cell_size: Width and height of one grid cell.
+        """
+        self.cell_size: float = cell_size
+        self._cells: {(int, int): {object: None}} = {}
+        self._ranges: {object: (int, int, int, int)} = {}  # cells covered by every object
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, obj):
+        return obj in self._ranges
+
+    def cell_range(self, aabb: (float, float, float, float)) -> (int, int, int, int):
+        """
+        The cells covered by an AABB.
+            :param aabb: The box as (min_x, min_y, max_x, max_y).
+            :return: The covered cells as (min_cx, min_cy, max_cx, max_cy).
+        """
+        size = self.cell_size
+        return floor(aabb[0] / size), floor(aabb[1] / size), floor(aabb[2] / size), floor(aabb[3] / size)
+
+    def insert(self, obj, cell_range: (int, int, int, int)):
+        """
+        Adds an object to all cells of a cell range.
+            :param obj: The object to add.
+            :param cell_range: The cells to add it to, see cell_range.
+        """
+        self._ranges[obj] = cell_range
+        cells = self._cells
+        for cx in range(cell_range[0], cell_range[2] + 1):
+            for cy in range(cell_range[1], cell_range[3] + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    cells[(cx, cy)] = {obj: None}
+                else:
+                    cell[obj] = None
+
+    def insert_buckets(self, objects: [object], cell_ranges: np.ndarray, cells: np.ndarray, offsets: np.ndarray,
+                       members: np.ndarray):
+        """
+        Adds objects whose cells were computed before, like insert does for every object in order.
+            :param objects: The objects to add.
+            :param cell_ranges: (n, 4) cells covered by every object, see cell_range.
+            :param cells: (m, 2) every cell covered by any of the objects.
+            :param offsets: (m + 1) start of the members of every cell in members.
+            :param members: Index into objects of the members of every cell, in the order they were added.
+        """
+        for obj, cell_range in zip(objects, cell_ranges.tolist()):
+            self._ranges[obj] = tuple(cell_range)
+        members = members.tolist()
+        offsets = offsets.tolist()
+        own_cells = self._cells
+        for (cx, cy), start, end in zip(cells.tolist(), offsets, offsets[1:]):
+            cell = own_cells.get((cx, cy))
+            if cell is None:
+                cell = own_cells[(cx, cy)] = {}
+            for i in members[start:end]:
+                cell[objects[i]] = None
+
+    def buckets(self) -> [((int, int), [object])]:
+        """
+        The non-empty cells and their objects, in the order the cells were created.
+        """
+        return [(key, list(cell)) for key, cell in self._cells.items()]
+
+    def remove(self, obj):
+        """
+        Removes an object from all the cells it is in.
+            :param obj: The object to remove.
+        """
+        cell_range = self._ranges.pop(obj)
+        cells = self._cells
+        for cx in range(cell_range[0], cell_range[2] + 1):
+            for cy in range(cell_range[1], cell_range[3] + 1):
+                cell = cells[(cx, cy)]
+                del cell[obj]
+                if not cell:
+                    del cells[(cx, cy)]
+
+    def move(self, obj, cell_range: (int, int, int, int)) -> bool:
+        """
+        Moves an object to a new cell range, nothing is done if the range did not change.
+            :param obj: The object to move.
+            :param cell_range: The new cells of the object.
+            :return: If the object was moved to other cells.
+        """
+        if self._ranges[obj] == cell_range:
+            return False
+        self.remove(obj)
+        self.insert(obj, cell_range)
+        return True
+
+    def query(self, cell_range: (int, int, int, int)) -> {object: None}:
+        """
+        Finds all objects in a cell range.
+            :param cell_range: The cells to search.
+            :return: The objects in those cells, as an ordered set.
+        """
+        found = {}
+        cells = self._cells
+        for cx in range(cell_range[0], cell_range[2] + 1):
+            for cy in range(cell_range[1], cell_range[3] + 1):
+                cell = cells.get((cx, cy))
+                if cell is not None:
+                    found.update(cell)
+        return found
+
+
+class BroadPhase(object):
+    """
+    Broad phase collision index of a Level.
+
+    Static collidables are put into their own grid once, when they are added.
+    Dynamic bodies are kept in a second grid that is updated every step from the
+    PhysicsWorld, only bodies that moved into other cells are re-bucketed.
+    Sleeping bodies are neither updated nor searched from, they are only found
+    as the other object of a pair, so a step costs time for the awake bodies.
+    """
+
+    def __init__(self, cell_size: float):
+        """
+        Creates a new, empty BroadPhase.
+            :param cell_size: Width and height of one grid cell.
+        """
+        self.static: SpatialHash = SpatialHash(cell_size)
+        self.dynamic: SpatialHash = SpatialHash(cell_size)
+        self._bodies: [] = []  # dynamic bodies, in the order of the arrays below
+        self._local: np.ndarray = np.zeros((0, 4))  # hitbox AABB of every body relative to its position
+        self._ranges: np.ndarray = np.zeros((0, 4), dtype=np.int64)  # cells of every body at the last update
+        self._boxes: np.ndarray = np.zeros((0, 4))  # hitbox AABB of every body at the last update
+        self._sizes: np.ndarray = np.zeros((0, 2))  # hitbox width and height of every body
+        self._min_size: float = 0  # smallest width or height of a hitbox
+        self._rows: np.ndarray = None  # PhysicsWorld row of every body, None when it has to be rebuilt
+        self._slots: {object: int} = {}  # index of every body in the arrays above
+        self._awake_slots: np.ndarray = None  # indexes of the awake bodies, None when all are awake
+        self._awake_rows: np.ndarray = None  # PhysicsWorld.awake_rows that _awake_slots was made from
+        self._static_boxes: {object: (float, float, float, float)} = {}  # static boxes never change
+        self._static_bounds: np.ndarray = None  # AABB around all static boxes, None when it has to be recomputed
+
+    def add(self, obj, dynamic: bool):
+        """
+        Indexes a collidable, objects without a hitbox are ignored.
+            :param obj: The Collidable2D to index.
+            :param dynamic: If the object moves, and is part of the PhysicsWorld.
+        """
+        local = obj.local_bounds
+        if local is None or not obj.does_collide:
+            return
+
+        aabb = obj.aabb
+        if not dynamic:
+            self._static_boxes[obj] = aabb
+            self._static_bounds = None
+            self.static.insert(obj, self.static.cell_range(aabb))
+            return
+
+        cell_range = self.dynamic.cell_range(aabb)
+        self.dynamic.insert(obj, cell_range)
+        self._slots[obj] = len(self._bodies)
+        self._bodies.append(obj)
+        self._local = np.vstack((self._local, local))
+        self._sizes = self._local[:, 2:] - self._local[:, :2]
+        self._min_size = float(self._sizes.min())
+        self._boxes = np.vstack((self._boxes, aabb))
+        self._ranges = np.vstack((self._ranges, cell_range))
+        self._rows = None
+        self._awake_rows = None
+
+    def add_static(self, objects: [object], boxes: np.ndarray, cell_ranges: np.ndarray, cells: np.ndarray,
+                   offsets: np.ndarray, members: np.ndarray):
+        """
+        Indexes static collidables whose AABBs and cells were computed before, see LevelData.
+            :param objects: The Collidable2Ds, all with a hitbox and colliding.
+            :param boxes: (n, 4) AABB of every object.
+            :param cell_ranges: (n, 4) cells covered by every object.
+            :param cells: The cells and their members, as in SpatialHash.insert_buckets.
+        """
+        static_boxes = self._static_boxes
+        for obj, box in zip(objects, boxes.tolist()):
+            static_boxes[obj] = tuple(box)
+        self._static_bounds = None
+        self.static.insert_buckets(objects, cell_ranges, cells, offsets, members)
+
+    def remove(self, obj):
+        """
+        Removes a collidable from the index, if it is in it.
+            :param obj: The Collidable2D to remove.
+        """
+        if obj in self.static:
+            self.static.remove(obj)
+            del self._static_boxes[obj]
+            self._static_bounds = None
+        elif obj in self.dynamic:
+            self.dynamic.remove(obj)
+            index = self._slots.pop(obj)
+            del self._bodies[index]
+            self._local = np.delete(self._local, index, axis=0)
+            self._sizes = self._local[:, 2:] - self._local[:, :2]
+            self._min_size = float(self._sizes.min()) if len(self._sizes) else 0.0
+            self._boxes = np.delete(self._boxes, index, axis=0)
+            self._ranges = np.delete(self._ranges, index, axis=0)
+            self._slots = {body: i for i, body in enumerate(self._bodies)}
+            self._rows = None
+            self._awake_rows = None
+
+    def reindex(self):
+        """
+        Marks the PhysicsWorld rows of the bodies as changed, to be called after rows are moved or restored.
+        The next update recomputes the boxes of all bodies, sleeping ones included.
+        """
+        self._rows = None
+        self._awake_rows = None
+
+    def move_static(self, obj):
+        """
+        Re-buckets a static collidable that was moved by hand.
+            :param obj: The moved Collidable2D.
+        """
+        if obj in self.static:
+            self._static_boxes[obj] = obj.aabb
+            self._static_bounds = None
+            self.static.move(obj, self.static.cell_range(obj.aabb))
+
+    def update(self, world):
+        """
+        Re-buckets the awake dynamic bodies that moved into other cells since the last update.
+            :param world: The PhysicsWorld holding the positions of the bodies.
+        """
+        if not self._bodies:
+            return
+        awake_rows = world.awake_rows() if world.sleeping_count else None
+        if self._rows is None:
+            self._rows = np.array([body._index for body in self._bodies], dtype=np.intp)
+            full = True
+        else:  # when bodies fall asleep or wake up all boxes are refreshed, so they only depend on the positions
+            full = awake_rows is None or awake_rows is not self._awake_rows
+        if full:
+            self._awake_slots = None if awake_rows is None else np.flatnonzero(~world.sleeping[self._rows])
+            self._awake_rows = awake_rows
+            slots = None
+            pos = world.pos[self._rows]
+            self._boxes = self._local + np.hstack((pos, pos))
+            ranges = np.floor(self._boxes / self.dynamic.cell_size).astype(np.int64)
+            moved = np.any(ranges != self._ranges, axis=1)
+        else:
+            slots = self._awake_slots
+            pos = world.pos[self._rows[slots]]
+            boxes = self._local[slots] + np.hstack((pos, pos))
+            self._boxes[slots] = boxes
+            ranges = np.floor(boxes / self.dynamic.cell_size).astype(np.int64)
+            moved = np.any(ranges != self._ranges[slots], axis=1)
+        if not moved.any():
+            return
+
+        changed = np.flatnonzero(moved) if slots is None else slots[moved]
+        ranges = ranges[moved]
+        bodies = self._bodies
+        for i, cell_range in zip(changed.tolist(), ranges.tolist()):
+            self.dynamic.move(bodies[i], tuple(cell_range))
+        self._ranges[changed] = ranges
+
+    def candidates(self) -> ([(object, object)], np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+        """
+        All pairs of objects that share a cell and are therefore possibly colliding.
+        The first object of a pair is always an awake dynamic body, every pair is only returned once.
+            :return: The candidate pairs in a deterministic order, the PhysicsWorld rows of both
+            objects of every pair (-1 for static objects) and the AABBs of both objects of every pair.
+        """
+        pairs = []
+        index_a = []
+        rows_b = []
+        boxes_b = []
+        if not self._bodies:
+            return pairs, np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros((0, 4)), np.zeros((0, 4))
+
+        static_boxes = self._static_boxes
+        slots = self._slots
+        bodies = self._bodies
+        rows = self._rows.tolist()
+        boxes = self._boxes.tolist()
+        if self._awake_slots is None:
+            awake, ranges = range(len(bodies)), self._ranges.tolist()
+        else:
+            awake, ranges = self._awake_slots.tolist(), self._ranges[self._awake_slots].tolist()
+        seen = {}
+        for i, cell_range in zip(awake, ranges):
+            body = bodies[i]
+            seen[body] = None
+            for other in self.static.query(cell_range):
+                pairs.append((body, other))
+                index_a.append(i)
+                rows_b.append(-1)
+                boxes_b.append(static_boxes[other])
+            for other in self.dynamic.query(cell_range):
+                if other not in seen:
+                    j = slots[other]
+                    pairs.append((body, other))
+                    index_a.append(i)
+                    rows_b.append(rows[j])
+                    boxes_b.append(boxes[j])
+
+        index_a = np.array(index_a, dtype=np.intp)
+        return (pairs, self._rows[index_a], np.array(rows_b, dtype=np.intp),
+                self._boxes[index_a], np.array(boxes_b, dtype=float).reshape(-1, 4))
+
+    def sweep(self, world, dt: float, iterations: int = 4) -> int:
+        """
+        Continuous collision of fast dynamic bodies against the static objects, run after PhysicsWorld.step.
+
+        Bodies that moved more than half their hitbox in the step could skip past a static object or be
+        pushed out of its wrong side, they are swept from where they started instead. At the first static
+        object in their way they stop, lose their velocity into it and move the rest of the step along it,
+        up to iterations times. Slower bodies are left to the discrete collision of the step, so sub-steps
+        only happen when an impact is predicted. Polygon hitboxes of static objects are swept as their AABB.
+            :param world: The PhysicsWorld, after step.
+            :param dt: Differential time of the step.
+            :param iterations: Most impacts of a body in one step, it stops at the last one.
+            :return: Number of swept bodies.
+        """
+        if not self._bodies or not self._static_boxes:
+            return 0
+        # bodies with a velocity component faster than half the smallest hitbox per step, usually none
+        candidates = np.flatnonzero(np.abs(world.vel[:world.count]) > self._min_size / (2 * dt))
+        if len(candidates) == 0:
+            return 0
+        if self._static_bounds is None:
+            boxes = np.array(list(self._static_boxes.values()), dtype=float)
+            self._static_bounds = np.concatenate((boxes[:, :2].min(axis=0), boxes[:, 2:].max(axis=0)))
+        min_x, min_y, max_x, max_y = self._static_bounds.tolist()
+
+        # moves longer than half the hitbox that pass the area of the static objects, not like falling far below it
+        slots, rows = [], []
+        for row in dict.fromkeys((candidates // 2).tolist()):  # flat indexes of the (n, 2) velocities
+            slot = self._slots.get(world.bodies[row])
+            if slot is None or world.sleeping[row] or world.kinematic[row]:
+                continue
+            (prev_x, prev_y), (x, y) = world.prev_pos[row].tolist(), world.pos[row].tolist()
+            left, bottom, right, top = self._local[slot].tolist()
+            width, height = self._sizes[slot].tolist()
+            if ((abs(x - prev_x) * 2 > width or abs(y - prev_y) * 2 > height) and
+                    min(x, prev_x) + left <= max_x and max(x, prev_x) + right >= min_x and
+                    min(y, prev_y) + bottom <= max_y and max(y, prev_y) + top >= min_y):
+                slots.append(slot)
+                rows.append(row)
+        if not slots:
+            return 0
+
+        bounds = self._static_bounds
+        rows = np.array(rows, dtype=np.intp)
+        local = self._local[slots]
+        start = world.prev_pos[rows]
+        moves = world.pos[rows] - start
+        vel = world.vel[rows]
+        remaining = np.ones(len(slots))  # fraction of the step not moved yet
+        static_boxes = self._static_boxes
+        active = np.arange(len(slots))  # bodies whose moves are not swept yet
+        for _ in range(iterations):
+            boxes = local[active] + np.hstack((start[active], start[active]))
+            ends = boxes + np.hstack((moves[active], moves[active]))
+            swept = np.hstack((np.minimum(boxes[:, :2], ends[:, :2]), np.maximum(boxes[:, 2:], ends[:, 2:])))
+            index, others = [], []
+            swept[:, :2] = np.maximum(swept[:, :2], bounds[:2])  # cells outside the bounds hold no static objects
+            swept[:, 2:] = np.minimum(swept[:, 2:], bounds[2:])
+            for k, box in enumerate(swept.tolist()):
+                for other in self.static.query(self.static.cell_range(box)):
+                    index.append(k)
+                    others.append(static_boxes[other])
+            if not index:
+                break
+            index = np.array(index, dtype=np.intp)
+            toi, normals = NarrowPhase.time_of_impact(boxes[index], moves[active[index]], np.array(others))
+            first = np.full(len(active), np.inf)
+            np.minimum.at(first, index, toi)
+            hit = np.flatnonzero(first < 1)
+            if len(hit) == 0:
+                break
+
+            # the first impact of every body that hits something, the earliest listed static wins a tie
+            earliest = np.flatnonzero((toi == first[index]) & (toi < 1))
+            hit_pairs = earliest[np.unique(index[earliest], return_index=True)[1]]
+            t = first[hit]
+            hit = active[hit]
+            normal = normals[hit_pairs]
+            start[hit] += moves[hit] * t[:, None]
+            closing = np.einsum('ij,ij->i', vel[hit], normal)
+            vel[hit] -= normal * np.minimum(closing, 0)[:, None]
+            remaining[hit] *= 1 - t
+            moves[hit] = vel[hit] * (remaining[hit] * dt)[:, None]
+            active = hit
+        else:
+            moves[active] = 0  # out of iterations, the rest of the move is not known to be free
+
+        world.pos[rows] = start + moves
+        world.vel[rows] = vel
+        return len(slots)
+
+    def box(self, body) -> (float, float, float, float):
+        """
+        The AABB of an indexed dynamic body at the last update, None if it is not indexed.
+        """
+        slot = self._slots.get(body)
+        return None if slot is None else tuple(self._boxes[slot].tolist())
+
+    def touching(self, aabb: (float, float, float, float), margin: float = 0) -> [object]:
+        """
+        Finds the dynamic bodies whose AABB at the last update overlaps or touches a box.
+            :param aabb: The box as (min_x, min_y, max_x, max_y), nothing is found if None.
+            :param margin: Distance at which boxes count as touching.
+            :return: The found bodies.
+        """
+        if aabb is None:
+            return []
+        left, bottom, right, top = aabb[0] - margin, aabb[1] - margin, aabb[2] + margin, aabb[3] + margin
+        boxes = self._boxes
+        slots = self._slots
+        found = []
+        for body in self.dynamic.query(self.dynamic.cell_range((left, bottom, right, top))):
+            box = boxes[slots[body]].tolist()
+            if box[0] <= right and left <= box[2] and box[1] <= top and bottom <= box[3]:
+                found.append(body)
+        return found
+
+    def query(self, aabb: (float, float, float, float)) -> [object]:
+        """
+        Finds all indexed objects whose cells overlap an AABB.
+            :param aabb: The box as (min_x, min_y, max_x, max_y).
+            :return: The found objects.
+        """
+        found = self.static.query(self.static.cell_range(aabb))
+        found.update(self.dynamic.query(self.dynamic.cell_range(aabb)))
+        return list(found)
+
+
+class NarrowPhase(object):
+    """
+    Exact collision tests and contact resolution for batches of candidate pairs.
+
+    Rectangle hitboxes are tested as AABBs for all pairs at once, pairs with an
+    'abstract' polygon hitbox are refined with the separating axis theorem.
+    Contact normals always point from the second object of a pair to the first.
+    """
+
+    @staticmethod
+    def collide(pairs: [(object, object)], boxes_a: np.ndarray, boxes_b: np.ndarray) -> (np.ndarray, np.ndarray,
+                                                                                          np.ndarray):
+        """
+        Tests all candidate pairs for overlap.
+            :param pairs: The candidate pairs.
+            :param boxes_a: (n, 4) AABBs of the first objects of the pairs.
+            :param boxes_b: (n, 4) AABBs of the second objects of the pairs.
+            :return: Bool mask of colliding pairs, (n, 2) contact normals and (n,) penetration depths.
+        """
+        overlap_x = np.minimum(boxes_a[:, 2], boxes_b[:, 2]) - np.maximum(boxes_a[:, 0], boxes_b[:, 0])
+        overlap_y = np.minimum(boxes_a[:, 3], boxes_b[:, 3]) - np.maximum(boxes_a[:, 1], boxes_b[:, 1])
+        hit = (overlap_x > 0) & (overlap_y > 0)
+
+        # push out along the axis of least penetration, away from the center of b
+        along_x = overlap_x < overlap_y
+        center_delta = (boxes_a[:, :2] + boxes_a[:, 2:]) - (boxes_b[:, :2] + boxes_b[:, 2:])
+        direction = np.where(center_delta < 0, -1.0, 1.0)
+        normals = np.zeros((len(pairs), 2))
+        normals[:, 0] = np.where(along_x, direction[:, 0], 0)
+        normals[:, 1] = np.where(along_x, 0, direction[:, 1])
+        depths = np.where(along_x, overlap_x, overlap_y)
+
+        for i in np.flatnonzero(hit).tolist():
+            a, b = pairs[i]
+            if a.is_polygon or b.is_polygon:
+                contact = NarrowPhase.polygon_contact(a.world_vertices, b.world_vertices)
+                if contact is None:
+                    hit[i] = False
+                else:
+                    normals[i], depths[i] = contact
+        return hit, normals, depths
+
+    @staticmethod
+    def time_of_impact(boxes: np.ndarray, moves: np.ndarray, others: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Swept AABB test of moving boxes against resting ones.
+            :param boxes: (n, 4) AABBs at the start of the move.
+            :param moves: (n, 2) movement of the boxes.
+            :param others: (n, 4) resting AABBs.
+            :return: (n,) fraction of the move at which each box first touches its other box, inf if it
+            does not within the move or overlaps it from the start, and (n, 2) normals of the touched sides.
+        """
+        ahead = moves > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            near = np.where(ahead, others[:, :2] - boxes[:, 2:], others[:, 2:] - boxes[:, :2]) / moves
+            far = np.where(ahead, others[:, 2:] - boxes[:, :2], others[:, :2] - boxes[:, 2:]) / moves
+        still = moves == 0
+        if still.any():  # not moving on an axis, the boxes overlap on it always or never
+            overlapping = (boxes[:, 2:] > others[:, :2]) & (boxes[:, :2] < others[:, 2:])
+            near = np.where(still, np.where(overlapping, -np.inf, np.inf), near)
+            far = np.where(still, np.where(overlapping, np.inf, -np.inf), far)
+
+        entry = near.max(axis=1)
+        hit = (entry >= 0) & (entry < 1) & (entry < far.min(axis=1))
+        axis = np.argmax(near, axis=1)
+        normals = np.zeros((len(boxes), 2))
+        normals[np.arange(len(boxes)), axis] = -np.sign(moves[np.arange(len(boxes)), axis])
+        return np.where(hit, entry, np.inf), normals
+
+    @staticmethod
+    def polygon_contact(vertices_a: np.ndarray, vertices_b: np.ndarray) -> (np.ndarray, float):
+        """
+        Separating axis test of two convex polygons.
+            :param vertices_a: (n, 2) vertices of the first polygon, in order.
+            :param vertices_b: (m, 2) vertices of the second polygon, in order.
+            :return: The contact normal and penetration depth, or None if the polygons do not overlap.
+        """
+        edges = np.vstack((np.roll(vertices_a, -1, axis=0) - vertices_a,
+                           np.roll(vertices_b, -1, axis=0) - vertices_b))
+        axes = np.column_stack((edges[:, 1], -edges[:, 0]))
+        lengths = np.hypot(axes[:, 0], axes[:, 1])
+        axes = axes[lengths > 0] / lengths[lengths > 0, None]
+
+        projected_a = vertices_a @ axes.T
+        projected_b = vertices_b @ axes.T
+        overlap = (np.minimum(projected_a.max(axis=0), projected_b.max(axis=0)) -
+                   np.maximum(projected_a.min(axis=0), projected_b.min(axis=0)))
+        if np.any(overlap <= 0):
+            return None
+
+        axis = int(np.argmin(overlap))
+        normal = axes[axis]
+        if np.dot(vertices_a.mean(axis=0) - vertices_b.mean(axis=0), normal) < 0:
+            normal = -normal
+        return normal, float(overlap[axis])
+
+    @staticmethod
+    def resolve(world, rows_a: np.ndarray, rows_b: np.ndarray, normals: np.ndarray, depths: np.ndarray):
+        """
+        Separates colliding bodies and removes their velocity into each other.
+
+        Penetration and velocity are split between both bodies of a contact by inverse mass,
+        static objects (row -1), bodies that do not update, sleeping and kinematic bodies never move.
+        Contacts between bodies are summed in the order of their rows, the order of the bodies in a cell
+        depends on how they moved, and a restored world has to step exactly like the original.
+            :param world: The PhysicsWorld of the bodies.
+            :param rows_a: World rows of the first bodies of the contacts.
+            :param rows_b: World rows of the second bodies of the contacts, -1 for static objects.
+            :param normals: (n, 2) contact normals, pointing from b to a.
+            :param depths: (n,) penetration depths.
+        """
+        if len(depths) == 0:
+            return
+
+        if (rows_b >= 0).any():
+            order = np.lexsort((rows_b, rows_a))
+            rows_a, rows_b, normals, depths = rows_a[order], rows_b[order], normals[order], depths[order]
+
+        n = world.count
+        moves = world.updates[:n]
+        if world.sleeping_count or world.kinematic_count:  # sleeping and kinematic bodies are not pushed
+            moves = moves & ~world.sleeping[:n] & ~world.kinematic[:n]
+        weights = np.append(world.inv_mass[:n] * moves, 0.0)  # row -1 reads the trailing 0
+        weight_a = weights[rows_a]
+        weight_b = weights[rows_b]
+        total = weight_a + weight_b
+        share = np.divide(1.0, total, out=np.zeros_like(total), where=total > 0)
+        dynamic_b = rows_b >= 0
+
+        any_dynamic_b = dynamic_b.any()
+
+        correction = normals * (depths * share)[:, None]
+        np.add.at(world.pos, rows_a, correction * weight_a[:, None])
+        if any_dynamic_b:
+            np.add.at(world.pos, rows_b[dynamic_b], -correction[dynamic_b] * weight_b[dynamic_b, None])
+
+        relative_velocity = world.vel[rows_a]
+        if any_dynamic_b:
+            relative_velocity[dynamic_b] -= world.vel[rows_b[dynamic_b]]
+        closing = np.einsum('ij,ij->i', relative_velocity, normals)
+        impulse = np.where(closing < 0, -closing * share, 0.0)
+        np.add.at(world.vel, rows_a, normals * (impulse * weight_a)[:, None])
+        if any_dynamic_b:
+            np.add.at(world.vel, rows_b[dynamic_b], -normals[dynamic_b] * (impulse * weight_b)[dynamic_b, None])
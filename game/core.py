@@ -1,15 +1,20 @@
 from __future__ import annotations
 
-import pyglet
-from pyglet import clock
-from pyglet import resource
-from pyglet.graphics import Batch
-from pyglet.text import Label
-from pyglet.window import Window, key
+from datetime import datetime
+from typing import TYPE_CHECKING
 
+from game.input import ActionTable, Controls, InputSource, KeyboardInput
 from game.level import Level, BlockPlace, Player
+from game.profiler import ProfilerOverlay, profiler
+from game.recording import SessionRecorder
 from game.settings import Settings
-from game.utility import Vector2D
+from game.simulation import FixedStepScheduler, FrameBuffer, RateCounter, SimulationThread
+
+if TYPE_CHECKING:  # the window side of pyglet needs a display, so it is imported when rendering
+    from game.netplay import RollbackSession
+    from pyglet.graphics import Batch
+    from pyglet.text import Label
+    from pyglet.window import Window
 
 
 # NOTES:
@@ -35,9 +40,11 @@ class KeyStateHandler(dict):
     """
 
     def on_key_press(self, symbol, modifiers):
+        from pyglet.window import key
         self[key.symbol_string(symbol)] = True
 
     def on_key_release(self, symbol, modifiers):
+        from pyglet.window import key
         self[key.symbol_string(symbol)] = False
 
     def __getitem__(self, symbol):
@@ -55,24 +62,89 @@ def main():
     players = []
     for num in range(2):
         players.append(
-            Player(img=resource.image(f'p_{num + 1}.png'), x=level.spawn_points[num].x, y=level.spawn_points[num].y))
+            Player(img=f'p_{num + 1}.png', x=level.spawn_points[num].x, y=level.spawn_points[num].y))
     game_local(window=Settings.global_main_window, level=level, players=players)
 
 
-def game_local(window: Window, level: Level = None, players: [Player] = None):
+_MOVE_RIGHT: int = ActionTable.bit('move_right')
+_MOVE_LEFT: int = ActionTable.bit('move_left')
+
+
+def apply_actions(level: Level, actions: [int]):
+    """
+    Does the actions of every player for one tick, the path driven by keys, replays and AIs.
+        :param level: The game level
+        :param actions: The action bits of every player, see ActionTable.ACTIONS.
+    """
+    for player, bits in zip(level.players, actions):
+        if bits & _MOVE_RIGHT:
+            player.move_right()
+        if bits & _MOVE_LEFT:
+            player.move_left()
+
+
+def update(level: Level, dt: float):
+    """
+    Steps the simulation of a level, shared by the rendered and headless games.
+        :param level: The game level
+        :param dt: Differential time of the step.
+    """
+    with profiler.scope('do_update'):
+        level.do_update(dt=dt)
+
+    with profiler.scope('check_bounds'):
+        for p in level.players:
+            p.check_bounds()
+
+
+def game_headless(level: Level = None, players: [Player] = None, dt: float = None, steps: int = 1,
+                  realtime: bool = False) -> Level:
+    """
+    Function to run the game simulation without a window, OpenGL or any Sprites.
+    Settings must be loaded first, for example with Settings.init(headless=True).
+        :param level: The game level
+        :param players: The players to be calculated in gameplay.
+        :param dt: Simulated time of every step, the tick_rate setting is used if None.
+        :param steps: Number of steps to run.
+        :param realtime: If True the steps are paced to real time, otherwise they run as fast as possible.
+        :return: The simulated level.
+    """
+    if level is None:
+        level: Level = Level()  # Default level
+    if players is not None:
+        for player in players:
+            level.add(player)
+
+    scheduler = FixedStepScheduler(lambda step_dt: update(level, step_dt),
+                                   dt=Settings.compiled().tick_dt if dt is None else dt)
+    scheduler.run(steps, realtime=realtime)
+    return level
+
+
+def game_local(window: Window, level: Level = None, players: [Player] = None, inputs: [InputSource] = None,
+               session: RollbackSession = None):
     """
     Function to run the game in a given window with given parameters.
 
-    key_handler is for compatibility purposes
         :param window: The window for all graphics to be drawn on.
         :param level: The game level
         :param players: The players to be calculated in gameplay.
+        :param inputs: Sources of the actions of the players, for example a PolicyInput for AI players,
+        all players are on the keyboard if None.
+        :param session: A connected RollbackSession, the match is then played against its peer, the local
+        player with the actions of the first player of the inputs, the keyboard bindings of player 1 if None.
+
+    With the threaded_simulation setting the level is stepped on a SimulationThread and drawn from
+    the frames it publishes, so slow frames do not delay the simulation and the other way around.
     """
 
+    import pyglet
+    from pyglet import clock
+    from pyglet.graphics import Batch
+    from pyglet.text import Label
+
     # GAME INSTANCE VARS
     overlay_batch: Batch = Batch()  # The graphics batch of the overlay in this game instance
-    key_handler: {bool} = KeyStateHandler()  # The key listener equivalent for this game
-    window.push_handlers(key_handler)  # Tell it which window to listen to
     if level is None:
         level: Level = Level()  # Default level
     other_labels: [Label] = [
@@ -84,8 +156,20 @@ def game_local(window: Window, level: Level = None, players: [Player] = None):
     if players is not None:
         for player in players:
             level.add(player)
+    level.attach_views()  # Sprites, batch and music of the level
+    if inputs is None:
+        inputs = [KeyboardInput(range(len(level.players)) if session is None else [0])]
+    controls: Controls = Controls(len(level.players) if session is None else 1, inputs)  # action bitfield
+    compiled = Settings.compiled()
+    threaded: bool = compiled.threaded_simulation
+    recorder: SessionRecorder = None  # records the inputs of this session if enabled
+    if compiled.record_sessions and session is None:  # rollbacks would record ticks again
+        recorder = SessionRecorder(
+            Settings.global_recording_path.joinpath(f'{datetime.now():%Y-%m-%d_%H-%M-%S}.rec'), level,
+            dt=compiled.tick_dt)
 
     # loading of all health text to display onscreen
+    health_labels: [Label] = []  # with a simulation thread the labels are updated by on_draw from the frames
     for i in range(len(level.players)):
         temp_label = Label('N/A', font_name='Calibri', font_size=24, bold=True, anchor_y='top', batch=overlay_batch)
         if i % 2 is 0:
@@ -95,7 +179,27 @@ def game_local(window: Window, level: Level = None, players: [Player] = None):
             temp_label.x = window.width
             temp_label.y = window.height - (temp_label.content_height * (i // 2))
         temp_label.text = str(level.players[i].starting_health)
-        level.players[i].health_label = temp_label
+        health_labels.append(temp_label)
+        if not threaded:
+            level.players[i].health_label = temp_label
+    shown_health: [int] = [player.starting_health for player in level.players]
+
+    overlay: ProfilerOverlay = None  # timings of the profiled scopes, shown if profiling is enabled
+    if compiled.profiling:
+        profiler.enable()
+        overlay = ProfilerOverlay(overlay_batch, x=10, y=10)
+        clock.schedule_interval(overlay.refresh, 0.5)
+
+    sim_rate: RateCounter = RateCounter()  # simulation steps per second
+    render_rate: RateCounter = RateCounter()  # frames drawn per second
+    if compiled.profiling or threaded:
+        rate_label = Label('', font_name='Courier New', font_size=12, anchor_x='right', anchor_y='bottom',
+                           x=window.width - 10, y=10, batch=overlay_batch, color=(255, 255, 0, 255))
+
+        def refresh_rates(dt):
+            rate_label.text = f'sim {sim_rate.sample():6.1f} Hz  render {render_rate.sample():6.1f} fps'
+
+        clock.schedule_interval(refresh_rates, 0.5)
 
     # ----------------------------------- #
 
@@ -105,9 +209,33 @@ def game_local(window: Window, level: Level = None, players: [Player] = None):
         Draws all objects to the screen.
         Called every render.
         """
-        window.clear()
-        level.draw()
-        overlay_batch.draw()
+        with profiler.scope('on_draw'):
+            window.clear()
+            with profiler.scope('level.draw'):
+                if simulation is None:
+                    level.draw(alpha=scheduler.alpha)
+                else:
+                    draw_frame()
+            with profiler.scope('overlay_batch.draw'):
+                overlay_batch.draw()
+        render_rate.tick()
+
+    def draw_frame():
+        """
+        Draws the latest frame of the simulation thread and shows the health in it.
+        """
+        if simulation.error is not None:
+            raise simulation.error
+        frame = frames.latest()
+        if frame is None:  # nothing simulated yet, the level is as it was set up
+            with simulation.lock:
+                level.draw()
+            return
+        for k, health in enumerate(frame.health):
+            if health != shown_health[k]:
+                level.players[k].show_health(health_labels[k], health)
+                shown_health[k] = health
+        level.draw(alpha=frame.alpha(), frame=frame)
 
     @window.event
     def on_activate():
@@ -124,38 +252,58 @@ def game_local(window: Window, level: Level = None, players: [Player] = None):
         Called when user closes window.
         """
         Settings.save()
+        if simulation is not None:
+            simulation.stop()
+        if recorder is not None:
+            recorder.close()
+        if overlay is not None:
+            profiler.export_chrome_trace(
+                Settings.global_profile_path.joinpath(f'{datetime.now():%Y-%m-%d_%H-%M-%S}.json'))
 
     def on_update(dt):
         """
-        Updates game with every "clock" tick.
+        Updates game with every fixed simulation step.
 
-            :param dt: Differential time between clock ticks.
+            :param dt: The fixed timestep.
         """
 
-        handle_keys()
-        level.do_update(dt=dt)
-
-        for p in level.players:
-            p.check_bounds()
+        if session is not None:
+            with profiler.scope('netplay'):
+                session.advance(controls.poll()[0])
+        else:
+            with profiler.scope('handle_keys'):
+                handle_keys()
+            update(level, dt)
+        sim_rate.tick()
+
+    scheduler: FixedStepScheduler = None  # steps on_update from the clock of pyglet
+    simulation: SimulationThread = None  # or steps it on its own thread
+    frames: FrameBuffer = FrameBuffer()  # the state the simulation thread publishes for on_draw
+    if threaded:
+        simulation = SimulationThread(on_update, lambda tick, time: level.publish(frames, tick, time, compiled.tick_dt),
+                                      dt=compiled.tick_dt, max_steps=compiled.max_frame_steps)
+    else:
+        scheduler = FixedStepScheduler(on_update, dt=compiled.tick_dt, max_steps=compiled.max_frame_steps)
 
     def handle_keys():
         """
-        Reads all key inputs from the key handler and
-        does the action corresponding with said key.
+        Reads the actions of all players from their input sources and
+        does them.
         """
-        # TODO: Make all control calls correspond to changes in player
-
-        for k in range(len(level.players)):
-            controlled_player = level.players[k]
-            if key_handler[Settings.settings[f'move_right_{k + 1}']]:
-                if controlled_player.dx.x < controlled_player.speed:
-                    controlled_player.apply_force(Vector2D(controlled_player.speed, 0))
-            if key_handler[Settings.settings[f'move_left_{k + 1}']]:
-                if controlled_player.dx.x > -controlled_player.speed:
-                    controlled_player.apply_force(Vector2D(-controlled_player.speed, 0))
-
+        actions = controls.poll()
+        if recorder is not None:
+            for k, bits in enumerate(actions):
+                recorder.record(k, bits)
+        apply_actions(level, actions)
+
+    for source in inputs:  # pushed after the @window.event handlers, which replace handlers of the top frame
+        if isinstance(source, KeyboardInput):
+            window.push_handlers(source)  # Tell it which window to listen to
     window.set_visible(True)  # make the window visible
-    clock.schedule(on_update)  # calls the update function every clock tick
+    if simulation is None:
+        clock.schedule(scheduler.advance)  # runs the fixed simulation steps that fit into every clock tick
+    else:
+        simulation.start()
     if level.music is not None:
         level.music.play()  # background music
     pyglet.app.run()  # inits pyglet and OpenGL
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+
+from game.settings import Settings
+
+
+class ActionTable(object):
+    """
+    Key bindings of the settings compiled into integer indexed actions.
+
+    Every action of a player is one bit of an int, bit i stands for ACTIONS[i]. Each
+    player's bindings are the settings named '<action>_<player number>'. The key
+    symbols are resolved once, so key events cost one dict lookup and nothing is
+    looked up per frame.
+    """
+
+    # order is part of the recording format, new actions are appended
+    ACTIONS: (str,) = ('move_left', 'move_right', 'jump', 'fast_fall', 'fire_right', 'fire_left', 'dodge')
+
+    def __init__(self, num_players: int = 2, settings: {str} = None):
+        """
+        Compiles the bindings of a number of players.
+            :param num_players: Number of players to compile bindings for.
+            :param settings: The settings to read the bindings from, Settings.settings if None.
+        """
+        settings = Settings.settings if settings is None else settings
+        self.num_players: int = num_players
+        self.bindings: {str: [(int, int)]} = {}  # key name to the (player, bit) it controls
+        for player in range(num_players):
+            for i, action in enumerate(self.ACTIONS):
+                name = settings.get(f'{action}_{player + 1}')
+                if name is not None:
+                    self.bindings.setdefault(name.upper(), []).append((player, 1 << i))
+        self._symbols: {int: [(int, int)]} = None
+
+    @staticmethod
+    def bit(action: str) -> int:
+        """
+        The bit of an action.
+            :param action: Name of the action, one of ACTIONS.
+        """
+        return 1 << ActionTable.ACTIONS.index(action)
+
+    @staticmethod
+    def bits(*actions: str) -> int:
+        """
+        The combined bits of the given actions.
+        """
+        bits = 0
+        for action in actions:
+            bits |= ActionTable.bit(action)
+        return bits
+
+    def symbols(self) -> {int: [(int, int)]}:
+        """
+        The bindings by pyglet key symbol, resolved the first time they are needed.
+            :return: Dict of key symbol to the (player, bit) it controls.
+            :raise ValueError: If a binding is not a pyglet key name.
+        """
+        if self._symbols is None:
+            from pyglet.window import key
+
+            symbols = {}
+            for name, controls in self.bindings.items():
+                symbol = getattr(key, name, None)
+                if not isinstance(symbol, int):
+                    raise ValueError(f"'{name}' is bound to an action but is not a key")
+                symbols.setdefault(symbol, []).extend(controls)
+            self._symbols = symbols
+        return self._symbols
+
+
+class InputSource(ABC):
+    """
+    Something that decides the actions of some players every tick, see Controls.
+    """
+
+    def __init__(self, players: [int]):
+        """
+        Creates a new InputSource.
+            :param players: Indexes of the players it controls.
+        """
+        self.players: [int] = list(players)
+
+    @abstractmethod
+    def write(self, actions: [int]):
+        """
+        Sets the action bits of the controlled players for the running tick.
+            :param actions: The action bitfield of all players.
+        """
+
+
+class KeyboardInput(InputSource):
+    """
+    Human players on the keyboard, a pyglet event handler for the window.
+
+    Key events set and clear bits of the held actions, write only copies them.
+    """
+
+    def __init__(self, players: [int], table: ActionTable = None):
+        """
+        Creates a new KeyboardInput, it has to be pushed to the handlers of a window.
+            :param players: Indexes of the players on this keyboard.
+            :param table: The compiled bindings, compiled from the settings if None.
+        """
+        super(KeyboardInput, self).__init__(players)
+        self.table: ActionTable = ActionTable(max(self.players, default=-1) + 1) if table is None else table
+        self._symbols: {int: [(int, int)]} = {symbol: [(player, bit) for player, bit in controls
+                                                       if player in self.players]
+                                              for symbol, controls in self.table.symbols().items()}
+        self.held: [int] = [0] * self.table.num_players  # bits of the held keys of every player
+
+    def on_key_press(self, symbol, modifiers):
+        for player, bit in self._symbols.get(symbol, ()):
+            self.held[player] |= bit
+
+    def on_key_release(self, symbol, modifiers):
+        for player, bit in self._symbols.get(symbol, ()):
+            self.held[player] &= ~bit
+
+    def on_deactivate(self):
+        self.held = [0] * len(self.held)  # key releases are missed while the window is not active
+
+    def write(self, actions: [int]):
+        for player in self.players:
+            actions[player] = self.held[player]
+
+
+class ReplayInput(InputSource):
+    """
+    Players driven by recorded action bits, one row per tick.
+    """
+
+    def __init__(self, actions: [[int]], players: [int] = None):
+        """
+        Creates a new ReplayInput.
+            :param actions: Action bits of every tick, one column per player, for example Recording.actions.
+            :param players: Indexes of the replayed players, all columns if None.
+        """
+        rows = actions.tolist() if hasattr(actions, 'tolist') else [list(row) for row in actions]
+        super(ReplayInput, self).__init__(range(len(rows[0])) if players is None and rows else players or [])
+        self.rows: [[int]] = rows
+        self.tick: int = 0  # next row to write
+
+    @property
+    def done(self) -> bool:
+        return self.tick >= len(self.rows)
+
+    def write(self, actions: [int]):
+        if self.tick < len(self.rows):
+            row = self.rows[self.tick]
+            for player in self.players:
+                actions[player] = row[player]
+        self.tick += 1
+
+
+class PolicyInput(InputSource):
+    """
+    Players driven by a function, for example an AI policy.
+    """
+
+    def __init__(self, policy: (), players: [int]):
+        """
+        Creates a new PolicyInput.
+            :param policy: Function (players) -> action bits of each given player, called every tick.
+            :param players: Indexes of the players it controls.
+        """
+        super(PolicyInput, self).__init__(players)
+        self.policy: () = policy
+
+    def write(self, actions: [int]):
+        for player, bits in zip(self.players, self.policy(self.players)):
+            actions[player] = int(bits)
+
+
+class Controls(object):
+    """
+    The action bitfield of all players in a game, written by its input sources every tick.
+
+    Humans, replays and AIs can be mixed, each source controls its own players and
+    the simulation reads actions through core.apply_actions.
+    """
+
+    def __init__(self, num_players: int, sources: [InputSource] = ()):
+        """
+        Creates a new Controls.
+            :param num_players: Number of players.
+            :param sources: The input sources, later sources win for players controlled twice.
+        """
+        self.actions: [int] = [0] * num_players  # action bits of every player in the running tick
+        self.sources: [InputSource] = list(sources)
+
+    def poll(self) -> [int]:
+        """
+        Lets every source write the actions of the running tick, players without a source do nothing.
+            :return: The action bitfield.
+        """
+        actions = self.actions
+        for i in range(len(actions)):
+            actions[i] = 0
+        for source in self.sources:
+            source.write(actions)
+        return actions
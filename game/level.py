@@ -1,23 +1,37 @@
 from __future__ import annotations
 
-from pyglet import media, resource
-from pyglet.graphics import Batch
-from pyglet.image import TextureRegion
-from pyglet.sprite import Sprite
-from pyglet.text import Label
+import zlib
+from typing import TYPE_CHECKING
 
+import numpy as np
+
+from game.assets import assets
+from game.collision import BroadPhase, NarrowPhase
+from game.physics import PhysicsWorld
 from game.settings import Settings
-from game.utility import Dimension, Rectangle, Vector2D, GeneralUtil
+from game.simulation import Frame, FrameBuffer
+from game.utility import Dimension, Rectangle, Vector2D, Vector2DArray
+
+if TYPE_CHECKING:  # view layer only, importing these needs a display
+    from pyglet import media
+    from pyglet.graphics import Batch
+    from pyglet.image import TextureRegion
+    from pyglet.sprite import Sprite
+    from pyglet.text import Label
 
 
-class Collidable2D(Sprite):
+class Collidable2D(object):
     """
     Game element that has the ability to detect collision with others of its type.
+
+    Only plain simulation state is held here, the Sprite that draws the element
+    is an optional view that is created by attach_view when the game is rendered.
     """
 
     def __init__(self, does_collide: bool = True, hitbox_type: str = 'image',
-                 img: TextureRegion = None, scaled: bool = True,
-                 hitbox_coordinates: [Vector2D] = None, hitbox_dimension: Dimension = None, *args, **kwargs):
+                 img: TextureRegion | str = None, scaled: bool = True,
+                 hitbox_coordinates: [Vector2D] = None, hitbox_dimension: Dimension = None,
+                 x: float = 0, y: float = 0, width: float = None, height: float = None, **view_kwargs):
         """
         Creates a new Collidable2D object.
             :param hitbox_type: The type of hitbox to process:
@@ -39,46 +53,129 @@ class Collidable2D(Sprite):
 
             :param hitbox_dimension: A tuple containing the (width, height) of the hitbox rectangle
             This is only used when the hitbox_type is 'rectangle'.
-            :param img: Image or animation to display.
+            :param img: Image or animation to display, or the resource name of one.
+            :param x: Horizontal position of the center of the object.
+            :param y: Vertical position of the center of the object.
+            :param width: Width of the object, taken from img when not given.
+            :param height: Height of the object, taken from img when not given.
+            :param view_kwargs: Extra arguments for the Sprite made by attach_view.
         """
 
-        if scaled:
-            img.width *= 1920 / int(Settings.settings['window_resolution'].split('x')[0])
-            img.height *= 1080 / int(Settings.settings['window_resolution'].split('x')[1])
-
-        img.anchor_x = img.width / 2
-        img.anchor_y = img.height / 2
+        if (width is None or height is None) and isinstance(img, str):
+            size = Settings.manifest().image_size(img)  # read from the file, without loading the image
+            if size is None:
+                img = Settings.pyglet_resource().image(img)
+            else:
+                width = size[0] if width is None else width
+                height = size[1] if height is None else height
+        if (width is None or height is None) and img is not None:
+            if width is None:
+                width = img.width if img.width != 0 else img.get_texture(True).width
+            if height is None:
+                height = img.height if img.height != 0 else img.get_texture(True).height
 
-        super(Collidable2D, self).__init__(img=img, *args, **kwargs)
+        if scaled:
+            compiled = Settings.compiled()
+            width *= compiled.scale_x
+            height *= compiled.scale_y
+
+        self.x: float = x
+        self.y: float = y
+        self.width: float = width
+        self.height: float = height
+        self.img: TextureRegion | str = img
+        self.sprite: Sprite = None  # view, only exists while rendering
+        self._view_kwargs: {} = view_kwargs
         self._hitbox_type: str = hitbox_type
         self.does_collide: bool = does_collide
 
+        self._hitbox: Rectangle | [Vector2D] = None
         if hitbox_type is None or hitbox_type.lower() == 'none':
             pass
         elif hitbox_type.lower() == 'image':
-            if img.width and img.height != 0:
-                self._hitbox = Rectangle(img.width, img.height)
-            else:
-                self._hitbox = Rectangle(img.get_texture(True).width, img.get_texture(True).height)
+            self._hitbox = Rectangle(width, height)
         elif hitbox_type.lower() == 'rectangle':
             self._hitbox = Rectangle(hitbox_dimension.width, hitbox_dimension.height)
         elif hitbox_type.lower() == 'abstract':
             self._hitbox = hitbox_coordinates
+        self.is_polygon: bool = hitbox_type is not None and hitbox_type.lower() == 'abstract'
+
+        self._local_vertices: np.ndarray = None  # hitbox vertices relative to the position
+        if isinstance(self._hitbox, Rectangle):
+            left, bottom, right, top = self.local_bounds
+            self._local_vertices = np.array([(left, bottom), (right, bottom), (right, top), (left, top)])
+        elif self._hitbox:
+            self._local_vertices = np.array([(coordinate.x, coordinate.y) for coordinate in self._hitbox], dtype=float)
+        self._vertices: np.ndarray = None  # cached world_vertices
+        self._vertices_position: (float, float) = None  # position the cached vertices were computed at
+
+    @property
+    def body_type(self) -> str:
+        """
+        'static' for objects that never move, PhysicalObjects are 'dynamic' or 'kinematic'.
+        """
+        return 'static'
+
+    @property
+    def position(self):
+        return self.x, self.y
+
+    @position.setter
+    def position(self, position: (float, float)):
+        self.x, self.y = position
+
+    @property
+    def local_bounds(self) -> (float, float, float, float):
+        """
+        The axis aligned bounding box of the hitbox, relative to the position of the object.
+            :return: The box as (min_x, min_y, max_x, max_y), or None without a hitbox.
+        """
+        if isinstance(self._hitbox, Rectangle):
+            half_width = self._hitbox.width / 2
+            half_height = self._hitbox.height / 2
+            return -half_width, -half_height, half_width, half_height
+        elif self._hitbox:
+            xs = [coordinate.x for coordinate in self._hitbox]
+            ys = [coordinate.y for coordinate in self._hitbox]
+            return min(xs), min(ys), max(xs), max(ys)
+        return None
+
+    @property
+    def aabb(self) -> (float, float, float, float):
+        """
+        The axis aligned bounding box of the hitbox in the gamespace.
+            :return: The box as (min_x, min_y, max_x, max_y), or None without a hitbox.
+        """
+        local = self.local_bounds
+        if local is None:
+            return None
+        x, y = self.x, self.y
+        return local[0] + x, local[1] + y, local[2] + x, local[3] + y
+
+    @property
+    def world_vertices(self) -> np.ndarray:
+        """
+        The vertices of the hitbox in the gamespace, only recomputed after the object moved.
+            :return: (n, 2) array of the vertices, or None without a hitbox.
+        """
+        if self._local_vertices is None:
+            return None
+        position = (self.x, self.y)
+        if position != self._vertices_position:
+            self._vertices = self._local_vertices + position
+            self._vertices_position = position
+        return self._vertices
 
     @property
-    def absolute_coordinates(self):
+    def absolute_coordinates(self) -> [Vector2D]:
         """
         Returns the absolute coordinates of the hitbox shape
-        :return:
+        :return: The vertices of the hitbox, an empty list without a hitbox.
         """
-        if self._hitbox_type is not None and self._hitbox_type.lower != "none" or "circle":
-            coordinates = []
-            for coordinate in self._hitbox.coordinates:
-                abs_coord = Vector2D
-                abs_coord.x = coordinate.x + self.x
-                abs_coord.y = coordinate.x + self.y
-                coordinates.append(coordinate)
-            return coordinates
+        vertices = self.world_vertices
+        if vertices is None:
+            return []
+        return [Vector2D(vertex) for vertex in vertices.tolist()]
 
     def is_colliding(self, other: Collidable2D) -> bool:
         """
@@ -87,44 +184,191 @@ class Collidable2D(Sprite):
         :return: Boolean value of collision.
         """
 
-        if not self.does_collide or self._hitbox_type is None or self._hitbox_type.lower() == 'none':
+        if not self.does_collide or self._hitbox is None or not other.does_collide or other._hitbox is None:
             return False
 
-        return False
+        hit, _, _ = NarrowPhase.collide([(self, other)], np.array([self.aabb]), np.array([other.aabb]))
+        return bool(hit[0])
+
+    # -------------- VIEW -------------- #
 
-        # if self.hitbox_type.lower() == 'image' or self.hitbox_type.lower() == 'rectangle':
-        #   return False
+    def attach_view(self, batch: Batch = None):
+        """
+        Creates the Sprite that draws this object. Needs a display.
+            :param batch: The graphics batch to draw the Sprite in.
+        """
+        if self.sprite is not None or self.img is None:
+            return
+
+        from pyglet.sprite import Sprite
+
+        img = assets.scaled(self.img, self.width, self.height)  # shared and cached, self.img is not changed
+        self.sprite = Sprite(img=img, x=self.x, y=self.y, batch=batch, **self._view_kwargs)
+
+    def sync_view(self, x: float = None, y: float = None):
+        """
+        Moves the Sprite to the simulated position, or to an interpolated one.
+            :param x: Horizontal position to draw at, the simulated one if None.
+            :param y: Vertical position to draw at, the simulated one if None.
+        """
+        if self.sprite is not None:
+            self.sprite.update(x=self.x if x is None else x, y=self.y if y is None else y)
 
-        # if self._hitbox_type.lower() == 'abstract':
-        #   return False
+    def detach_view(self):
+        """
+        Deletes the Sprite of this object, the simulation state is kept.
+        """
+        if self.sprite is not None:
+            self.sprite.delete()
+            self.sprite = None
 
 
 class PhysicalObject(Collidable2D):
     """
     Game element that has the ability to obey game physics.
+
+    While the object is part of a PhysicsWorld its position, velocity and mass
+    are stored in the rows of the world's arrays instead of on the object.
+
+    A 'dynamic' object falls and is pushed by collisions, a 'kinematic' one only moves
+    by its velocity and pushes dynamic objects out of its way, like a moving platform.
+    Objects that rest for a while fall asleep, changing their state wakes them again.
     """
     _base_mass: float = 1  # measured in standard masses
+    BODY_TYPES: (str,) = ('dynamic', 'kinematic')
 
-    def __init__(self, does_update=True, mass_mult=1, *args, **kwargs):
+    def __init__(self, does_update=True, mass_mult=1, *args, body_type: str = 'dynamic', **kwargs):
         """
         Creates a new PhysicalObject object.
         :param does_update: If the physics update is run on this object.
         :param mass_mult: Multiplier for the mass of the object.
+        :param body_type: 'dynamic' or 'kinematic'.
         :param img: Image or animation to display.
         """
+        if body_type not in self.BODY_TYPES:
+            raise ValueError(f"body_type must be one of {list(self.BODY_TYPES)}, not '{body_type}'")
+        self._world: PhysicsWorld = None  # world the state is stored in
+        self._index: int = -1  # row of this object in the world
+        self._pos: np.ndarray = np.zeros(2)  # own state, or a view of the world row
+        self._vel: np.ndarray = np.zeros(2)
+        self._mass: float = self._base_mass * mass_mult
+        self._does_update: bool = does_update  # if the do_update function runs
+        self._body_type: str = body_type
+
         super(PhysicalObject, self).__init__(*args, **kwargs)
 
-        self.does_update: bool = does_update  # if the do_update function runs
-        self.mass: float = self._base_mass * mass_mult
-        self.dx: Vector2D = Vector2D()  # velocity
+    # -------------- STATE -------------- #
+
+    def bind(self, world: PhysicsWorld, index: int):
+        """
+        Makes the state of this object a view of a row of a PhysicsWorld.
+        Called by the world, the state must already be copied into the row.
+            :param world: The world storing the state.
+            :param index: The row of this object.
+        """
+        self._world = world
+        self._index = index
+        self._pos = world.pos[index]
+        self._vel = world.vel[index]
+
+    def unbind(self):
+        """
+        Copies the state of this object out of its PhysicsWorld.
+        """
+        self._world = None
+        self._index = -1
+        self._pos = self._pos.copy()
+        self._vel = self._vel.copy()
+
+    @property
+    def x(self):
+        return self._pos.item(0)
+
+    @x.setter
+    def x(self, x: float):
+        self._pos[0] = x
+        self.wake()
+
+    @property
+    def y(self):
+        return self._pos.item(1)
+
+    @y.setter
+    def y(self, y: float):
+        self._pos[1] = y
+        self.wake()
+
+    @property
+    def dx(self) -> Vector2D:
+        """
+        The velocity of the object, a copy that has to be assigned back when changed.
+        """
+        return Vector2D(self._vel.tolist())
+
+    @dx.setter
+    def dx(self, dx: Vector2D):
+        self._vel[0] = dx.x
+        self._vel[1] = dx.y
+        self.wake()
+
+    @property
+    def mass(self):
+        return self._mass
+
+    @mass.setter
+    def mass(self, mass: float):
+        self._mass = mass
+        if self._world is not None:
+            self._world.inv_mass[self._index] = 1 / mass
+
+    @property
+    def does_update(self):
+        return self._does_update
+
+    @does_update.setter
+    def does_update(self, does_update: bool):
+        self._does_update = does_update
+        if self._world is not None:
+            self._world.updates[self._index] = does_update
+            self.wake()
+
+    @property
+    def body_type(self) -> str:
+        return self._body_type
+
+    @body_type.setter
+    def body_type(self, body_type: str):
+        if body_type not in self.BODY_TYPES:
+            raise ValueError(f"body_type must be one of {list(self.BODY_TYPES)}, not '{body_type}'")
+        self._body_type = body_type
+        world = self._world
+        if world is not None:
+            kinematic = body_type == 'kinematic'
+            world.kinematic_count += int(kinematic) - int(world.kinematic[self._index])
+            world.kinematic[self._index] = kinematic
+            self.wake()
+
+    @property
+    def sleeping(self) -> bool:
+        return self._world is not None and bool(self._world.sleeping[self._index])
+
+    def wake(self):
+        """
+        Wakes the object if it is sleeping in its PhysicsWorld, and restarts its count of resting steps.
+        """
+        if self._world is not None:
+            self._world.wake(self._index)
+
+    # ----------------------------------- #
 
     def do_update(self, dt):
-        if self.does_update:
-            self.x += self.dx.x * dt
-            self.y += self.dx.y * dt
+        if self._does_update:
+            self._pos += self._vel * dt
 
     def apply_force(self, force: Vector2D):
-        self.dx += force / self.mass
+        self._vel[0] += force.x / self._mass
+        self._vel[1] += force.y / self._mass
+        self.wake()
 
 
 class Player(PhysicalObject):
@@ -136,19 +380,18 @@ class Player(PhysicalObject):
     # Player Class Attributes
     _base_health: int = 100  # no units
     _base_armor: int = 10  # this is the % dmg blocked (max 100
-    _base_speed: () = lambda: 600 / 1080 * int(
-        Settings.settings['window_resolution'].split('x')[1])  # measured in pixels/second
+    _base_speed: () = lambda: Settings.compiled().player_speed  # measured in pixels/second
 
-    standard_width: () = lambda: 80 / 1920 * int(Settings.settings['window_resolution'].split('x')[0])
-    standard_height: () = lambda: 80 / 1080 * int(Settings.settings['window_resolution'].split('x')[1])
+    standard_width: () = lambda: Settings.compiled().player_width
+    standard_height: () = lambda: Settings.compiled().player_height
 
-    min_x: () = lambda: -Player.standard_width()
-    min_y: () = lambda: -Player.standard_height()
-    max_x: () = lambda: int(Settings.settings['window_resolution'].split('x')[0]) + Player.standard_width()
-    max_y: () = lambda: int(Settings.settings['window_resolution'].split('x')[1]) + Player.standard_height()
+    min_x: () = lambda: Settings.compiled().min_x
+    min_y: () = lambda: Settings.compiled().min_y
+    max_x: () = lambda: Settings.compiled().max_x
+    max_y: () = lambda: Settings.compiled().max_y
 
-    def __init__(self, health_mult: float = 1, armor_mult: float = 1, speed_mult: float = 1, img: TextureRegion = None,
-                 *args, **kwargs):
+    def __init__(self, health_mult: float = 1, armor_mult: float = 1, speed_mult: float = 1,
+                 img: TextureRegion | str = None, *args, **kwargs):
         """
         Creates a new Player object.
 
@@ -157,16 +400,14 @@ class Player(PhysicalObject):
             :param speed_mult: Multiplier for speed.
             :param img: Image or animation to display.
         """
-        img.width = Player.standard_width()
-        img.height = Player.standard_height()
-
-        super(Player, self).__init__(img=img, scaled=False, *args, **kwargs)
+        super(Player, self).__init__(img=img, scaled=False, width=Player.standard_width(),
+                                     height=Player.standard_height(), *args, **kwargs)
 
         self.starting_health: int = int(self._base_health * health_mult)
         self._health: int = self.starting_health
         self._armor: int = int(self._base_armor * armor_mult)
         self.speed: int = int(Player._base_speed() * speed_mult)
-        self.health_label: Label = Label()
+        self.health_label: Label = None  # view, assigned by the game when rendering
         self.health_processed: bool = True
 
     @property
@@ -187,47 +428,130 @@ class Player(PhysicalObject):
 
     def do_update(self, dt):
         super(Player, self).do_update(dt=dt)
+        self.process_health()
+
+    def process_health(self):
+        """
+        Shows changes of health on the health label.
+        """
         if not self.health_processed:
-            self.health_label.text = str(self.health)
-            color_scalar = self.starting_health / self.health
-            self.health_label.color = (255, int(255 * color_scalar), int(255 * color_scalar), 255)
+            if self.health_label is not None:
+                self.show_health(self.health_label, self.health)
             self.health_processed = True
 
+    def show_health(self, label: Label, health: int):
+        """
+        Shows an amount of health of this player on a label.
+            :param label: The label, owned by the thread drawing the game.
+            :param health: The health to show.
+        """
+        label.text = str(health)
+        color_scalar = self.starting_health / health
+        label.color = (255, int(255 * color_scalar), int(255 * color_scalar), 255)
+
+    def move_right(self):
+        """
+        Accelerates the player to the right, up to its speed.
+        """
+        if self.dx.x < self.speed:
+            self.apply_force(Vector2D(self.speed, 0))
+
+    def move_left(self):
+        """
+        Accelerates the player to the left, up to its speed.
+        """
+        if self.dx.x > -self.speed:
+            self.apply_force(Vector2D(-self.speed, 0))
+
     def check_bounds(self):
-        if self.x < Player.min_x():
-            self.x = Player.max_x()
-        if self.x > Player.max_x():
-            self.x = Player.min_x()
-        if self.y < Player.min_y():
-            self.y = Player.max_y()
+        bounds = Settings.compiled()
+        x = self.x
+        if x < bounds.min_x:
+            self.x = bounds.max_x
+        if x > bounds.max_x:
+            self.x = bounds.min_x
+        if self.y < bounds.min_y:
+            self.y = bounds.max_y
+
+
+class LevelSnapshot(object):
+    """
+    Array backed copy of the simulation state of a Level, see Level.snapshot.
+
+    Holds the rows of the PhysicsWorld, including which bodies sleep, and the health state
+    of the players, no Sprites or other objects, so it is cheap to take and to restore many times.
+    """
+
+    __slots__ = ('bodies', 'woken', 'pos', 'prev_pos', 'vel', 'force', 'sleeping', 'still_ticks', 'health', 'armor',
+                 'health_processed')
+
+    def __init__(self, level: Level):
+        """
+        Copies the state of a level.
+            :param level: The level to copy.
+        """
+        world = level.world
+        count = world.count
+        self.bodies: (PhysicalObject,) = tuple(world.bodies)  # the bodies the rows belong to
+        self.woken: (PhysicalObject,) = tuple(world.woken)
+        self.pos: np.ndarray = world.pos[:count].copy()
+        self.prev_pos: np.ndarray = world.prev_pos[:count].copy()
+        self.vel: np.ndarray = world.vel[:count].copy()
+        self.force: np.ndarray = world.force[:count].copy()
+        self.sleeping: np.ndarray = world.sleeping[:count].copy()
+        self.still_ticks: np.ndarray = world.still_ticks[:count].copy()
+        self.health: np.ndarray = np.array([p._health for p in level.players], dtype=np.int64)
+        self.armor: np.ndarray = np.array([p._armor for p in level.players], dtype=np.int64)
+        self.health_processed: np.ndarray = np.array([p.health_processed for p in level.players], dtype=bool)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__[2:])
+
+    def checksum(self) -> int:
+        """
+        CRC32 of the positions, velocities and health, equal for the same state, to find desyncs between peers.
+        """
+        crc = 0
+        for name in ('pos', 'vel', 'health', 'armor'):
+            crc = zlib.crc32(getattr(self, name).tobytes(), crc)
+        return crc
 
 
 class Level(object):
     """
     Container Class for a set of Level elements.
+
+    A Level simulates without a window, the Sprites of its elements are
+    only created once attach_views is called by the rendering game.
     """
 
-    def __init__(self, background: Sprite = None, objects: [Collidable2D] = None, music: media.Source = None,
+    def __init__(self, background: Sprite = None, objects: [Collidable2D] = None, music: media.Source | str = None,
                  name: str = None, spawn_points: [Vector2D] = None):
         """
         Creates a new Level.
             :param background: The background Sprite.
             :param objects: All objects in the level.
-            :param music: Sounds to be played in the background while game is running.
+            :param music: Sounds to be played in the background while game is running, or the resource name of them.
             :param name: Name to be displayed for the level
             :param spawn_points: Places for players to spawn into the level
         """
-        self._batch: Batch = Batch()
+        self._batch: Batch = None  # created by attach_views
         self.background: Sprite = background
         self.collidables: [Collidable2D] = []
-        self.physical_objects: [PhysicalObject] = []
+        self.physical_objects: [PhysicalObject] = []  # in the same order as the rows of world
+        compiled = Settings.compiled()
+        self.world: PhysicsWorld = PhysicsWorld(sleep_ticks=compiled.sleep_ticks,  # physics state of the bodies
+                                                sleep_velocity=compiled.sleep_velocity)
+        self.broad_phase: BroadPhase = BroadPhase(cell_size=Player.standard_height() * 2)
+        self.update_hooks: [(Level,)] = []  # called with the level after every do_update
         self.players: [Player] = []
         if objects is not None:
-            self.collidables.append(*objects)
+            self.collidables.extend(objects)
         if music is None:
-            self.music: media.Source = resource.media('Fluffing a Duck.wav')
+            self.music: media.Source | str = 'Fluffing a Duck.wav'
         else:
-            self.music: media.Source = music
+            self.music: media.Source | str = music
         if name is None:
             self.name: str = 'Default Level'
         else:
@@ -237,41 +561,45 @@ class Level(object):
             self.spawn_points = spawn_points
             self.max_players = len(spawn_points)
         else:
-            self.spawn_points = [Vector2D(Settings.global_main_window.width // 5, 100),
-                                 Vector2D(Settings.global_main_window.width * 4 // 5, 100)]
+            width = Settings.compiled().width
+            self.spawn_points = [Vector2D(width // 5, 100), Vector2D(width * 4 // 5, 100)]
             self.max_players = 2
 
-        # ADDING BATCHES AND SORTING OBJECTS #
-        if background is not None:
-            background.batch = self._batch
+        # SORTING OBJECTS #
         if objects is not None:
             for obj in objects:
-                obj.batch = self._batch
+                self.broad_phase.add(obj, dynamic=isinstance(obj, PhysicalObject))
                 if isinstance(obj, PhysicalObject):
                     self.physical_objects.append(obj)
+                    self.world.add(obj)
                     if isinstance(obj, Player):
                         self.players.append(obj)
 
-    def add(self, sprite: Sprite):
+    def add(self, sprite: Collidable2D | Sprite):
         """
         Adds a Sprite to the level to be calculated in the gamespace.
         :param sprite: The Sprite to be added
         :return: NotImplemented if type is not supported.
         """
         if isinstance(sprite, Collidable2D):
-            sprite.batch = self._batch
+            if self._batch is not None:
+                sprite.attach_view(self._batch)
             self.collidables.append(sprite)
             if isinstance(sprite, PhysicalObject):
                 self.physical_objects.append(sprite)
+                self.world.add(sprite)
+                self.broad_phase.add(sprite, dynamic=True)
                 if isinstance(sprite, Player):
                     self.players.append(sprite)
-        elif isinstance(sprite, Sprite):
+            else:
+                self.broad_phase.add(sprite, dynamic=False)  # indexed once, static objects do not move
+        elif hasattr(sprite, 'batch'):
             sprite.batch = self._batch
             self.background = sprite
         else:
             return NotImplemented
 
-    def remove(self, sprite: Sprite):
+    def remove(self, sprite: Collidable2D | Sprite):
         """
         Remove a Sprite from the gamespace.
         :param sprite: The Sprite to be removed.
@@ -279,50 +607,215 @@ class Level(object):
         """
 
         if isinstance(sprite, Collidable2D):
+            self.wake_touching(sprite.aabb)  # bodies resting on it
             self.collidables.remove(sprite)
+            self.broad_phase.remove(sprite)
             if isinstance(sprite, PhysicalObject):
-                self.physical_objects.remove(sprite)
+                self.world.remove(sprite)
+                self.physical_objects = list(self.world.bodies)
+                self.broad_phase.reindex()
                 if isinstance(sprite, Player):
                     self.players.remove(sprite)
-            sprite.delete()
-        elif isinstance(sprite, Sprite):
+            sprite.detach_view()
+        elif hasattr(sprite, 'delete'):
             if sprite is self.background:
                 self.background = None
                 sprite.delete()
         else:
             return NotImplemented
 
-    def draw(self):
+    @property
+    def positions(self) -> Vector2DArray:
+        """
+        Positions of all physical objects, in the order of physical_objects.
+        The array is a read-only view of the PhysicsWorld, the x and y setters of the objects move them,
+        which also wakes sleeping bodies.
+        """
+        pos = self.world.pos[:self.world.count]
+        pos.flags.writeable = False
+        return Vector2DArray(pos)
+
+    @property
+    def velocities(self) -> Vector2DArray:
+        """
+        Velocities of all physical objects, a read-only view like positions, the dx setters of the objects change them.
+        """
+        vel = self.world.vel[:self.world.count]
+        vel.flags.writeable = False
+        return Vector2DArray(vel)
+
+    def snapshot(self) -> LevelSnapshot:
+        """
+        Copies the simulation state: positions, velocities, queued forces, sleeping bodies, health and armor.
+            :return: The snapshot, it can be restored any number of times.
+        """
+        return LevelSnapshot(self)
+
+    def restore(self, snapshot: LevelSnapshot):
+        """
+        Sets the simulation state back to a snapshot of this level.
+        Elements must not have been added or removed since the snapshot was taken.
+            :param snapshot: A snapshot taken by snapshot.
+            :raise ValueError: If the physical objects of the level changed.
+        """
+        world = self.world
+        count = world.count
+        if len(snapshot.bodies) != count or any(a is not b for a, b in zip(snapshot.bodies, world.bodies)):
+            raise ValueError(f'the snapshot does not match the physical objects of {self.name}')
+
+        world.pos[:count] = snapshot.pos
+        world.prev_pos[:count] = snapshot.prev_pos
+        world.vel[:count] = snapshot.vel
+        world.force[:count] = snapshot.force
+        world.sleeping[:count] = snapshot.sleeping
+        world.still_ticks[:count] = snapshot.still_ticks
+        world.sleeping_count = int(np.count_nonzero(snapshot.sleeping))
+        world.woken = list(snapshot.woken)
+        world._awake = None
+        self.broad_phase.reindex()  # sleeping bodies are not updated, their boxes have to be recomputed
+        for player, health, armor, health_processed in zip(self.players, snapshot.health.tolist(),
+                                                           snapshot.armor.tolist(),
+                                                           snapshot.health_processed.tolist()):
+            player._health = health
+            player._armor = armor
+            player.health_processed = health_processed
+
+    def move(self, obj: Collidable2D, x: float, y: float):
+        """
+        Moves a static collidable and updates the collision index, physical objects can just be moved.
+            :param obj: The object to move.
+            :param x: The new horizontal position.
+            :param y: The new vertical position.
+        """
+        if isinstance(obj, PhysicalObject):
+            obj.x = x
+            obj.y = y
+            return
+        self.wake_touching(obj.aabb)  # bodies resting on it at the old place
+        obj.x = x
+        obj.y = y
+        self.broad_phase.move_static(obj)
+        self.wake_touching(obj.aabb)
+        obj.sync_view()
+
+    @property
+    def awake_bodies(self) -> [PhysicalObject]:
+        """
+        The physical objects that are not sleeping, the ones a step costs time for.
+        """
+        bodies = self.world.bodies
+        return [bodies[row] for row in self.world.awake_rows().tolist()]
+
+    def wake_touching(self, aabb: (float, float, float, float), margin: float = 1):
+        """
+        Wakes the sleeping bodies touching a box, and the ones touching those, and so on.
+            :param aabb: The box as (min_x, min_y, max_x, max_y), nothing is woken if None.
+            :param margin: Distance at which bodies count as touching.
+        """
+        world = self.world
+        if aabb is None or world.sleeping_count == 0:
+            return
+        for body in self.broad_phase.touching(aabb, margin):
+            if world.sleeping[body._index]:
+                world.wake(body._index)
+        self._wake_woken(margin)
+
+    def _wake_woken(self, margin: float = 1):
+        """
+        Wakes the sleeping bodies touching the bodies that were woken since the last step, so a body
+        does not keep floating after the body it rests on was pushed away.
+        """
+        world = self.world
+        while world.woken:
+            woken, world.woken = world.woken, []
+            if world.sleeping_count == 0:
+                continue
+            for body in woken:
+                for other in self.broad_phase.touching(self.broad_phase.box(body), margin):
+                    if world.sleeping[other._index]:
+                        world.wake(other._index)
+
+    def attach_views(self):
+        """
+        Creates the graphics batch and the Sprites of all elements in the level,
+        and loads the music. Only needed when the level is rendered.
+        """
+        if self._batch is not None:
+            return
+
+        from pyglet.graphics import Batch
+
+        self._batch = Batch()
+        assets.preload([obj.img for obj in self.collidables if obj.img is not None])  # one atlas for the batch
+        if self.background is not None:
+            self.background.batch = self._batch
+        for obj in self.collidables:
+            obj.attach_view(self._batch)
+        if isinstance(self.music, str):
+            self.music = Settings.pyglet_resource().media(self.music)
+
+    def draw(self, alpha: float = 1, frame: Frame = None):
+        """
+        Draws the level, physical objects are interpolated between the last two simulation steps.
+            :param alpha: Fraction of the way from the previous to the current step, see FixedStepScheduler.alpha.
+            :param frame: State published by a simulation on another thread, drawn instead of the
+            PhysicsWorld, which that thread may be changing. See publish.
+        """
+        compiled = Settings.compiled()
+        max_jump = (compiled.width / 2, compiled.height / 2)
+        if frame is None:
+            bodies, positions = self.physical_objects, self.world.interpolate(alpha, max_jump=max_jump)
+        else:
+            bodies, positions = frame.bodies, PhysicsWorld.lerp(frame.prev_pos, frame.pos, alpha, max_jump=max_jump)
+        for obj, (x, y) in zip(bodies, positions.tolist()):
+            obj.sync_view(x, y)
         self._batch.draw()
 
+    def publish(self, buffer: FrameBuffer, tick: int, time: float, dt: float):
+        """
+        Copies the positions and the health of the players into a FrameBuffer, for drawing on another thread.
+            :param buffer: The buffer to publish to.
+            :param tick: Steps simulated so far.
+            :param time: perf_counter time the last step is due at.
+            :param dt: Simulated time of a step.
+        """
+        world = self.world
+        count = world.count
+        buffer.publish(tick, time, dt, tuple(world.bodies), world.prev_pos[:count], world.pos[:count],
+                       [p.health for p in self.players])
+
     def do_update(self, dt):
-        for obj in self.physical_objects:
-            obj.apply_force(Settings.constant_g() * dt)
-            collides = False
-            for col_obj in self.collidables:
-                if obj.is_colliding(col_obj):
-                    collides = True
-            if not collides:
-                obj.do_update(dt=dt)
+        world = self.world
+        if world.woken:
+            self._wake_woken()
+        world.step(dt, gravity=Settings.constant_g())
+        self.broad_phase.sweep(world, dt)  # bodies fast enough to skip past static objects stop at them
+
+        # collisions: broad phase candidates of the awake bodies, then exact tests and resolution for all pairs at once
+        self.broad_phase.update(world)
+        pairs, rows_a, rows_b, boxes_a, boxes_b = self.broad_phase.candidates()
+        if pairs:
+            hit, normals, depths = NarrowPhase.collide(pairs, boxes_a, boxes_b)
+            rows_a, rows_b = rows_a[hit], rows_b[hit]
+            world.wake_on_contact(rows_a, rows_b)
+            NarrowPhase.resolve(world, rows_a, rows_b, normals[hit], depths[hit])
+        world.update_sleep(dt, rows_a, rows_b)
+
+        for p in self.players:
+            p.process_health()
+
+        for hook in self.update_hooks:
+            hook(self)
 
 
 class BlockPlace(Level):
+    """
+    One wide platform with a spawn point on each end, built from the block_place level file.
+    """
 
     def __init__(self):
-        main_platforms: [Collidable2D] = [Collidable2D(hitbox_type='image', img=GeneralUtil.load_resized_image(
-            resource.image('default_platform.png'), 1400, 400),
-                                                       x=Settings.global_main_window.width // 2,
-                                                       y=Settings.global_main_window.height // 3)]
-        spawn_points = []
-        for main_platform in main_platforms:
-            main_platform.anchor_x = main_platform.width / 2
-            main_platform.anchor_y = main_platform.height / 2
-            spawn_points.append(Vector2D(
-                main_platform.x - (main_platform.width / 2 - Player.standard_width() / 2),
-                main_platform.y + main_platform.height / 2 + Player.standard_height() / 2))
-            spawn_points.append(
-                Vector2D(main_platform.x + (main_platform.width / 2 - Player.standard_width() / 2),
-                         main_platform.y + main_platform.height / 2 + Player.standard_height() / 2))
-
-        super(BlockPlace, self).__init__(objects=main_platforms, name="Block Place",
-                                         music=resource.media("Fluffing a Duck.wav"), spawn_points=spawn_points)
+        from game.levelfile import levels  # the level files build Levels themselves
+
+        data = levels.data('block_place')
+        super(BlockPlace, self).__init__(**data.level_kwargs())
+        data.add_platforms(self)
@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+from math import floor
+from pathlib import Path
+from random import Random
+
+import numpy as np
+
+from game.collision import SpatialHash
+from game.level import Collidable2D, Level, Player
+from game.settings import Settings
+from game.utility import Dimension, Vector2D
+
+
+class LevelData(object):
+    """
+    Compiled form of a level file, everything needed to build its Level without parsing or measuring.
+
+    Level files are JSON:
+
+        {
+          "name": "Block Place",
+          "music": "Fluffing a Duck.wav",
+          "platforms": [{"img": "default_platform.png", "x": 0.5, "y": 0.25, "width": 1400, "height": 400}],
+          "spawn_points": [{"platform": 0, "edge": "left"}, {"x": 0.8, "y": 0.1}]
+        }
+
+    Positions are fractions of the window, floored to whole pixels. Sizes of platforms are pixels
+    of a 1920x1080 window that are scaled like Collidable2D does, missing sizes are taken from the
+    image. Platforms also take the hitbox_type, hitbox_dimension, hitbox_coordinates and does_collide
+    arguments of Collidable2D. A spawn point is a position, or the left, center or right edge on
+    top of a platform.
+
+    Compiling resolves a level for one window size: positions and sizes, the hitboxes, and the AABB
+    and broad phase cells of every static object with the objects in every cell. The binary form is
+    a HEADER followed by 8 byte aligned sections and is loaded with a single read. Images and music
+    stay resource names, they are only loaded when the level is rendered.
+    """
+
+    MAGIC: bytes = b'AITGLVL\x01'
+    VERSION: int = 1
+    # magic, version, window width and height, objects, vertices, spawn points, cells, cell members,
+    # size of the strings, cell size of the broad phase, modification time of the source file
+    HEADER: struct.Struct = struct.Struct('<8sHHH2x6IdQ')
+    HITBOX_TYPES: (str,) = ('none', 'image', 'rectangle', 'abstract')
+    OBJECT: np.dtype = np.dtype([
+        ('img', '<i4'),  # index into strings, -1 without an image
+        ('hitbox_type', '<i4'),  # index into HITBOX_TYPES
+        ('does_collide', '<i4'),
+        ('indexed', '<i4'),  # if the object is in the broad phase
+        ('vertex_start', '<i4'),  # first row of the polygon of an 'abstract' hitbox in vertices
+        ('vertex_count', '<i4'),
+        ('x', '<f8'),
+        ('y', '<f8'),
+        ('width', '<f8'),
+        ('height', '<f8'),
+        ('hitbox_width', '<f8'),  # size of a 'rectangle' hitbox
+        ('hitbox_height', '<f8'),
+        ('aabb', '<f8', (4,)),
+        ('cell_range', '<i8', (4,)),
+    ])
+    PLATFORM_KEYS: {str} = {'img', 'x', 'y', 'width', 'height', 'does_collide', 'hitbox_type', 'hitbox_dimension',
+                            'hitbox_coordinates'}
+    SPAWN_EDGES: {str: int} = {'left': -1, 'center': 0, 'right': 1}
+
+    def __init__(self, strings: [str], objects: np.ndarray, vertices: np.ndarray, spawn_points: np.ndarray,
+                 cells: np.ndarray, offsets: np.ndarray, members: np.ndarray, width: int, height: int,
+                 cell_size: float, source_mtime: int = 0):
+        """
+        Creates a new LevelData, see compile and read.
+            :param strings: Name and music of the level (empty for the default music), then the image names.
+            :param objects: OBJECT row of every platform.
+            :param vertices: (n, 2) polygons of the 'abstract' hitboxes.
+            :param spawn_points: (n, 2) spawn positions.
+            :param cells: (m, 2) broad phase cells of the indexed objects.
+            :param offsets: (m + 1) start of the members of every cell.
+            :param members: Index of every member among the indexed objects.
+            :param width: Width of the window the level was compiled for.
+            :param height: Height of the window the level was compiled for.
+            :param cell_size: Cell size of the broad phase the cells were computed with.
+            :param source_mtime: Modification time of the JSON file, in nanoseconds.
+        """
+        self.strings: [str] = strings
+        self.name: str = strings[0]
+        self.music: str = strings[1] or None
+        self.objects: np.ndarray = objects
+        self.vertices: np.ndarray = vertices
+        self.spawn_points: np.ndarray = spawn_points
+        self.cells: np.ndarray = cells
+        self.offsets: np.ndarray = offsets
+        self.members: np.ndarray = members
+        self.width: int = width
+        self.height: int = height
+        self.cell_size: float = cell_size
+        self.source_mtime: int = source_mtime
+
+    # -------------- COMPILING -------------- #
+
+    @staticmethod
+    def compile(source: {str}, source_mtime: int = 0) -> LevelData:
+        """
+        Compiles a level for the current window size.
+            :param source: The parsed JSON of the level file.
+            :param source_mtime: Modification time of the file, stored to detect outdated compiled levels.
+            :raise ValueError: If the level is not valid.
+        """
+        compiled = Settings.compiled()
+        width, height = compiled.width, compiled.height
+        strings = [str(source.get('name', 'Default Level')), str(source.get('music') or '')]
+        platforms = [LevelData._platform(platform, width, height) for platform in source.get('platforms', [])]
+
+        objects = np.zeros(len(platforms), dtype=LevelData.OBJECT)
+        vertices = []
+        cell_size = Player.standard_height() * 2  # the cell size of every Level's broad phase
+        grid = SpatialHash(cell_size)
+        indexed = 0
+        for row, platform in zip(objects, platforms):
+            if platform.img is None:
+                row['img'] = -1
+            else:
+                if platform.img not in strings[2:]:
+                    strings.append(platform.img)
+                row['img'] = strings.index(platform.img, 2)
+            hitbox_type = 'none' if platform._hitbox_type is None else platform._hitbox_type.lower()
+            row['hitbox_type'] = LevelData.HITBOX_TYPES.index(hitbox_type)
+            row['does_collide'] = platform.does_collide
+            row['x'], row['y'], row['width'], row['height'] = platform.x, platform.y, platform.width, platform.height
+            if hitbox_type == 'rectangle':
+                row['hitbox_width'], row['hitbox_height'] = platform._hitbox.width, platform._hitbox.height
+            elif hitbox_type == 'abstract':
+                row['vertex_start'], row['vertex_count'] = len(vertices), len(platform._local_vertices)
+                vertices.extend(platform._local_vertices.tolist())
+
+            if platform.local_bounds is not None and platform.does_collide:  # like BroadPhase.add
+                row['indexed'] = True
+                row['aabb'] = platform.aabb
+                row['cell_range'] = grid.cell_range(platform.aabb)
+                grid.insert(indexed, tuple(row['cell_range'].tolist()))
+                indexed += 1
+
+        buckets = grid.buckets()
+        members = [i for _, cell in buckets for i in cell]
+        offsets = np.cumsum([0] + [len(cell) for _, cell in buckets])
+
+        spawn_points = [LevelData._spawn_point(spawn_point, platforms, width, height)
+                        for spawn_point in source.get('spawn_points', [])]
+        return LevelData(strings, objects, np.array(vertices, dtype=np.float64).reshape(-1, 2),
+                         np.array(spawn_points, dtype=np.float64).reshape(-1, 2),
+                         np.array([key for key, _ in buckets], dtype=np.int64).reshape(-1, 2),
+                         offsets.astype(np.int64), np.array(members, dtype=np.int64), width, height, cell_size,
+                         source_mtime)
+
+    @staticmethod
+    def _platform(platform: {str}, width: int, height: int) -> Collidable2D:
+        """
+        The Collidable2D of a platform of a level file.
+        """
+        unknown = set(platform) - LevelData.PLATFORM_KEYS
+        if unknown:
+            raise ValueError(f'unknown platform keys {sorted(unknown)}')
+        if 'x' not in platform or 'y' not in platform:
+            raise ValueError('platforms need an x and a y')
+        dimension = platform.get('hitbox_dimension')
+        coordinates = platform.get('hitbox_coordinates')
+        return Collidable2D(img=platform.get('img'), x=floor(platform['x'] * width), y=floor(platform['y'] * height),
+                            width=platform.get('width'), height=platform.get('height'),
+                            does_collide=platform.get('does_collide', True),
+                            hitbox_type=platform.get('hitbox_type', 'image'),
+                            hitbox_dimension=None if dimension is None else Dimension(*dimension),
+                            hitbox_coordinates=None if coordinates is None else [Vector2D(c) for c in coordinates])
+
+    @staticmethod
+    def _spawn_point(spawn_point: {str}, platforms: [Collidable2D], width: int, height: int) -> (float, float):
+        """
+        The position of a spawn point of a level file.
+        """
+        if 'platform' not in spawn_point:
+            return floor(spawn_point['x'] * width), floor(spawn_point['y'] * height)
+        platform = platforms[spawn_point['platform']]
+        edge = spawn_point.get('edge', 'center')
+        if edge not in LevelData.SPAWN_EDGES:
+            raise ValueError(f"spawn point edge must be one of {list(LevelData.SPAWN_EDGES)}, not '{edge}'")
+        return (platform.x + LevelData.SPAWN_EDGES[edge] * (platform.width / 2 - Player.standard_width() / 2),
+                platform.y + platform.height / 2 + Player.standard_height() / 2)
+
+    # -------------- BINARY FORM -------------- #
+
+    @staticmethod
+    def _padded(data: bytes) -> bytes:
+        return data + bytes(-len(data) % 8)
+
+    def to_bytes(self) -> bytes:
+        strings = '\0'.join(self.strings).encode()
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.width, self.height, len(self.objects),
+                                  len(self.vertices), len(self.spawn_points), len(self.cells), len(self.members),
+                                  len(strings), self.cell_size, self.source_mtime)
+        return b''.join((header, self._padded(strings), self.objects.tobytes(), self.vertices.tobytes(),
+                         self.spawn_points.tobytes(), self.cells.tobytes(), self.offsets.tobytes(),
+                         self.members.tobytes()))
+
+    @staticmethod
+    def from_bytes(data: bytes, path: str = 'data') -> LevelData:
+        """
+        Reads the binary form of a level, the arrays are read-only views of data.
+            :param data: Bytes written by to_bytes.
+            :param path: Where the data came from, for the error message.
+            :raise ValueError: If data is not a compiled level of this version.
+        """
+        header = LevelData.HEADER
+        if len(data) < header.size:
+            raise ValueError(f'{path} is too short to be a compiled level')
+        (magic, version, width, height, num_objects, num_vertices, num_spawn_points, num_cells, num_members,
+         strings_size, cell_size, source_mtime) = header.unpack_from(data)
+        if magic != LevelData.MAGIC or version != LevelData.VERSION:
+            raise ValueError(f'{path} is not a version {LevelData.VERSION} compiled level')
+
+        offset = header.size
+        strings = bytes(data[offset:offset + strings_size]).decode().split('\0')
+        offset += strings_size + -strings_size % 8
+
+        def section(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        try:
+            objects = section(LevelData.OBJECT, num_objects)
+            vertices = section(np.float64, num_vertices * 2)
+            spawn_points = section(np.float64, num_spawn_points * 2)
+            cells = section(np.int64, num_cells * 2)
+            offsets = section(np.int64, num_cells + 1)
+            members = section(np.int64, num_members)
+        except ValueError:
+            raise ValueError(f'{path} is truncated')
+        return LevelData(strings, objects, vertices.reshape(-1, 2), spawn_points.reshape(-1, 2),
+                         cells.reshape(-1, 2), offsets, members, width, height, cell_size, source_mtime)
+
+    @staticmethod
+    def read(path: str) -> LevelData:
+        """
+        Loads a compiled level with a single read.
+        """
+        with open(path, mode='rb') as level_file:
+            return LevelData.from_bytes(level_file.read(), path)
+
+    def write(self, path: str):
+        """
+        Saves the compiled level, atomically so parallel workers never read half a file.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(path.name + f'.{os.getpid()}')
+        with open(temporary, mode='wb') as level_file:
+            level_file.write(self.to_bytes())
+        os.replace(temporary, path)
+
+    # -------------- BUILDING -------------- #
+
+    def level_kwargs(self) -> {str}:
+        """
+        The arguments of Level.__init__ for this level, without its objects.
+        """
+        spawn_points = [Vector2D(point) for point in self.spawn_points.tolist()] if len(self.spawn_points) else None
+        return {'name': self.name, 'music': self.music, 'spawn_points': spawn_points}
+
+    def platforms(self) -> [Collidable2D]:
+        """
+        New Collidable2Ds of the platforms, their images are resource names that are loaded by attach_view.
+        """
+        strings, vertices = self.strings, self.vertices.tolist()
+        platforms = []
+        for (img, hitbox_type, does_collide, _, vertex_start, vertex_count, x, y, width, height, hitbox_width,
+             hitbox_height, _, _) in self.objects.tolist():
+            hitbox_type = self.HITBOX_TYPES[hitbox_type]
+            coordinates = None
+            if hitbox_type == 'abstract':
+                coordinates = [Vector2D(vertex) for vertex in vertices[vertex_start:vertex_start + vertex_count]]
+            platforms.append(Collidable2D(img=None if img < 0 else strings[img], scaled=False, x=x, y=y, width=width,
+                                          height=height, does_collide=bool(does_collide), hitbox_type=hitbox_type,
+                                          hitbox_dimension=Dimension(hitbox_width, hitbox_height),
+                                          hitbox_coordinates=coordinates))
+        return platforms
+
+    def add_platforms(self, level: Level):
+        """
+        Adds new platforms to a level that has no views yet, with the precomputed broad phase
+        cells if the level uses the cell size they were computed with.
+            :param level: The level, built for the window size of this LevelData.
+        """
+        platforms = self.platforms()
+        level.collidables.extend(platforms)
+        broad_phase = level.broad_phase
+        if broad_phase.static.cell_size != self.cell_size:
+            for platform in platforms:
+                broad_phase.add(platform, dynamic=False)
+            return
+
+        indexed = np.flatnonzero(self.objects['indexed'])
+        broad_phase.add_static([platforms[i] for i in indexed.tolist()], self.objects['aabb'][indexed],
+                               self.objects['cell_range'][indexed], self.cells, self.offsets, self.members)
+
+    def build(self) -> Level:
+        """
+        A new Level of this level file.
+        """
+        level = Level(**self.level_kwargs())
+        self.add_platforms(level)
+        return level
+
+
+class LevelLibrary(object):
+    """
+    The level files of a folder by file name, compiled on first use.
+
+    Compiled levels are cached in a file per level and window size, which is rebuilt when the
+    JSON file changes, and kept in memory, so building a level again only creates its objects.
+    """
+
+    def __init__(self, folder: Path = None, cache_folder: Path = None):
+        """
+        Creates a new LevelLibrary, nothing is read before a level is used.
+            :param folder: Folder of the JSON level files, the levels resource folder if None.
+            :param cache_folder: Folder of the compiled levels, in the global cache path if None.
+        """
+        self._folder: Path = None if folder is None else Path(folder)
+        self._cache_folder: Path = None if cache_folder is None else Path(cache_folder)
+        self._data: {(str, int, int): LevelData} = {}  # compiled levels by name and window size
+
+    @property
+    def folder(self) -> Path:
+        return Settings.global_resource_path.joinpath('levels') if self._folder is None else self._folder
+
+    @property
+    def cache_folder(self) -> Path:
+        return Settings.global_cache_path.joinpath('levels') if self._cache_folder is None else self._cache_folder
+
+    def names(self) -> [str]:
+        """
+        File names of all levels, without the .json extension.
+        """
+        return sorted(path.stem for path in self.folder.glob('*.json'))
+
+    def data(self, name: str) -> LevelData:
+        """
+        The compiled level for the current window size.
+            :param name: File name of the level, without the .json extension.
+            :raise KeyError: If there is no such level file.
+            :raise ValueError: If the level file is not valid.
+        """
+        compiled = Settings.compiled()
+        key = (name, compiled.width, compiled.height)
+        data = self._data.get(key)
+        if data is not None:
+            return data
+
+        source = self.folder.joinpath(f'{name}.json')
+        try:
+            source_mtime = os.stat(source).st_mtime_ns
+        except FileNotFoundError:
+            raise KeyError(name)
+        cache = self.cache_folder.joinpath(f'{name}.{compiled.width}x{compiled.height}.lvl')
+        try:
+            data = LevelData.read(cache)
+        except (OSError, ValueError):
+            data = None
+        if (data is None or data.source_mtime != source_mtime or (data.width, data.height) != key[1:]
+                or data.cell_size != Player.standard_height() * 2):
+            with open(source, mode='r') as level_file:
+                try:
+                    data = LevelData.compile(json.load(level_file), source_mtime)
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    raise ValueError(f'{source} is not a valid level: {e}')
+            try:
+                data.write(cache)
+            except OSError:
+                pass  # compiled again next time
+        self._data[key] = data
+        return data
+
+    def build(self, name: str) -> Level:
+        """
+        A new Level of a level file, see data.
+        """
+        return self.data(name).build()
+
+    def find(self, level_name: str) -> str:
+        """
+        The file name of a level by the name it displays, or as much of it as a recording stores.
+            :return: The file name, None if no level has that name.
+        """
+        for name in self.names():
+            display_name = self.data(name).name
+            if display_name == level_name or display_name.encode()[:32] == level_name.encode():
+                return name
+        return None
+
+    def factory(self, names: [str] = None, seed: int = None) -> ():
+        """
+        A level_factory for LevelEnv that builds a random one of several levels on every call,
+        to train on many layouts. LevelEnv has to be created with rebuild=True to use more than one.
+            :param names: The levels to choose from, all of them if None.
+            :param seed: Seed of the random choice.
+        """
+        names = self.names() if names is None else list(names)
+        rng = Random(seed)
+        return lambda: self.build(rng.choice(names))
+
+
+levels: LevelLibrary = LevelLibrary()  # the levels of the game
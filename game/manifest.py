@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+from pathlib import Path
+
+
+class ResourceManifest(object):
+    """
+    Index of the resource files: the folders pyglet searches, and the path and image size of every file.
+
+    Scanning the resource tree is cached in a JSON file together with the modification
+    time of every folder. Adding, removing or renaming a file changes the time of its
+    folder, so the cache is only rebuilt when the tree changed and a normal start only
+    stats the folders. Sizes of PNG images are read from their headers, so the simulation
+    can size its elements without loading images or importing pyglet.
+    """
+
+    VERSION: int = 1
+
+    def __init__(self, root: Path, cache_path: Path = None):
+        """
+        Loads the manifest of a resource folder, scanning it if the cache is missing or outdated.
+            :param root: The resource folder.
+            :param cache_path: JSON file to cache the manifest in, not cached if None. It must be outside of root,
+            otherwise writing it changes the folder times it is validated with.
+        """
+        self.root: Path = Path(root)
+        self.cache_path: Path = None if cache_path is None else Path(cache_path)
+        self.folders: [str] = []  # absolute paths of root and all folders below it
+        self.files: {str: str} = {}  # file name to its path relative to root, the first found wins like in pyglet
+        self.image_sizes: {str: (int, int)} = {}  # file name to (width, height) of PNG images
+        self._folder_times: {str: int} = {}
+        self.scanned: bool = False  # if the tree was scanned instead of read from the cache
+
+        if not self._read_cache():
+            self.scan()
+            self._write_cache()
+
+    def path(self, name: str) -> Path:
+        """
+        The full path of a resource file.
+            :param name: File name of the resource.
+            :raise KeyError: If there is no such resource.
+        """
+        return self.root.joinpath(self.files[name])
+
+    def image_size(self, name: str) -> (int, int):
+        """
+        The (width, height) of a PNG resource, None for other or unknown files.
+        """
+        return self.image_sizes.get(name)
+
+    def scan(self):
+        """
+        Walks the resource tree and rebuilds the manifest.
+        """
+        self.folders, self.files, self.image_sizes, self._folder_times = [], {}, {}, {}
+        for folder, _, file_names in os.walk(self.root):
+            self.folders.append(folder)
+            self._folder_times[folder] = os.stat(folder).st_mtime_ns
+            for name in sorted(file_names):
+                if name in self.files:
+                    continue
+                path = os.path.join(folder, name)
+                self.files[name] = os.path.relpath(path, self.root)
+                if name.lower().endswith('.png'):
+                    size = self.read_png_size(path)
+                    if size is not None:
+                        self.image_sizes[name] = size
+        self.scanned = True
+
+    @staticmethod
+    def read_png_size(path: str) -> (int, int):
+        """
+        Reads the size of a PNG image from its IHDR chunk.
+            :return: (width, height), None if the file is not a PNG.
+        """
+        with open(path, mode='rb') as png:
+            header = png.read(24)
+        if len(header) < 24 or header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+            return None
+        return struct.unpack('>II', header[16:24])
+
+    def _read_cache(self) -> bool:
+        if self.cache_path is None:
+            return False
+        try:
+            with open(self.cache_path, mode='r') as cache:
+                data = json.load(cache)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != self.VERSION or data.get('root') != str(self.root):
+            return False
+        try:
+            for folder, mtime in data['folders'].items():
+                if os.stat(folder).st_mtime_ns != mtime:
+                    return False
+        except OSError:
+            return False
+
+        self._folder_times = data['folders']
+        self.folders = list(self._folder_times)
+        self.files = data['files']
+        self.image_sizes = {name: tuple(size) for name, size in data['image_sizes'].items()}
+        return True
+
+    def _write_cache(self):
+        if self.cache_path is None:
+            return
+        data = {'version': self.VERSION, 'root': str(self.root), 'folders': self._folder_times,
+                'files': self.files, 'image_sizes': self.image_sizes}
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.cache_path.with_name(self.cache_path.name + f'.{os.getpid()}')
+            with open(temporary, mode='w') as cache:
+                json.dump(data, cache)
+            os.replace(temporary, self.cache_path)  # atomic, parallel workers never read half a file
+        except OSError:
+            pass  # the manifest still works without its cache
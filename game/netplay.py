@@ -0,0 +1,494 @@
+"""
+Rollback netplay of two player matches over UDP.
+
+Both peers simulate the whole match. The actions of the local player are sent to the other
+peer input_delay ticks before they are used, the actions of the remote player are predicted
+until they arrive, and ticks simulated with a wrong prediction are simulated again from a
+snapshot of the level, see RollbackSession.
+
+Two processes on one machine, with 60 ms added to every datagram (120 ms RTT), run from the game folder
+(the settings and resources are found relative to it) with the repository root on the path:
+
+    PYTHONPATH=.. python -m game.netplay --player 0 --port 7001 --peer 127.0.0.1:7002 --latency 0.06 --headless
+    PYTHONPATH=.. python -m game.netplay --player 1 --port 7002 --peer 127.0.0.1:7001 --latency 0.06 --headless
+
+Headless peers play random actions and print their stats and the checksum of the final state as JSON,
+without --headless the local player is on the keyboard with the bindings of player 1.
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import random
+import socket
+import struct
+from time import perf_counter, sleep
+
+from game.core import apply_actions, update
+from game.input import ActionTable
+from game.level import Level, LevelSnapshot
+from game.settings import Settings
+
+
+class UdpTransport(object):
+    """
+    Non-blocking UDP socket talking to one peer, datagrams from other addresses are dropped.
+
+    For testing on one machine, sent datagrams can be held back by a latency plus a random jitter,
+    and dropped at a loss rate. Both peers add their latency, so the RTT grows by twice the latency.
+    """
+
+    def __init__(self, port: int, peer: (str, int), host: str = '0.0.0.0', latency: float = 0, jitter: float = 0,
+                 loss: float = 0, seed: int = None):
+        """
+        Binds the socket.
+            :param port: Local port, 0 for any free port.
+            :param peer: (host, port) of the other peer.
+            :param host: Local address to bind to.
+            :param latency: Seconds every sent datagram is held back.
+            :param jitter: Most seconds added to the latency at random, datagrams can arrive out of order.
+            :param loss: Fraction of sent datagrams that are dropped.
+            :param seed: Seed of the jitter and the losses.
+        """
+        self.socket: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind((host, port))
+        self.peer: (str, int) = (socket.gethostbyname(peer[0]), int(peer[1]))
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.loss: float = loss
+        self._random: random.Random = random.Random(seed)
+        self._held: [(float, int, bytes)] = []  # heap of (due time, sequence, datagram)
+        self._sequence: int = 0
+
+    @property
+    def port(self) -> int:
+        return self.socket.getsockname()[1]
+
+    def send(self, data: bytes):
+        """
+        Sends a datagram to the peer, now or when its latency is over.
+        """
+        if self.loss and self._random.random() < self.loss:
+            return
+        if self.latency or self.jitter:
+            self._sequence += 1
+            heapq.heappush(self._held, (perf_counter() + self.latency + self._random.uniform(0, self.jitter),
+                                        self._sequence, data))
+        else:
+            self._send(data)
+
+    def _send(self, data: bytes):
+        try:
+            self.socket.sendto(data, self.peer)
+        except (BlockingIOError, ConnectionError):  # full buffer or no peer yet, the data is sent again later
+            pass
+
+    def receive(self) -> [bytes]:
+        """
+        Sends the held datagrams that are due and reads all waiting datagrams of the peer.
+            :return: The datagrams, in the order they arrived.
+        """
+        now = perf_counter()
+        while self._held and self._held[0][0] <= now:
+            self._send(heapq.heappop(self._held)[2])
+        datagrams = []
+        while True:
+            try:
+                data, address = self.socket.recvfrom(65536)
+            except BlockingIOError:
+                break
+            except ConnectionError:  # ICMP port unreachable of an earlier send, on some platforms
+                continue
+            if address == self.peer:
+                datagrams.append(data)
+        return datagrams
+
+    def close(self):
+        self.socket.close()
+
+
+class NetStats(object):
+    """
+    Counters of a RollbackSession.
+    """
+
+    def __init__(self):
+        self.ticks: int = 0  # ticks simulated forward
+        self.stalls: int = 0  # ticks not simulated because the remote actions were rollback_window ticks late
+        self.waits: int = 0  # ticks not simulated to let the other peer catch up
+        self.rollbacks: int = 0  # wrong predictions
+        self.rollback_frames: int = 0  # ticks simulated again
+        self.max_rollback: int = 0  # most ticks simulated again at once
+        self.packets_sent: int = 0
+        self.packets_received: int = 0
+        self.rtt: float = 0  # smoothed round trip time in seconds
+        self.rtt_min: float = 0
+        self.rtt_max: float = 0
+        self.rtt_samples: int = 0
+        self.checks: int = 0  # states compared with the other peer
+        self.desyncs: int = 0  # compared states that differed
+
+    def add_rtt(self, rtt: float):
+        """
+        Adds a measured round trip time, smoothed like TCP does.
+        """
+        if self.rtt_samples == 0:
+            self.rtt = self.rtt_min = self.rtt_max = rtt
+        else:
+            self.rtt += (rtt - self.rtt) / 8
+            self.rtt_min = min(self.rtt_min, rtt)
+            self.rtt_max = max(self.rtt_max, rtt)
+        self.rtt_samples += 1
+
+    def summary(self) -> {str: float}:
+        """
+        :return: Dict of all counters, round trip times in milliseconds.
+        """
+        summary = dict(vars(self))
+        for name in ('rtt', 'rtt_min', 'rtt_max'):
+            summary[name + '_ms'] = round(summary.pop(name) * 1e3, 3)
+        return summary
+
+
+class RollbackSession(object):
+    """
+    Keeps the level of a two player match in step with a remote peer, GGPO style.
+
+    Every advance stores the local actions for the tick input_delay ticks ahead and sends all actions
+    the peer has not acknowledged, so lost datagrams are made up by the next ones. A tick is simulated
+    with the remote actions if they arrived, otherwise with the last remote actions that arrived.
+    The level is snapshotted before every tick, when remote actions differ from what was predicted the
+    level is restored to the tick they are for and simulated again up to the current tick. No tick
+    is predicted more than rollback_window ticks ahead of the remote actions, the session stalls instead.
+
+    Datagrams also carry timestamps for the round trip time, the tick of the sender, to let the peer
+    that is ahead wait, and a checksum of the state every sync_interval ticks, to detect desyncs.
+    Rolled back ticks run the update hooks of the level again, so hooks must not count ticks.
+    """
+
+    MAGIC: bytes = b'AITN'
+    INPUTS: int = 1
+    # magic, kind, player, tick of the sender, last acknowledged remote tick, first tick of the actions, send time,
+    # echoed send time of the peer, seconds the echo was held, checked tick, checksum, number of actions
+    PACKET: struct.Struct = struct.Struct('<4sBBiiidddiIH')
+
+    def __init__(self, level: Level, local_player: int, transport: UdpTransport, input_delay: int = None,
+                 rollback_window: int = None, dt: float = None, sync_interval: int = 30):
+        """
+        Creates a session, connect it before the first advance.
+            :param level: The level of the match, with its two players added.
+            :param local_player: Index of the player on this peer, 0 or 1.
+            :param transport: The connection to the other peer.
+            :param input_delay: Ticks between reading and doing the local actions, the setting if None.
+            :param rollback_window: Most ticks predicted, the setting if None.
+            :param dt: Simulated time of a tick, the tick_rate setting if None.
+            :param sync_interval: Ticks between compared states.
+            :raise ValueError: If the level does not have two players or local_player is not 0 or 1.
+        """
+        if len(level.players) != 2:
+            raise ValueError(f'rollback netplay needs 2 players, {level.name} has {len(level.players)}')
+        if local_player not in (0, 1):
+            raise ValueError(f'local_player must be 0 or 1, not {local_player}')
+        compiled = Settings.compiled()
+        self.level: Level = level
+        self.transport: UdpTransport = transport
+        self.local_player: int = local_player
+        self.remote_player: int = 1 - local_player
+        self.input_delay: int = compiled.input_delay if input_delay is None else input_delay
+        self.rollback_window: int = compiled.rollback_window if rollback_window is None else rollback_window
+        self.dt: float = compiled.tick_dt if dt is None else dt
+        self.sync_interval: int = sync_interval
+        self.max_advantage: float = 1.5  # ticks this peer may be ahead of the other before it waits
+        self.stats: NetStats = NetStats()
+
+        # TICKS #
+        self.frame: int = 0  # next tick to simulate
+        self.local_frame: int = self.input_delay - 1  # last tick with local actions, nobody acts before input_delay
+        self.remote_confirmed: int = self.input_delay - 1  # last tick the remote actions arrived for
+        self.connected: bool = False  # if the peer has answered
+
+        # RINGS, INDEXED BY TICK #
+        self._size: int = 2 * (self.rollback_window + self.input_delay + 2)  # ticks actions are kept for
+        self._inputs: [[int]] = [[0] * self._size, [0] * self._size]  # action bits of both players
+        self._used: [[int]] = [[0, 0] for _ in range(self._size)]  # actions a tick was simulated with
+        self._snapshots: [(int, LevelSnapshot)] = [(-1, None)] * (self.rollback_window + 2)  # state before a tick
+
+        # PEER #
+        self._peer_ack: int = self.input_delay - 1  # last local tick the peer has
+        self._echo: float = 0  # send time of the newest datagram of the peer, in its clock
+        self._echo_at: float = 0  # when it arrived
+        self._remote_frame: int = 0  # tick of the peer in its newest datagram
+        self._remote_frame_at: float = 0  # when it arrived
+
+        # DESYNC DETECTION #
+        self._next_check: int = sync_interval  # next tick whose starting state is compared
+        self._sent_check: (int, int) = (-1, 0)  # (tick, checksum) sent in every datagram
+        self._local_checks: {int: int} = {}
+        self._remote_checks: {int: int} = {}
+        self._compared: int = -1  # last compared tick
+        self.desync_frame: int = None  # first tick whose state differed
+
+    def connect(self, timeout: float = 10) -> bool:
+        """
+        Sends datagrams until the peer has answered one, so both peers start about the same time.
+            :param timeout: Most seconds to wait.
+            :return: True if the peer answered.
+        """
+        deadline = perf_counter() + timeout
+        while not self.connected and perf_counter() < deadline:
+            self.send()
+            self.poll()
+            sleep(min(0.02, self.dt))
+        return self.connected
+
+    def advance(self, local_bits: int) -> bool:
+        """
+        Runs one tick of the match: reads the datagrams of the peer, rolls back if a prediction
+        was wrong, stores and sends the local actions and simulates the next tick.
+            :param local_bits: Action bits of the local player, used input_delay ticks later.
+            :return: False if the session stalled or waited and no tick was simulated.
+        """
+        self.poll()
+        if self.local_frame < self.frame + self.input_delay:  # a stalled tick reads no new actions
+            self.local_frame += 1
+            self._inputs[self.local_player][self.local_frame % self._size] = int(local_bits)
+        self.send()
+
+        if self.frame - self.remote_confirmed > self.rollback_window:
+            self.stats.stalls += 1
+            return False
+        if self.advantage() > self.max_advantage:
+            self.stats.waits += 1
+            return False
+        self._simulate(self.frame)
+        self.frame += 1
+        self.stats.ticks += 1
+        return True
+
+    def advantage(self) -> float:
+        """
+        How many ticks this peer is ahead of the other one, estimated from the tick in its newest datagram.
+        """
+        if not self._remote_frame_at:
+            return 0
+        elapsed = self.stats.rtt / 2 + perf_counter() - self._remote_frame_at
+        return self.frame - (self._remote_frame + elapsed / self.dt)
+
+    def poll(self):
+        """
+        Reads the datagrams of the peer and simulates the ticks again that were predicted wrong.
+        """
+        now = perf_counter()
+        remote = self.remote_player
+        inputs = self._inputs[remote]
+        size = self._size
+        rollback_from = None
+        for data in self.transport.receive():
+            if len(data) < self.PACKET.size:
+                continue
+            magic, kind, player, frame, ack, first, sent, echo, held, check_frame, check, count = \
+                self.PACKET.unpack_from(data)
+            if magic != self.MAGIC or kind != self.INPUTS or player != remote or len(data) != self.PACKET.size + count:
+                continue
+            self.stats.packets_received += 1
+            if echo:
+                self.connected = True
+                self.stats.add_rtt(now - echo - held)
+            if sent > self._echo:
+                self._echo, self._echo_at = sent, now
+            if frame > self._remote_frame:
+                self._remote_frame, self._remote_frame_at = frame, now
+            self._peer_ack = max(self._peer_ack, ack)
+            if check_frame > self._compared:
+                self._remote_checks[check_frame] = check
+
+            # the actions continue where the known ones end, later ones wait for the missing ones
+            oldest = self.frame - self.rollback_window - 1  # oldest tick that may still be rolled back to
+            bits = data[self.PACKET.size:]
+            for i in range(max(0, self.remote_confirmed + 1 - first), count):
+                tick = first + i
+                if tick != self.remote_confirmed + 1 or tick - oldest >= size:
+                    break
+                inputs[tick % size] = bits[i]
+                if tick < self.frame and rollback_from is None and self._used[tick % size][remote] != bits[i]:
+                    rollback_from = tick
+                self.remote_confirmed = tick
+
+        if rollback_from is not None:
+            self._rollback(rollback_from)
+        self._check_sync()
+
+    def send(self):
+        """
+        Sends the local actions the peer has not acknowledged, with the timestamps and the latest checksum.
+        """
+        now = perf_counter()
+        first = max(self._peer_ack + 1, self.local_frame - self._size + 1)
+        inputs = self._inputs[self.local_player]
+        size = self._size
+        bits = bytes(inputs[tick % size] for tick in range(first, self.local_frame + 1))
+        check_frame, check = self._sent_check
+        header = self.PACKET.pack(self.MAGIC, self.INPUTS, self.local_player, self.frame, self.remote_confirmed,
+                                  first, now, self._echo, now - self._echo_at if self._echo else 0, check_frame,
+                                  check, len(bits))
+        self.transport.send(header + bits)
+        self.stats.packets_sent += 1
+
+    def finish(self, timeout: float = 5, linger: float = 0.5) -> bool:
+        """
+        Keeps exchanging datagrams after the last tick until this peer has the remote actions of every
+        simulated tick and the peer has acknowledged the local ones, so the final states are equal.
+            :param timeout: Most seconds to wait for the remote actions.
+            :param linger: Most seconds to keep sending for the peer after that.
+            :return: True if the remote actions of every simulated tick arrived.
+        """
+        deadline = perf_counter() + timeout
+        confirmed_at = None
+        while perf_counter() < deadline:
+            self.poll()
+            self.send()
+            if self.remote_confirmed >= self.frame - 1:
+                if confirmed_at is None:
+                    confirmed_at = perf_counter()
+                if self._peer_ack >= self.frame - 1 or perf_counter() - confirmed_at > linger:
+                    break
+            sleep(self.dt / 2)
+        return self.remote_confirmed >= self.frame - 1
+
+    def _input(self, player: int, tick: int) -> int:
+        """
+        The action bits of a player in a tick, the last known ones of the remote player if they did not arrive.
+        """
+        if player == self.remote_player and tick > self.remote_confirmed:
+            tick = self.remote_confirmed
+        return self._inputs[player][tick % self._size]
+
+    def _simulate(self, tick: int, snapshot: bool = True):
+        """
+        Snapshots the level and simulates one tick with the known or predicted actions.
+            :param tick: The tick, the level must be at its start.
+            :param snapshot: If False the snapshot of the tick is kept, the level was just restored to it.
+        """
+        if snapshot:
+            self._snapshots[tick % len(self._snapshots)] = (tick, self.level.snapshot())
+        actions = self._used[tick % self._size]
+        actions[0] = self._input(0, tick)
+        actions[1] = self._input(1, tick)
+        apply_actions(self.level, actions)
+        update(self.level, self.dt)
+
+    def _rollback(self, tick: int):
+        """
+        Restores the level to the start of a tick and simulates again up to the current tick.
+            :param tick: The first tick that was predicted wrong.
+        """
+        stored, snapshot = self._snapshots[tick % len(self._snapshots)]
+        if stored != tick:
+            raise RuntimeError(f'tick {tick} is outside of the rollback window at tick {self.frame}')
+        self.level.restore(snapshot)
+        self._simulate(tick, snapshot=False)
+        for again in range(tick + 1, self.frame):
+            self._simulate(again)
+        frames = self.frame - tick
+        self.stats.rollbacks += 1
+        self.stats.rollback_frames += frames
+        self.stats.max_rollback = max(self.stats.max_rollback, frames)
+
+    def _check_sync(self):
+        """
+        Checksums the next checked state once all actions before it arrived, and compares it with the peer.
+        """
+        tick = self._next_check
+        if tick <= self.frame and tick - 1 <= self.remote_confirmed:
+            if tick == self.frame:
+                snapshot = self.level.snapshot()
+            else:
+                stored, snapshot = self._snapshots[tick % len(self._snapshots)]
+                snapshot = snapshot if stored == tick else None
+            if snapshot is not None:
+                self._local_checks[tick] = snapshot.checksum()
+                self._sent_check = (tick, self._local_checks[tick])
+            self._next_check += self.sync_interval
+        for tick in [tick for tick in self._local_checks if tick in self._remote_checks]:
+            self.stats.checks += 1
+            if self._local_checks.pop(tick) != self._remote_checks.pop(tick):
+                self.stats.desyncs += 1
+                if self.desync_frame is None:
+                    self.desync_frame = tick
+            self._compared = max(self._compared, tick)
+        for tick in [tick for tick in self._remote_checks if tick <= self._compared]:
+            del self._remote_checks[tick]
+
+
+def play_headless(session: RollbackSession, ticks: int, seed: int = None) -> {str}:
+    """
+    Plays random movement on the local player of a connected session in real time.
+        :param session: The session.
+        :param ticks: Ticks to simulate.
+        :param seed: Seed of the actions.
+        :return: Dict with the local player, the simulated ticks, if the end was confirmed,
+        the checksum of the final state and the stats.
+    """
+    rng = random.Random(seed)
+    moves = (0, ActionTable.bit('move_left'), ActionTable.bit('move_right'))
+    bits = 0
+    start = perf_counter()
+    calls = 0
+    while session.frame < ticks:
+        if rng.random() < 0.1:
+            bits = rng.choice(moves)
+        session.advance(bits)
+        calls += 1
+        ahead = start + calls * session.dt - perf_counter()
+        if ahead > 0:
+            sleep(ahead)
+    confirmed = session.finish()
+    return {'player': session.local_player, 'ticks': session.frame, 'confirmed': confirmed,
+            'checksum': session.level.snapshot().checksum(), 'desync_frame': session.desync_frame,
+            'stats': session.stats.summary()}
+
+
+def main():
+    from game.level import BlockPlace, Player
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--player', type=int, choices=(0, 1), required=True, help='index of the local player')
+    parser.add_argument('--port', type=int, required=True, help='local UDP port')
+    parser.add_argument('--peer', required=True, help='host:port of the other peer')
+    parser.add_argument('--headless', action='store_true', help='play random actions without a window')
+    parser.add_argument('--ticks', type=int, default=600, help='ticks to play headless')
+    parser.add_argument('--seed', type=int, help='seed of the headless actions')
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every sent datagram')
+    parser.add_argument('--jitter', type=float, default=0, help='most seconds added at random')
+    parser.add_argument('--loss', type=float, default=0, help='fraction of sent datagrams dropped')
+    args = parser.parse_args()
+    host, _, port = args.peer.rpartition(':')
+    if not host or not port.isdigit():
+        parser.error(f"--peer must look like 127.0.0.1:7002, not '{args.peer}'")
+
+    Settings.init(headless=args.headless)
+    level = BlockPlace()
+    for num in range(2):
+        img = None if args.headless else f'p_{num + 1}.png'
+        level.add(Player(img=img, x=level.spawn_points[num].x, y=level.spawn_points[num].y))
+    transport = UdpTransport(args.port, (host, int(port)), latency=args.latency, jitter=args.jitter, loss=args.loss,
+                             seed=args.seed)
+    session = RollbackSession(level, args.player, transport)
+    try:
+        if not session.connect():
+            parser.exit(1, f'no answer from {args.peer}\n')
+        if args.headless:
+            print(json.dumps(play_headless(session, args.ticks, args.seed)))
+        else:
+            from game.core import game_local
+
+            game_local(window=Settings.global_main_window, level=level, session=session)
+            print(json.dumps(session.stats.summary()))
+    finally:
+        transport.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import numpy as np
+
+from game.utility import Vector2D
+
+
+class PhysicsWorld(object):
+    """
+    Struct of arrays storage for the physics state of a set of bodies.
+
+    Positions, velocities and masses of every body live in contiguous NumPy arrays,
+    a PhysicalObject that is added to the world reads and writes its own row of them.
+    Gravity, queued forces and integration are done for all awake bodies in one pass,
+    bodies that rested for sleep_ticks steps sleep and cost nothing until they are woken.
+    """
+
+    def __init__(self, capacity: int = 16, sleep_ticks: int = 0, sleep_velocity: float = 0):
+        """
+        Creates a new, empty PhysicsWorld.
+            :param capacity: Number of bodies to allocate room for, the arrays grow when needed.
+            :param sleep_ticks: Steps a body has to be slower than sleep_velocity to fall asleep, 0 to never sleep.
+            :param sleep_velocity: Speed below which a body counts as resting, in pixels/second.
+        """
+        self.count: int = 0  # number of bodies, rows past this are unused
+        self.bodies: [] = []  # body for every row
+        self.pos: np.ndarray = np.zeros((capacity, 2))  # center of every body
+        self.prev_pos: np.ndarray = np.zeros((capacity, 2))  # center of every body before the last step
+        self.vel: np.ndarray = np.zeros((capacity, 2))  # velocity of every body
+        self.force: np.ndarray = np.zeros((capacity, 2))  # forces queued for the next step
+        self.inv_mass: np.ndarray = np.zeros(capacity)  # 1 / mass
+        self.updates: np.ndarray = np.zeros(capacity, dtype=bool)  # if the position is integrated
+        self.kinematic: np.ndarray = np.zeros(capacity, dtype=bool)  # moved by velocity only, see PhysicalObject
+        self.sleeping: np.ndarray = np.zeros(capacity, dtype=bool)  # skipped by step until woken
+        self.still_ticks: np.ndarray = np.zeros(capacity, dtype=np.int64)  # steps the body has been resting
+
+        # SLEEPING #
+        self.sleep_ticks: int = sleep_ticks
+        self.sleep_velocity: float = sleep_velocity
+        self.sleeping_count: int = 0
+        self.gravity_step: float = 0  # speed gravity added in the last step, resting bodies have that much
+        self.kinematic_count: int = 0
+        self.woken: [] = []  # bodies woken since the level last woke the bodies touching them
+        self._awake: np.ndarray = None  # rows of the awake bodies, None when it has to be rebuilt
+
+    @property
+    def capacity(self) -> int:
+        return len(self.pos)
+
+    def add(self, body) -> int:
+        """
+        Moves the state of a body into the world, the body is bound to a row afterwards.
+            :param body: The PhysicalObject to add.
+            :return: The row of the body.
+        """
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+
+        index = self.count
+        self.pos[index] = body.x, body.y
+        self.prev_pos[index] = self.pos[index]
+        self.vel[index] = body.dx.x, body.dx.y
+        self.force[index] = 0
+        self.inv_mass[index] = 1 / body.mass
+        self.updates[index] = body.does_update
+        self.kinematic[index] = body.body_type == 'kinematic'
+        self.sleeping[index] = False
+        self.still_ticks[index] = 0
+        self.kinematic_count += int(self.kinematic[index])
+        self.bodies.append(body)
+        self.count += 1
+        self._awake = None
+        body.bind(self, index)
+        return index
+
+    def remove(self, body):
+        """
+        Removes a body from the world, the body keeps a copy of its state.
+        The last row is moved into the freed one so the arrays stay contiguous.
+            :param body: The PhysicalObject to remove.
+        """
+        index = self.bodies.index(body)
+        body.unbind()
+        self.sleeping_count -= int(self.sleeping[index])
+        self.kinematic_count -= int(self.kinematic[index])
+        if body in self.woken:
+            self.woken.remove(body)
+
+        last = self.count - 1
+        if index != last:
+            for array in (self.pos, self.prev_pos, self.vel, self.force, self.inv_mass, self.updates, self.kinematic,
+                          self.sleeping, self.still_ticks):
+                array[index] = array[last]
+            moved = self.bodies[last]
+            self.bodies[index] = moved
+            moved.bind(self, index)
+        self.bodies.pop()
+        self.count -= 1
+        self._awake = None
+
+    def apply_force(self, index: int, force: Vector2D):
+        """
+        Queues a force to be applied to a body in the next step.
+            :param index: The row of the body.
+            :param force: The force to queue.
+        """
+        self.force[index, 0] += force.x
+        self.force[index, 1] += force.y
+        self.wake(index)
+
+    # -------------- SLEEPING -------------- #
+
+    def awake_rows(self) -> np.ndarray:
+        """
+        Rows of the bodies that are not sleeping, the same array until a body falls asleep, wakes, is added or removed.
+        """
+        if self._awake is None:
+            self._awake = np.flatnonzero(~self.sleeping[:self.count])
+        return self._awake
+
+    def wake(self, index: int):
+        """
+        Wakes a body and restarts the count of its resting steps.
+            :param index: The row of the body.
+        """
+        self.still_ticks[index] = 0
+        if self.sleeping[index]:
+            self.sleeping[index] = False
+            self.sleeping_count -= 1
+            self._awake = None
+            self.woken.append(self.bodies[index])
+
+    def wake_on_contact(self, rows_a: np.ndarray, rows_b: np.ndarray):
+        """
+        Wakes the sleeping bodies that are hit by a kinematic body, or by a body moving faster than
+        sleep_velocity plus the speed of one step of gravity. Slower bodies rest on sleeping bodies
+        like on static objects.
+            :param rows_a: World rows of the first bodies of the contacts, these are awake.
+            :param rows_b: World rows of the second bodies of the contacts, -1 for static objects.
+        """
+        if self.sleeping_count == 0 or len(rows_b) == 0:
+            return
+        sleeping = self.sleeping[rows_b] & (rows_b >= 0)
+        if not sleeping.any():
+            return
+        rows_a = rows_a[sleeping]
+        vel = self.vel[rows_a]
+        moving = ((np.einsum('ij,ij->i', vel, vel) >= (self.sleep_velocity + self.gravity_step) ** 2)
+                  | self.kinematic[rows_a])
+        for index in np.unique(rows_b[sleeping][moving]).tolist():
+            self.wake(index)
+
+    def update_sleep(self, dt: float, rows_a: np.ndarray = None, rows_b: np.ndarray = None):
+        """
+        Counts the steps every awake body has been resting, and puts islands of bodies that all rested
+        for sleep_ticks steps to sleep. Sleeping bodies are not moved by step, and are not pushed by
+        contacts until they are woken, by apply_force, by being moved, or by a fast contact.
+
+        Resting is measured by how far a body moved in the step after the contacts were resolved,
+        slower than sleep_velocity plus the speed of one step of gravity. Contacts are resolved in one
+        pass, so a body in a stack keeps part of what gravity added in a step even when it stands still.
+        Bodies touching each other only sleep together, a stack rests on its own overlaps and would
+        jump apart if its lower bodies froze first.
+            :param dt: Differential time of the step.
+            :param rows_a: World rows of the first bodies of the contacts of the step.
+            :param rows_b: World rows of the second bodies of the contacts, -1 for static objects.
+        """
+        if self.sleep_ticks <= 0 or self.sleeping_count == self.count:
+            return
+        everyone = self.sleeping_count == 0
+        selection = slice(0, self.count) if everyone else self.awake_rows()  # a slice indexes without copies
+        moved = self.pos[selection] - self.prev_pos[selection]
+        still = np.einsum('ij,ij->i', moved, moved) < ((self.sleep_velocity + self.gravity_step) * dt) ** 2
+        ticks = self.still_ticks[selection]
+        ticks += 1
+        ticks *= still
+        if not everyone:
+            self.still_ticks[selection] = ticks
+        if ticks.max() < self.sleep_ticks:
+            return
+        rested = ticks >= self.sleep_ticks
+        rows = np.arange(self.count) if everyone else selection
+
+        if rows_a is not None and len(rows_a):
+            awake_b = rows_b >= 0
+            awake_b[awake_b] = ~self.sleeping[rows_b[awake_b]]
+            if awake_b.any():
+                islands = self.islands(rows_a[awake_b], rows_b[awake_b])
+                restless = np.zeros(self.count, dtype=bool)
+                restless[islands[rows[~rested]]] = True
+                rested &= ~restless[islands[rows]]
+        tired = rows[rested]
+        if len(tired):
+            self.sleeping[tired] = True
+            self.vel[tired] = 0
+            self.prev_pos[tired] = self.pos[tired]
+            self.sleeping_count += len(tired)
+            self._awake = None
+
+    def islands(self, rows_a: np.ndarray, rows_b: np.ndarray) -> np.ndarray:
+        """
+        Groups the bodies connected by contacts.
+            :param rows_a: World rows of the first bodies of the contacts.
+            :param rows_b: World rows of the second bodies of the contacts.
+            :return: For every row the lowest row of its island.
+        """
+        islands = np.arange(self.count)
+        while True:
+            low = np.minimum(islands[rows_a], islands[rows_b])
+            if np.array_equal(low, islands[rows_a]) and np.array_equal(low, islands[rows_b]):
+                return islands
+            np.minimum.at(islands, rows_a, low)
+            np.minimum.at(islands, rows_b, low)
+            islands = islands[islands]  # follow the links, islands of long chains join in few passes
+
+    def step(self, dt: float, gravity: Vector2D = None):
+        """
+        Applies gravity and the queued forces to all bodies and integrates their positions.
+
+        Gravity is applied as a force like PhysicalObject.apply_force(gravity * dt) would.
+        Sleeping bodies are skipped, kinematic bodies are only moved by their velocity.
+            :param dt: Differential time of the step.
+            :param gravity: Gravity to apply to every body.
+        """
+        n = self.count
+        if n == 0:
+            return
+        self.gravity_step = 0 if gravity is None else float(np.hypot(gravity.x, gravity.y)) * dt
+
+        if self.sleeping_count == 0 and self.kinematic_count == 0:  # every row is a moving dynamic body
+            self.prev_pos[:n] = self.pos[:n]
+            force = self.force[:n]
+            if gravity is not None:
+                force[:, 0] += gravity.x * dt
+                force[:, 1] += gravity.y * dt
+            vel = self.vel[:n]
+            vel += force * self.inv_mass[:n, None]
+            force[:] = 0
+
+            self.pos[:n] += vel * (self.updates[:n, None] * dt)
+            return
+
+        rows = self.awake_rows()
+        self.prev_pos[rows] = self.pos[rows]
+        dynamic = rows[~self.kinematic[rows]] if self.kinematic_count else rows
+        force = self.force[dynamic]
+        if gravity is not None:
+            force[:, 0] += gravity.x * dt
+            force[:, 1] += gravity.y * dt
+        self.vel[dynamic] += force * self.inv_mass[dynamic, None]
+        self.force[rows] = 0
+
+        self.pos[rows] += self.vel[rows] * (self.updates[rows, None] * dt)
+
+    def interpolate(self, alpha: float, max_jump: (float, float) = None) -> np.ndarray:
+        """
+        Positions between the last two steps, for drawing between fixed timesteps.
+            :param alpha: Fraction of the way from the previous to the current positions.
+            :param max_jump: Bodies that moved further than this (x, y) in the last step,
+            like players wrapping around the screen, are put at their current position.
+            :return: (count, 2) array of positions.
+        """
+        return PhysicsWorld.lerp(self.prev_pos[:self.count], self.pos[:self.count], alpha, max_jump)
+
+    @staticmethod
+    def lerp(prev_pos: np.ndarray, pos: np.ndarray, alpha: float, max_jump: (float, float) = None) -> np.ndarray:
+        """
+        Positions between two steps, see interpolate, also used for the frames of a SimulationThread.
+            :param prev_pos: (n, 2) positions of the previous step.
+            :param pos: (n, 2) positions of the current step.
+            :param alpha: Fraction of the way from the previous to the current positions.
+            :param max_jump: Largest (x, y) movement that is interpolated.
+            :return: (n, 2) array of positions.
+        """
+        delta = pos - prev_pos
+        if max_jump is not None:
+            delta[np.any(np.abs(delta) > max_jump, axis=1)] = 0
+        return pos - delta * (1 - alpha)
+
+    def _grow(self, capacity: int):
+        """
+        Reallocates all arrays with more rows and rebinds the bodies to the new arrays.
+            :param capacity: The new number of rows.
+        """
+        for name in ('pos', 'prev_pos', 'vel', 'force', 'inv_mass', 'updates', 'kinematic', 'sleeping', 'still_ticks'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        for index, body in enumerate(self.bodies):
+            body.bind(self, index)
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from pyglet.graphics import Batch
+    from pyglet.text import Label
+
+
+class _NullScope(object):
+    """
+    Scope returned while profiling is disabled, it does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _Scope(object):
+    """
+    Times the code in a with block and records it in its Profiler.
+    One object per name is reused, so a scope must not be nested in itself or shared between threads.
+    """
+
+    __slots__ = ('profiler', 'id', 'start')
+
+    def __init__(self, profiler: Profiler, scope_id: int):
+        self.profiler: Profiler = profiler
+        self.id: int = scope_id
+        self.start: float = 0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.record(self.id, self.start, perf_counter())
+        return False
+
+
+_NULL_SCOPE: _NullScope = _NullScope()
+
+
+class Profiler(object):
+    """
+    Records named timing scopes into a fixed size ring buffer.
+
+    Usage:
+
+        with profiler.scope('do_update'):
+            level.do_update(dt)
+
+    While disabled scope returns a shared object that does nothing, so instrumented
+    code costs one attribute check and an empty with block. The ring keeps the last
+    capacity scopes, for percentiles and for exporting Chrome trace-event JSON.
+    """
+
+    def __init__(self, capacity: int = 16384, enabled: bool = False):
+        """
+        Creates a new Profiler.
+            :param capacity: Number of scopes the ring buffer keeps.
+            :param enabled: If scopes are recorded from the start.
+        """
+        self.capacity: int = capacity
+        self.enabled: bool = enabled
+        self.names: [str] = []  # name of every scope id
+        self._scopes: {str: _Scope} = {}
+        self._epoch: float = perf_counter()  # time 0 of the exported traces
+
+        # RING BUFFER #
+        self._ids: [int] = [0] * capacity
+        self._starts: [float] = [0.0] * capacity
+        self._durations: [float] = [0.0] * capacity
+        self._threads: [int] = [0] * capacity
+        self._next: int = 0  # scopes recorded in total
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._next = 0
+
+    def scope(self, name: str) -> _Scope | _NullScope:
+        """
+        The timing scope of a name, use it in a with statement.
+            :param name: Name of the timed code.
+        """
+        if not self.enabled:
+            return _NULL_SCOPE
+        scope = self._scopes.get(name)
+        if scope is None:
+            scope = self._scopes[name] = _Scope(self, len(self.names))
+            self.names.append(name)
+        return scope
+
+    def record(self, scope_id: int, start: float, end: float):
+        """
+        Stores one timed scope, overwriting the oldest one when the ring is full.
+        """
+        i = self._next % self.capacity
+        self._ids[i] = scope_id
+        self._starts[i] = start
+        self._durations[i] = end - start
+        self._threads[i] = threading.get_ident()
+        self._next += 1
+
+    def _recorded(self) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+        """
+        The recorded scopes in the order they ended.
+            :return: ids, starts, durations and thread idents.
+        """
+        count = min(self._next, self.capacity)
+        order = (np.arange(count) + (self._next - count)) % self.capacity
+        return (np.array(self._ids)[order], np.array(self._starts)[order], np.array(self._durations)[order],
+                np.array(self._threads, dtype=np.uint64)[order])
+
+    def stats(self) -> {str: {str: float}}:
+        """
+        Durations of the scopes in the ring buffer.
+            :return: Dict of scope name to count, mean, p50, p99 and max, in seconds.
+        """
+        ids, _, durations, _ = self._recorded()
+        stats = {}
+        for scope_id, name in enumerate(self.names):
+            times = durations[ids == scope_id]
+            if len(times):
+                p50, p99 = np.percentile(times, (50, 99))
+                stats[name] = {'count': len(times), 'mean': float(times.mean()), 'p50': float(p50),
+                               'p99': float(p99), 'max': float(times.max())}
+        return stats
+
+    def chrome_trace(self) -> {str}:
+        """
+        The recorded scopes as Chrome trace-event JSON, for chrome://tracing or Perfetto.
+        """
+        ids, starts, durations, threads = self._recorded()
+        events = [{'name': self.names[scope_id], 'ph': 'X', 'ts': (start - self._epoch) * 1e6,
+                   'dur': duration * 1e6, 'pid': 0, 'tid': thread}
+                  for scope_id, start, duration, thread in zip(ids.tolist(), starts.tolist(), durations.tolist(),
+                                                               threads.tolist())]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path: str):
+        """
+        Writes chrome_trace to a file.
+            :param path: Path of the JSON file.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, mode='w') as trace:
+            json.dump(self.chrome_trace(), trace)
+
+
+profiler: Profiler = Profiler()  # the profiler of the game, disabled unless the profiling setting is On
+
+
+class ProfilerOverlay(object):
+    """
+    Text in the overlay batch with the p50 and p99 of every scope, refreshed periodically.
+    """
+
+    def __init__(self, batch: Batch, x: float, y: float, profiler_: Profiler = None):
+        """
+        Creates the overlay Label.
+            :param batch: The batch to draw in.
+            :param x: Left edge of the text.
+            :param y: Bottom edge of the text.
+            :param profiler_: The shown profiler, the game profiler if None.
+        """
+        from pyglet.text import Label
+
+        self.profiler: Profiler = profiler if profiler_ is None else profiler_
+        self.label: Label = Label('', font_name='Courier New', font_size=12, multiline=True, width=480,
+                                  anchor_y='bottom', x=x, y=y, batch=batch, color=(255, 255, 0, 255))
+
+    def refresh(self, dt: float = None):
+        """
+        Updates the text from the current stats, meant for clock.schedule_interval.
+        """
+        lines = [f'{"scope":22}{"p50 ms":>9}{"p99 ms":>9}']
+        for name, stats in self.profiler.stats().items():
+            lines.append(f'{name:22}{stats["p50"] * 1e3:9.3f}{stats["p99"] * 1e3:9.3f}')
+        self.label.text = '\n'.join(lines)
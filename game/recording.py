@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from game.input import ActionTable
+from game.level import Level
+from game.settings import Settings
+
+
+class SessionRecorder(object):
+    """
+    Records the inputs and periodic states of a game session into a compact binary file.
+
+    Every tick stores one byte per player with a bit per action in ACTIONS, every
+    keyframe_interval ticks the state of all players is stored as STATE_FIELDS. The file
+    is append-only: a header followed by chunks, each a CHUNK header and an 8 byte aligned
+    payload, so every chunk can be read straight from a memory map, see Recording.
+    Keyframes are delta encoded by XORing the bits of each one with the one before it
+    in the same chunk, so slowly changing states are mostly zero bits.
+
+    Actions are set by the input handling of a tick with record, the recorder is registered
+    as an update hook of the level and closes the tick after every step.
+    """
+
+    MAGIC: bytes = b'AITGREC\x01'
+    VERSION: int = 1
+    # magic, version, players, keyframe interval, state fields, dt, level name, window width and height
+    HEADER: struct.Struct = struct.Struct('<8sHHHHd32sHH4x')
+    CHUNK: struct.Struct = struct.Struct('<4sIQQ')  # kind, count, first tick, payload size
+    ACTIONS_CHUNK: bytes = b'ACTS'  # uint8 (count, players) action bits
+    KEYFRAMES_CHUNK: bytes = b'KEYF'  # uint64 (count, players, fields) XOR deltas of float64 states
+
+    ACTIONS: (str,) = ActionTable.ACTIONS  # bit i is set if ACTIONS[i] was done
+    STATE_FIELDS: (str,) = ('x', 'y', 'dx', 'dy', 'health', 'armor', 'health_processed')
+
+    def __init__(self, path: str, level: Level, dt: float, keyframe_interval: int = 60, chunk_ticks: int = 3600):
+        """
+        Creates the recording file and stores the current state as the keyframe of tick 0.
+        The players of the level must have been added already.
+            :param path: Path of the file, it is overwritten.
+            :param level: The recorded level.
+            :param dt: The fixed timestep of the session.
+            :param keyframe_interval: Ticks between keyframes.
+            :param chunk_ticks: Ticks buffered per chunk, rounded down to a multiple of keyframe_interval.
+        """
+        self.path: Path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.level: Level = level
+        self.dt: float = dt
+        self.num_players: int = len(level.players)
+        self.keyframe_interval: int = keyframe_interval
+        self.chunk_ticks: int = max(1, chunk_ticks // keyframe_interval) * keyframe_interval
+        self.tick: int = 0  # ticks recorded so far
+
+        self._pending: np.ndarray = np.zeros(self.num_players, dtype=np.uint8)  # actions of the running tick
+        self._actions: np.ndarray = np.zeros((self.chunk_ticks, self.num_players), dtype=np.uint8)
+        self._action_count: int = 0
+        self._keyframes: np.ndarray = np.zeros((self.chunk_ticks // keyframe_interval + 1, self.num_players,
+                                                len(self.STATE_FIELDS)), dtype=np.float64)
+        self._keyframe_count: int = 0
+        self._keyframe_tick: int = 0  # tick of the first buffered keyframe
+
+        compiled = Settings.compiled()
+        self.file = open(self.path, mode='wb')
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.num_players, keyframe_interval,
+                                         len(self.STATE_FIELDS), dt, level.name.encode()[:32],
+                                         compiled.width, compiled.height))
+        self._keyframe()
+        level.update_hooks.append(self.on_update)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, player: int, bits: int):
+        """
+        Sets the actions of a player in the running tick.
+            :param player: Index of the player in Level.players.
+            :param bits: The action bits, see ACTIONS.
+        """
+        self._pending[player] = bits
+
+    def on_update(self, level: Level):
+        """
+        Closes the running tick, called by the level after every step.
+        """
+        self._actions[self._action_count] = self._pending
+        self._pending[:] = 0
+        self._action_count += 1
+        self.tick += 1
+        if self.tick % self.keyframe_interval == 0:
+            self._keyframe()
+        if self._action_count == self.chunk_ticks:
+            self.flush()
+
+    def _keyframe(self):
+        self.capture_state(self.level, self._keyframes[self._keyframe_count])
+        self._keyframe_count += 1
+
+    @staticmethod
+    def capture_state(level: Level, out: np.ndarray = None) -> np.ndarray:
+        """
+        Reads the state of all players of a level.
+            :param level: The level.
+            :param out: (players, STATE_FIELDS) array to write into, a new one if None.
+            :return: The state.
+        """
+        if out is None:
+            out = np.zeros((len(level.players), len(SessionRecorder.STATE_FIELDS)))
+        indexes = [player._index for player in level.players]
+        out[:, 0:2] = level.world.pos[indexes]
+        out[:, 2:4] = level.world.vel[indexes]
+        out[:, 4:7] = [(player.health, player._armor, player.health_processed) for player in level.players]
+        return out
+
+    @staticmethod
+    def apply_state(level: Level, state: np.ndarray):
+        """
+        Sets the state of all players of a level, the reverse of capture_state.
+            :param level: The level.
+            :param state: (players, STATE_FIELDS) array.
+        """
+        indexes = [player._index for player in level.players]
+        level.world.pos[indexes] = state[:, 0:2]
+        level.world.prev_pos[indexes] = state[:, 0:2]
+        level.world.vel[indexes] = state[:, 2:4]
+        for player, (health, armor, health_processed) in zip(level.players, state[:, 4:7].tolist()):
+            player._health = int(health)
+            player._armor = int(armor)
+            player.health_processed = bool(health_processed)
+
+    def _write_chunk(self, kind: bytes, first_tick: int, data: np.ndarray):
+        payload = data.tobytes()
+        self.file.write(self.CHUNK.pack(kind, len(data), first_tick, len(payload)))
+        self.file.write(payload)
+        self.file.write(bytes(-len(payload) % 8))  # keeps the next chunk 8 byte aligned
+
+    def flush(self):
+        """
+        Appends the buffered ticks and keyframes to the file as chunks.
+        """
+        if self._action_count:
+            self._write_chunk(self.ACTIONS_CHUNK, self.tick - self._action_count, self._actions[:self._action_count])
+            self._action_count = 0
+        if self._keyframe_count:
+            states = self._keyframes[:self._keyframe_count].view(np.uint64)
+            deltas = states.copy()
+            deltas[1:] ^= states[:-1]
+            self._write_chunk(self.KEYFRAMES_CHUNK, self._keyframe_tick, deltas)
+            self._keyframe_tick += self._keyframe_count * self.keyframe_interval
+            self._keyframe_count = 0
+        self.file.flush()
+
+    def close(self):
+        """
+        Writes the remaining ticks, unregisters from the level and closes the file.
+        """
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        if self.on_update in self.level.update_hooks:
+            self.level.update_hooks.remove(self.on_update)
+
+
+class Recording(object):
+    """
+    Read access to a file written by a SessionRecorder.
+
+    The file is memory mapped and the chunks are NumPy views of the map, a chunk cut off
+    by a crash while recording is ignored.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens a recording.
+            :param path: Path of the file.
+            :raise ValueError: If the file is not a recording.
+        """
+        self.path: Path = Path(path)
+        with open(self.path, mode='rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = SessionRecorder.HEADER
+        if len(self._map) < header.size:
+            raise ValueError(f'{self.path} is too short to be a recording')
+        magic, version, num_players, interval, num_fields, dt, level_name, width, height = \
+            header.unpack_from(self._map)
+        if magic != SessionRecorder.MAGIC or version != SessionRecorder.VERSION:
+            raise ValueError(f'{self.path} is not a version {SessionRecorder.VERSION} recording')
+
+        self.num_players: int = num_players
+        self.keyframe_interval: int = interval
+        self.dt: float = dt
+        self.level_name: str = level_name.rstrip(b'\0').decode()
+        self.resolution: (int, int) = (width, height)
+        self.action_chunks: [(int, np.ndarray)] = []  # (first tick, uint8 (ticks, players)) per chunk
+        self.keyframe_chunks: [(int, np.ndarray)] = []  # (first tick, uint64 XOR deltas) per chunk
+
+        chunk = SessionRecorder.CHUNK
+        offset = header.size
+        while offset + chunk.size <= len(self._map):
+            kind, count, first_tick, size = chunk.unpack_from(self._map, offset)
+            offset += chunk.size
+            if offset + size > len(self._map):
+                break
+            if kind == SessionRecorder.ACTIONS_CHUNK:
+                data = np.frombuffer(self._map, dtype=np.uint8, count=size, offset=offset)
+                self.action_chunks.append((first_tick, data.reshape(count, num_players)))
+            elif kind == SessionRecorder.KEYFRAMES_CHUNK:
+                data = np.frombuffer(self._map, dtype=np.uint64, count=size // 8, offset=offset)
+                self.keyframe_chunks.append((first_tick, data.reshape(count, num_players, num_fields)))
+            offset += size + (-size % 8)
+
+    @property
+    def num_ticks(self) -> int:
+        return sum(len(actions) for _, actions in self.action_chunks)
+
+    @property
+    def duration(self) -> float:
+        """
+        Simulated time of the recording in seconds.
+        """
+        return self.num_ticks * self.dt
+
+    @property
+    def actions(self) -> np.ndarray:
+        """
+        The action bits of every tick, (ticks, players), a view of the map if there is only one chunk.
+        """
+        if len(self.action_chunks) == 1:
+            return self.action_chunks[0][1]
+        if not self.action_chunks:
+            return np.zeros((0, self.num_players), dtype=np.uint8)
+        return np.concatenate([actions for _, actions in self.action_chunks])
+
+    def keyframes(self) -> (np.ndarray, np.ndarray):
+        """
+        Decodes all keyframes.
+            :return: The tick of every keyframe, and the (keyframes, players, STATE_FIELDS) float64 states.
+        """
+        ticks, states = [], []
+        for first_tick, deltas in self.keyframe_chunks:
+            ticks.append(first_tick + np.arange(len(deltas)) * self.keyframe_interval)
+            states.append(np.bitwise_xor.accumulate(deltas, axis=0).view(np.float64))
+        if not states:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.num_players, len(SessionRecorder.STATE_FIELDS)))
+        return np.concatenate(ticks), np.concatenate(states)
+
+    def close(self):
+        self.action_chunks, self.keyframe_chunks = [], []
+        self._map.close()
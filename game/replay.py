@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import multiprocessing
+from time import perf_counter
+
+import numpy as np
+
+from game.core import apply_actions, update
+from game.input import Controls, ReplayInput
+from game.level import BlockPlace, Level, Player
+from game.levelfile import levels
+from game.recording import Recording, SessionRecorder
+from game.settings import Settings
+
+# level factories by Level.name, used to rebuild the level of a recording, other levels are looked up in levels
+LEVELS: {str: ()} = {
+    'Default Level': Level,
+    'Block Place': BlockPlace,
+}
+
+
+class ReplayResult(object):
+    """
+    Outcome of replaying one recording.
+    """
+
+    def __init__(self, path: str, ticks: int, sim_time: float, wall_time: float, keyframes: int,
+                 mismatches: [(int, int, str, float, float)]):
+        """
+        Creates a new ReplayResult.
+            :param path: Path of the recording.
+            :param ticks: Ticks replayed.
+            :param sim_time: Simulated time of the replayed ticks.
+            :param wall_time: Real time the replay took.
+            :param keyframes: Keyframes compared with the replayed state.
+            :param mismatches: (tick, player, field, recorded, replayed) of every differing value.
+        """
+        self.path: str = str(path)
+        self.ticks: int = ticks
+        self.sim_time: float = sim_time
+        self.wall_time: float = wall_time
+        self.keyframes: int = keyframes
+        self.mismatches: [(int, int, str, float, float)] = mismatches
+
+    @property
+    def deterministic(self) -> bool:
+        return not self.mismatches
+
+    @property
+    def speedup(self) -> float:
+        """
+        How many times faster than real time the recording was replayed.
+        """
+        return self.sim_time / self.wall_time if self.wall_time > 0 else float('inf')
+
+    def __repr__(self):
+        return (f'ReplayResult({self.path}, ticks={self.ticks}, speedup={self.speedup:.1f}x, '
+                f'keyframes={self.keyframes}, mismatches={len(self.mismatches)})')
+
+
+def replay(path: str, verify: bool = True, tolerance: float = 0, hooks: [(Level,)] = None) -> ReplayResult:
+    """
+    Replays a recording without a window as fast as possible.
+
+    The level of the recording is rebuilt and set to the state of its first keyframe,
+    then the recorded actions of every tick go through Controls, apply_actions and update,
+    just like the keys of a rendered game, with the recorded fixed dt.
+        :param path: Path of the recording.
+        :param verify: If the replayed state is compared with every keyframe.
+        :param tolerance: Largest absolute difference of a state value that still matches.
+        :param hooks: Level update hooks to register, for example an ObservationEncoder to regenerate training data.
+        :return: The result, mismatches are reported there instead of raised.
+        :raise ValueError: If the level of the recording is unknown.
+    """
+    recording = Recording(path)
+    try:
+        ticks, states = recording.keyframes()
+        actions = recording.actions.tolist()
+        level_name, num_players, resolution, dt = \
+            recording.level_name, recording.num_players, recording.resolution, recording.dt
+    finally:
+        recording.close()
+    if Settings.settings is None:
+        Settings.init(headless=True)
+    level_factory = LEVELS.get(level_name)
+    if level_factory is None:
+        level_file = levels.find(level_name)
+        if level_file is None:
+            raise ValueError(f"{path} was recorded in unknown level '{level_name}'")
+        level_factory = lambda: levels.build(level_file)
+
+    # positions are in pixels, so the level is built for the resolution it was recorded in
+    current_resolution = Settings.settings['window_resolution']
+    Settings.settings['window_resolution'] = '{}x{}'.format(*resolution)
+    try:
+        level: Level = level_factory()
+        for _ in range(num_players):
+            level.add(Player())
+        SessionRecorder.apply_state(level, states[0])
+
+        checks = {int(tick): i for i, tick in enumerate(ticks) if tick > 0} if verify else {}
+        replayed = np.zeros(states.shape[1:])
+        mismatches = []
+        tick = 0
+
+        def check(checked: Level):
+            """
+            Compares the state with the keyframe of the tick, at the same point of the step the recorder took it.
+            """
+            if tick in checks:
+                expected = states[checks[tick]]
+                SessionRecorder.capture_state(checked, replayed)
+                for player, field in zip(*np.nonzero(np.abs(replayed - expected) > tolerance)):
+                    mismatches.append((tick, int(player), SessionRecorder.STATE_FIELDS[field],
+                                       float(expected[player, field]), float(replayed[player, field])))
+
+        level.update_hooks.extend(hooks or ())
+        if checks:
+            level.update_hooks.append(check)
+
+        controls = Controls(num_players, [ReplayInput(actions)])
+        start = perf_counter()
+        for tick in range(1, len(actions) + 1):
+            apply_actions(level, controls.poll())
+            update(level, dt)
+        wall_time = perf_counter() - start
+    finally:
+        Settings.settings['window_resolution'] = current_resolution
+
+    return ReplayResult(path, len(actions), len(actions) * dt, wall_time, len(checks), mismatches)
+
+
+def replay_many(paths: [str], processes: int = None, verify: bool = True, tolerance: float = 0) -> [ReplayResult]:
+    """
+    Replays many recordings in a pool of worker processes.
+        :param paths: Paths of the recordings.
+        :param processes: Number of worker processes, one per CPU if None.
+        :param verify: If the replayed states are compared with the keyframes.
+        :param tolerance: Largest absolute difference of a state value that still matches.
+        :return: The results, in the order of paths.
+    """
+    arguments = [(path, verify, tolerance) for path in paths]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.starmap(replay, arguments)
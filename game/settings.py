@@ -1,15 +1,118 @@
 from __future__ import annotations
 
-from os import walk
 from os.path import exists
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from pyglet import resource
-from pyglet.window import Window
-from screeninfo import get_monitors
-
+from game.manifest import ResourceManifest
 from game.utility import Vector2D
 
+if TYPE_CHECKING:  # pyglet and screeninfo are only imported when a window is created
+    from types import ModuleType
+
+    from pyglet.window import Window
+
+
+def _monitor_resolution() -> str:
+    """
+    Resolution of the main monitor, or 1920x1080 on machines without a display.
+        :return: The resolution formatted as a window_resolution setting.
+    """
+    try:
+        from screeninfo import get_monitors, ScreenInfoError
+    except ImportError:
+        return '1920x1080'
+    try:
+        monitor = get_monitors()[0]
+    except (ScreenInfoError, IndexError):
+        return '1920x1080'
+    return f'{monitor.width}x{monitor.height}'
+
+
+class SettingsDict(dict):
+    """
+    Dictionary of string settings that drops the compiled settings whenever it is changed.
+    """
+
+    def __setitem__(self, key, value):
+        super(SettingsDict, self).__setitem__(key, value)
+        Settings.invalidate()
+
+    def __delitem__(self, key):
+        super(SettingsDict, self).__delitem__(key)
+        Settings.invalidate()
+
+    def update(self, *args, **kwargs):
+        super(SettingsDict, self).update(*args, **kwargs)
+        Settings.invalidate()
+
+    def pop(self, *args):
+        value = super(SettingsDict, self).pop(*args)
+        Settings.invalidate()
+        return value
+
+    def clear(self):
+        super(SettingsDict, self).clear()
+        Settings.invalidate()
+
+
+class CompiledSettings(object):
+    """
+    Typed and validated form of the string settings, with the screen metrics derived from them.
+
+    Built by Settings.compiled and rebuilt after any setting changes, the values
+    (including the gravity Vector2D) are shared and must not be modified.
+    """
+
+    def __init__(self, settings: {str}):
+        """
+        Compiles a dictionary of string settings.
+            :param settings: The settings, as loaded from the config file.
+            :raise ValueError: If a setting has an invalid value.
+        """
+        resolution = settings['window_resolution'].lower()
+        if resolution == 'auto':  # the monitor is only probed when a window is created
+            resolution = Settings.monitor_resolution or '1920x1080'
+        resolution = resolution.split('x')
+        try:
+            width, height = int(resolution[0]), int(resolution[1])
+        except (ValueError, IndexError):
+            width, height = 0, 0
+        if len(resolution) != 2 or width <= 0 or height <= 0:
+            raise ValueError(f"window_resolution must be Auto or look like 1920x1080, "
+                             f"not '{settings['window_resolution']}'")
+
+        # TYPED SETTINGS #
+        self.width: int = width
+        self.height: int = height
+        self.vsync: bool = Settings.parse_switch('vsync', settings['vsync'])
+        self.fullscreen: bool = str(settings['window_style']).lower() == 'fullscreen'
+        self.record_sessions: bool = Settings.parse_switch('record_sessions', settings.get('record_sessions', 'Off'))
+        self.profiling: bool = Settings.parse_switch('profiling', settings.get('profiling', 'Off'))
+        self.tick_rate: int = Settings.parse_int('tick_rate', settings.get('tick_rate', '60'), minimum=1)
+        self.max_frame_steps: int = Settings.parse_int('max_frame_steps', settings.get('max_frame_steps', '5'),
+                                                       minimum=1)
+        self.sleep_ticks: int = Settings.parse_int('sleep_ticks', settings.get('sleep_ticks', '30'), minimum=0)
+        self.threaded_simulation: bool = Settings.parse_switch('threaded_simulation',
+                                                               settings.get('threaded_simulation', 'Off'))
+        self.input_delay: int = Settings.parse_int('input_delay', settings.get('input_delay', '2'), minimum=0)
+        self.rollback_window: int = Settings.parse_int('rollback_window', settings.get('rollback_window', '8'),
+                                                       minimum=1)
+
+        # DERIVED VALUES #
+        self.tick_dt: float = 1 / self.tick_rate  # fixed timestep of the simulation
+        self.scale_x: float = 1920 / width  # scale of images made for 1920x1080
+        self.scale_y: float = 1080 / height
+        self.gravity: Vector2D = Vector2D(0, -80 / 1080 * 9.8 * height)  # measured in pixels/second/second
+        self.player_width: float = 80 / 1920 * width
+        self.player_height: float = 80 / 1080 * height
+        self.player_speed: float = 600 / 1080 * height  # measured in pixels/second
+        self.sleep_velocity: float = 6 / 1080 * height  # bodies slower than this rest, in pixels/second
+        self.min_x: float = -self.player_width  # bounds players wrap around at
+        self.min_y: float = -self.player_height
+        self.max_x: float = width + self.player_width
+        self.max_y: float = height + self.player_height
+
 
 class Settings:
     """
@@ -19,19 +122,25 @@ class Settings:
 
     # "GLOBAL" VARIABLES/REFERENCES #
     global_resource_path: Path = Path('resources').absolute()  # base path for all game resources
-    global_resource_sub_folders: [str] = [x[0] for x in walk(str(global_resource_path))]
+    global_resource_manifest: ResourceManifest = None  # index of the resources, loaded by manifest
+    global_cache_path: Path = Path('.cache').absolute()  # files derived from the resources
     global_main_window: Window = None  # Window for the game to render on
+    global_recording_path: Path = Path('recordings').absolute()  # where recorded sessions are saved
+    global_profile_path: Path = Path('profiles').absolute()  # where profiler traces are saved
 
     # CONSTANTS #
-    constant_g: () = lambda: Vector2D(0, -80 / 1080 * 9.8 * int(
-        Settings.settings['window_resolution'].split('x')[1]))  # measured in pixels/second/second
+    constant_g: () = lambda: Settings.compiled().gravity  # measured in pixels/second/second
 
     # SETTINGS VARS #
     file_path: str = str(Path('resources/config.txt').absolute())
     file_split: str = '='  # integral to file formatting and reading
 
     # SETTINGS DICT #
-    settings: {str} = None  # loaded at runtime
+    settings: SettingsDict = None  # loaded at runtime
+    _compiled: CompiledSettings = None  # compiled form of settings, None when it has to be rebuilt
+    _compiled_from: SettingsDict = None  # the dict _compiled was built from
+    monitor_resolution: str = None  # probed when the window is created, used for an Auto window_resolution
+    _resources_indexed: bool = False  # if pyglet knows the resource folders
 
     # DEFAULTS #
     _default_settings: {str} = {
@@ -49,27 +158,48 @@ class Settings:
         'fire_right_2': 'NUM_9',
         'fire_left_2': 'NUM_7',
         'dodge_2': 'RSHIFT',
-        'window_resolution': f'{get_monitors()[0].width}x{get_monitors()[0].height}',
+        'window_resolution': 'Auto',
         'window_style': 'Fullscreen',
         'vsync': 'On',
+        'tick_rate': '60',
+        'max_frame_steps': '5',
+        'record_sessions': 'Off',
+        'profiling': 'Off',
+        'sleep_ticks': '30',
+        'threaded_simulation': 'Off',
+        'input_delay': '2',
+        'rollback_window': '8',
     }
 
     @staticmethod
-    def init():
+    def init(headless: bool = False):
+        """
+        Loads the settings, and creates the main window.
+        Resources, the monitor and pyglet are only touched when a window is created.
+            :param headless: If True no window is created, for running the simulation without a display.
+        """
         if not exists(Settings.file_path):
             Settings.set_default()
             Settings.save_new()
+        else:
+            Settings.load()
+            missing = [name for name in Settings._default_settings if name not in Settings.settings]
+            if missing:  # settings added since the file was written
+                Settings.set_default(missing)
+                Settings.save()
 
-        Settings.set_default()
-        Settings.save()
-        Settings.load()
+        if headless:
+            return
 
-        Settings.pyglet_reindex(Settings.global_resource_sub_folders)  # tell pyglet where to look for resources
-        Settings.global_main_window = Window(width=int(Settings.settings['window_resolution'].split('x')[0]),
-                                             height=int(Settings.settings['window_resolution'].split('x')[1]),
-                                             vsync=str(Settings.settings['vsync']).lower() == 'on',
-                                             fullscreen=str(Settings.settings['window_style']).lower() == 'fullscreen',
-                                             caption='ShooterGame', visible=False)
+        Settings.monitor_resolution = _monitor_resolution()
+        Settings.invalidate()
+        resource = Settings.pyglet_resource()  # tell pyglet where to look for resources
+
+        from pyglet.window import Window
+
+        compiled = Settings.compiled()
+        Settings.global_main_window = Window(width=compiled.width, height=compiled.height, vsync=compiled.vsync,
+                                             fullscreen=compiled.fullscreen, caption='ShooterGame', visible=False)
         Settings.global_main_window.set_icon(resource.image('logo.png'))  # further window config
 
     @staticmethod
@@ -84,7 +214,8 @@ class Settings:
             for line in config_r:
                 setting = line.split(Settings.file_split, maxsplit=1)
                 settings[setting[0].strip()] = setting[1].strip()
-        Settings.settings = settings
+        Settings.settings = SettingsDict(settings)
+        Settings.compiled()  # validates the loaded settings
 
     @staticmethod
     def save():
@@ -116,11 +247,86 @@ class Settings:
             :param names The list of config names to reset to their default values.
         """
         if names is None:
-            Settings.settings = Settings._default_settings
+            Settings.settings = SettingsDict(Settings._default_settings)
         else:
             for name in names:
                 Settings.settings[name] = Settings._default_settings[name]
 
+    @staticmethod
+    def compiled() -> CompiledSettings:
+        """
+        The typed settings and derived screen metrics, compiled once per change of the settings.
+            :return: The CompiledSettings of the current settings.
+        """
+        if Settings._compiled is None or Settings._compiled_from is not Settings.settings:
+            Settings._compiled = CompiledSettings(Settings.settings)
+            Settings._compiled_from = Settings.settings
+        return Settings._compiled
+
+    @staticmethod
+    def invalidate():
+        """
+        Drops the compiled settings, they are rebuilt the next time they are used.
+        """
+        Settings._compiled = None
+
+    @staticmethod
+    def parse_switch(name: str, value: str) -> bool:
+        """
+        Reads an On/Off setting.
+            :param name: Name of the setting, for the error message.
+            :param value: The value of the setting.
+            :return: True for On, False for Off.
+            :raise ValueError: For other values.
+        """
+        value = str(value).lower()
+        if value in ('on', 'true', '1'):
+            return True
+        elif value in ('off', 'false', '0'):
+            return False
+        raise ValueError(f"{name} must be On or Off, not '{value}'")
+
+    @staticmethod
+    def parse_int(name: str, value: str, minimum: int = None) -> int:
+        """
+        Reads a whole number setting.
+            :param name: Name of the setting, for the error message.
+            :param value: The value of the setting.
+            :param minimum: Smallest allowed value.
+            :return: The number.
+            :raise ValueError: If the value is not a number or is too small.
+        """
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a whole number, not '{value}'")
+        if minimum is not None and number < minimum:
+            raise ValueError(f'{name} must be at least {minimum}, not {number}')
+        return number
+
+    @staticmethod
+    def manifest() -> ResourceManifest:
+        """
+        The index of the resource files, read from its cache the first time it is needed.
+            :return: The ResourceManifest of global_resource_path.
+        """
+        if Settings.global_resource_manifest is None:
+            Settings.global_resource_manifest = ResourceManifest(
+                Settings.global_resource_path, Settings.global_cache_path.joinpath('resource_manifest.json'))
+        return Settings.global_resource_manifest
+
+    @staticmethod
+    def pyglet_resource() -> ModuleType:
+        """
+        pyglet.resource, with the resource folders added to its path the first time it is needed.
+        """
+        from pyglet import resource
+
+        if not Settings._resources_indexed:
+            Settings.pyglet_reindex(Settings.manifest().folders)
+            Settings._resources_indexed = True
+        return resource
+
     @staticmethod
     def pyglet_reindex(sub_folders_add: [str] = None, sub_folders_remove: [str] = None):
         """
@@ -129,6 +335,8 @@ class Settings:
             :param sub_folders_add: list of folder names to add.
             :param sub_folders_remove: list of folder names to remove.
         """
+        from pyglet import resource
+
         if sub_folders_add is not None:
             for folder in sub_folders_add:
                 if folder not in resource.path:
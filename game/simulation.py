@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import threading
+from time import perf_counter, sleep
+
+import numpy as np
+
+
+class FixedStepScheduler(object):
+    """
+    Runs a simulation step function at a fixed timestep, independent of the frame rate.
+
+    Rendered games feed the variable frame time into advance, which runs as many whole
+    steps as have accumulated and leaves the remainder for interpolating the drawing.
+    Headless games call run, which steps either as fast as possible or in real time.
+    """
+
+    def __init__(self, step: (float,), dt: float = 1 / 60, max_steps: int = 5):
+        """
+        Creates a new FixedStepScheduler.
+            :param step: Function doing one simulation step, it is given dt.
+            :param dt: Simulated time of every step.
+            :param max_steps: Most steps run per advance, so slow frames can not spiral into ever more steps.
+        """
+        self.step: (float,) = step
+        self.dt: float = dt
+        self.max_steps: int = max_steps
+        self.accumulator: float = 0  # frame time not yet simulated
+        self.steps: int = 0  # steps run in total
+        self.dropped_time: float = 0  # frame time thrown away because of max_steps
+
+    @property
+    def alpha(self) -> float:
+        """
+        How far the real time is between the last two steps, for interpolating positions.
+            :return: A fraction in [0, 1).
+        """
+        return self.accumulator / self.dt
+
+    @property
+    def time(self) -> float:
+        """
+        The simulated time so far.
+        """
+        return self.steps * self.dt
+
+    def advance(self, frame_dt: float) -> int:
+        """
+        Adds the time of a frame and runs all whole steps that fit into the accumulated time.
+            :param frame_dt: Real time since the last frame.
+            :return: Number of steps run.
+        """
+        self.accumulator += frame_dt
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.max_steps:
+            self.step(self.dt)
+            self.accumulator -= self.dt
+            steps += 1
+        if self.accumulator >= self.dt:  # too far behind, slow down instead of catching up
+            self.dropped_time += self.accumulator - self.accumulator % self.dt
+            self.accumulator %= self.dt
+        self.steps += steps
+        return steps
+
+    def run(self, steps: int, realtime: bool = False) -> float:
+        """
+        Runs a number of steps without a window.
+            :param steps: Number of steps to run.
+            :param realtime: If True the steps are paced to real time, otherwise they run as fast as possible.
+            :return: Real time the steps took.
+        """
+        start = perf_counter()
+        step, dt = self.step, self.dt
+        for i in range(steps):
+            step(dt)
+            if realtime:
+                ahead = start + (i + 1) * dt - perf_counter()
+                if ahead > 0:
+                    sleep(ahead)
+        self.steps += steps
+        return perf_counter() - start
+
+
+class RateCounter(object):
+    """
+    Counts events, like simulation steps or drawn frames, and measures how many happen per second.
+    One thread may count while another samples, the count is only ever written by tick.
+    """
+
+    def __init__(self):
+        self.count: int = 0  # events in total
+        self.rate: float = 0  # events per second between the last two samples
+        self._sampled_count: int = 0
+        self._sampled_at: float = perf_counter()
+
+    def tick(self, count: int = 1):
+        self.count += count
+
+    def sample(self) -> float:
+        """
+        Measures the rate since the last sample, meant to be called periodically.
+            :return: Events per second.
+        """
+        now, count = perf_counter(), self.count
+        if now > self._sampled_at:
+            self.rate = (count - self._sampled_count) / (now - self._sampled_at)
+        self._sampled_count, self._sampled_at = count, now
+        return self.rate
+
+
+class Frame(object):
+    """
+    The state of one published simulation step, everything drawing needs and nothing else.
+
+    Frames are handed out by FrameBuffer.latest and belong to the reader until its next
+    call of latest, their arrays are read-only and not touched by the simulation until then.
+    """
+
+    __slots__ = ('tick', 'time', 'dt', 'bodies', 'prev_pos', 'pos', 'health')
+
+    def __init__(self):
+        self.tick: int = 0  # steps simulated before this frame
+        self.time: float = 0  # perf_counter time the step is due at in real time
+        self.dt: float = 0  # simulated time of the step
+        self.bodies: tuple = ()  # the physical objects the rows of the arrays belong to
+        self.prev_pos: np.ndarray = np.zeros((0, 2))  # positions of the bodies before the step
+        self.pos: np.ndarray = np.zeros((0, 2))  # positions of the bodies after the step
+        self.health: (int,) = ()  # health of every player
+
+    def alpha(self, now: float = None) -> float:
+        """
+        How far the real time is past this step, for interpolating positions like FixedStepScheduler.alpha.
+            :param now: perf_counter time, the current time if None.
+            :return: A fraction in [0, 1], 1 if the simulation fell behind.
+        """
+        if self.dt <= 0:
+            return 1
+        return min(max(((perf_counter() if now is None else now) - self.time) / self.dt, 0), 1)
+
+
+class FrameBuffer(object):
+    """
+    Triple buffer handing the state of the simulation to the renderer without either waiting for the other.
+
+    The simulation writes into the back Frame and swaps it with the middle one, the renderer
+    swaps the middle Frame with its front one whenever a newer one was published. Both only
+    hold the lock for the swap, the arrays of the Frames are reused so publishing does not allocate.
+    """
+
+    def __init__(self):
+        self._front: Frame = Frame()  # read by the renderer
+        self._middle: Frame = Frame()  # the last published frame
+        self._back: Frame = Frame()  # written by the simulation
+        self._fresh: bool = False  # if the middle frame is newer than the front one
+        self._lock: threading.Lock = threading.Lock()
+        self.published: int = 0  # frames published in total
+
+    def publish(self, tick: int, time: float, dt: float, bodies: tuple, prev_pos: np.ndarray, pos: np.ndarray,
+                health: (int,)):
+        """
+        Copies the state of a step into the back frame and makes it the latest one, called by the simulation.
+            :param tick: Steps simulated so far.
+            :param time: perf_counter time the step is due at.
+            :param dt: Simulated time of the step.
+            :param bodies: The physical objects of the positions.
+            :param prev_pos: (n, 2) positions before the step.
+            :param pos: (n, 2) positions after the step.
+            :param health: Health of every player.
+        """
+        frame = self._back
+        if frame.pos.shape != pos.shape:
+            frame.prev_pos = np.empty_like(pos)
+            frame.pos = np.empty_like(pos)
+        frame.prev_pos.flags.writeable = True
+        frame.pos.flags.writeable = True
+        np.copyto(frame.prev_pos, prev_pos)
+        np.copyto(frame.pos, pos)
+        frame.prev_pos.flags.writeable = False
+        frame.pos.flags.writeable = False
+        frame.tick, frame.time, frame.dt, frame.bodies, frame.health = tick, time, dt, bodies, tuple(health)
+        with self._lock:
+            self._back, self._middle = self._middle, frame
+            self._fresh = True
+            self.published += 1
+
+    def latest(self) -> Frame | None:
+        """
+        The newest published frame, called by the renderer.
+            :return: The frame, None before the first one was published.
+        """
+        with self._lock:
+            if self._fresh:
+                self._front, self._middle = self._middle, self._front
+                self._fresh = False
+        return self._front if self.published else None
+
+
+class SimulationThread(threading.Thread):
+    """
+    Runs a step function at a fixed rate on its own thread, so slow frames do not delay the simulation.
+
+    After every advance with at least one step the publish function is called, with the lock held,
+    to hand the state to the renderer, usually into a FrameBuffer. Other threads must hold the lock
+    while they change the simulated objects. An exception in a step stops the thread and is kept in error.
+    """
+
+    def __init__(self, step: (float,), publish: (int, float), dt: float = 1 / 60, max_steps: int = 5):
+        """
+        Creates the thread, it runs once start is called.
+            :param step: Function doing one simulation step, it is given dt.
+            :param publish: Function given the steps run so far and the perf_counter time the last step is due at.
+            :param dt: Simulated time of every step.
+            :param max_steps: Most steps run at once after the thread fell behind.
+        """
+        super(SimulationThread, self).__init__(name='simulation', daemon=True)
+        self.scheduler: FixedStepScheduler = FixedStepScheduler(step, dt=dt, max_steps=max_steps)
+        self.publish: (int, float) = publish
+        self.lock: threading.Lock = threading.Lock()  # held while stepping
+        self.error: BaseException = None  # what stopped the thread
+        self._stop_requested: threading.Event = threading.Event()
+
+    def run(self):
+        scheduler = self.scheduler
+        last = perf_counter()
+        try:
+            while not self._stop_requested.is_set():
+                now = perf_counter()
+                with self.lock:
+                    steps = scheduler.advance(now - last)
+                    if steps:
+                        self.publish(scheduler.steps, now - scheduler.accumulator)
+                last = now
+                wait = scheduler.dt - scheduler.accumulator - (perf_counter() - now)
+                if wait > 0:
+                    self._stop_requested.wait(wait)
+        except BaseException as e:
+            self.error = e
+
+    def stop(self, timeout: float = None):
+        """
+        Stops the thread after its current step and waits for it.
+            :param timeout: Most seconds to wait, forever if None.
+        """
+        self._stop_requested.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -12,41 +12,64 @@ __status__ = "Production"
 from collections import namedtuple
 from math import *
 from random import *
+from typing import TYPE_CHECKING
 
-from pyglet.image import TextureRegion
+import numpy as np
+
+if TYPE_CHECKING:
+    from pyglet.image import TextureRegion
 
 
 class GeneralUtil:
 
     @staticmethod
     def load_resized_image(img: TextureRegion, width: int = None, height: int = None) -> TextureRegion:
+        """
+        A region of the image drawn at the given size, the image itself is not changed.
+        Sprites should use game.assets.assets.scaled, which caches the regions.
+        """
+        resized = img.get_region(0, 0, img.width, img.height)
         if width is not None:
-            img.width = width
+            resized.width = width
         if height is not None:
-            img.height = height
+            resized.height = height
 
-        return img
+        return resized
 
 
 class Vector2D(object):
     """
     Class that acts as a mathematical 2D vector for physics calculations.
+
+    The components are stored in __slots__ and every operator checks for the common
+    Vector2D and int/float operands first, before falling back to tuples and lists.
+    Hot paths can use the in-place methods (add_scaled, scale, set) to avoid allocating.
     """
 
+    __slots__ = ('x', 'y')
+
     def __init__(self, x=0, y=0):
-        self.x = 0
-        self.y = 0
-        if isinstance(x, tuple) or isinstance(x, list):
+        cls = type(x)
+        if cls is int or cls is float:
+            pass
+        elif isinstance(x, tuple) or isinstance(x, list):
             y = x[1]
             x = x[0]
         elif isinstance(x, Vector2D):
             y = x.y
             x = x.x
 
-        self.set(x, y)
+        self.x = x
+        self.y = y
 
     @staticmethod
-    def random(size=1):
+    def random(size=1, rng: Random = None):
+        """
+        Vector with random components in [0, size).
+            :param size: Upper bound of the components, a number, pair or Vector2D.
+            :param rng: Random generator to draw from, the shared module generator if None.
+        """
+        rand = random if rng is None else rng.random
         sizex = size
         sizey = size
         if isinstance(size, tuple) or isinstance(size, list):
@@ -55,12 +78,13 @@ class Vector2D(object):
         elif isinstance(size, Vector2D):
             sizex = size.x
             sizey = size.y
-        return Vector2D(random() * sizex, random() * sizey)
+        return Vector2D(rand() * sizex, rand() * sizey)
 
     @staticmethod
-    def random_unit_circle():
-        d = random() * pi
-        return Vector2D(cos(d) * choice([1, -1]), sin(d) * choice([1, -1]))
+    def random_unit_circle(rng: Random = None):
+        rng_choice = choice if rng is None else rng.choice
+        d = (random() if rng is None else rng.random()) * pi
+        return Vector2D(cos(d) * rng_choice([1, -1]), sin(d) * rng_choice([1, -1]))
 
     @staticmethod
     def distance(a, b):
@@ -78,6 +102,30 @@ class Vector2D(object):
         self.x = x
         self.y = y
 
+    def add_scaled(self, other, scalar):
+        """
+        Adds other * scalar to this vector in place, without creating a temporary vector.
+            :param other: The Vector2D to add.
+            :param scalar: The number other is multiplied with.
+            :return: This vector.
+        """
+        self.x += other.x * scalar
+        self.y += other.y * scalar
+        return self
+
+    def scale(self, scalar):
+        """
+        Multiplies this vector by a number in place.
+            :param scalar: The number to multiply with.
+            :return: This vector.
+        """
+        self.x *= scalar
+        self.y *= scalar
+        return self
+
+    def copy(self):
+        return Vector2D(self.x, self.y)
+
     def to_arr(self):
         return [self.x, self.y]
 
@@ -88,13 +136,16 @@ class Vector2D(object):
         return self.to_int().to_arr()
 
     def get_normalized(self):
-        if self.get_length() != 0:
-            return self / self.get_length()
+        length = self.get_length()
+        if length != 0:
+            return Vector2D(self.x / length, self.y / length)
         else:
             return Vector2D(0, 0)
 
     def dot_product(self, other):
-        if isinstance(other, Vector2D):
+        if type(other) is Vector2D:
+            return self.x * other.x + self.y * other.y
+        elif isinstance(other, Vector2D):
             return self.x * other.x + self.y * other.y
         elif isinstance(other, tuple) or isinstance(other, list):
             return self.x * other[0] + self.y * other[1]
@@ -102,7 +153,12 @@ class Vector2D(object):
             return NotImplemented
 
     def __add__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is Vector2D:
+            return Vector2D(self.x + other.x, self.y + other.y)
+        elif cls is float or cls is int:
+            return Vector2D(self.x + other, self.y + other)
+        elif isinstance(other, Vector2D):
             return Vector2D(self.x + other.x, self.y + other.y)
         elif isinstance(other, tuple) or isinstance(other, list):
             return Vector2D(self.x + other[0], self.y + other[1])
@@ -112,9 +168,14 @@ class Vector2D(object):
             return NotImplemented
 
     def __sub__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is Vector2D:
             return Vector2D(self.x - other.x, self.y - other.y)
-        if isinstance(other, tuple) or isinstance(other, list):
+        elif cls is float or cls is int:
+            return Vector2D(self.x - other, self.y - other)
+        elif isinstance(other, Vector2D):
+            return Vector2D(self.x - other.x, self.y - other.y)
+        elif isinstance(other, tuple) or isinstance(other, list):
             return Vector2D(self.x - other[0], self.y - other[1])
         elif isinstance(other, int) or isinstance(other, float):
             return Vector2D(self.x - other, self.y - other)
@@ -122,7 +183,10 @@ class Vector2D(object):
             return NotImplemented
 
     def __rsub__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is float or cls is int:
+            return Vector2D(other - self.x, other - self.y)
+        elif isinstance(other, Vector2D):
             return Vector2D(other.x - self.x, other.y - self.y)
         elif isinstance(other, tuple) or isinstance(other, list):
             return Vector2D(other[0] - self.x, other[1] - self.y)
@@ -132,7 +196,12 @@ class Vector2D(object):
             return NotImplemented
 
     def __mul__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is float or cls is int:
+            return Vector2D(self.x * other, self.y * other)
+        elif cls is Vector2D:
+            return Vector2D(self.x * other.x, self.y * other.y)
+        elif isinstance(other, Vector2D):
             return Vector2D(self.x * other.x, self.y * other.y)
         elif isinstance(other, tuple) or isinstance(other, list):
             return Vector2D(self.x * other[0], self.y * other[1])
@@ -142,7 +211,12 @@ class Vector2D(object):
             return NotImplemented
 
     def __floordiv__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is float or cls is int:
+            return Vector2D(self.x // other, self.y // other)
+        elif cls is Vector2D:
+            return Vector2D(self.x // other.x, self.y // other.y)
+        elif isinstance(other, Vector2D):
             return Vector2D(self.x // other.x, self.y // other.y)
         elif isinstance(other, tuple) or isinstance(other, list):
             return Vector2D(self.x // other[0], self.y // other[1])
@@ -152,7 +226,12 @@ class Vector2D(object):
             return NotImplemented
 
     def __truediv__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is float or cls is int:
+            return Vector2D(self.x / other, self.y / other)
+        elif cls is Vector2D:
+            return Vector2D(self.x / other.x, self.y / other.y)
+        elif isinstance(other, Vector2D):
             return Vector2D(self.x / other.x, self.y / other.y)
         elif isinstance(other, tuple) or isinstance(other, list):
             return Vector2D(self.x / other[0], self.y / other[1])
@@ -162,7 +241,10 @@ class Vector2D(object):
             return NotImplemented
 
     def __rdiv__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is float or cls is int:
+            return Vector2D(other / self.x, other / self.y)
+        elif isinstance(other, Vector2D):
             return Vector2D(other.x / self.x, other.y / self.y)
         elif isinstance(other, tuple) or isinstance(other, list):
             return Vector2D(other[0] / self.x, other[1] / self.y)
@@ -178,7 +260,16 @@ class Vector2D(object):
             return NotImplemented
 
     def __iadd__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is Vector2D:
+            self.x += other.x
+            self.y += other.y
+            return self
+        elif cls is float or cls is int:
+            self.x += other
+            self.y += other
+            return self
+        elif isinstance(other, Vector2D):
             self.x += other.x
             self.y += other.y
             return self
@@ -194,7 +285,16 @@ class Vector2D(object):
             return NotImplemented
 
     def __isub__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is Vector2D:
+            self.x -= other.x
+            self.y -= other.y
+            return self
+        elif cls is float or cls is int:
+            self.x -= other
+            self.y -= other
+            return self
+        elif isinstance(other, Vector2D):
             self.x -= other.x
             self.y -= other.y
             return self
@@ -210,7 +310,16 @@ class Vector2D(object):
             return NotImplemented
 
     def __imul__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is float or cls is int:
+            self.x *= other
+            self.y *= other
+            return self
+        elif cls is Vector2D:
+            self.x *= other.x
+            self.y *= other.y
+            return self
+        elif isinstance(other, Vector2D):
             self.x *= other.x
             self.y *= other.y
             return self
@@ -226,7 +335,16 @@ class Vector2D(object):
             return NotImplemented
 
     def __idiv__(self, other):
-        if isinstance(other, Vector2D):
+        cls = type(other)
+        if cls is float or cls is int:
+            self.x /= other
+            self.y /= other
+            return self
+        elif cls is Vector2D:
+            self.x /= other.x
+            self.y /= other.y
+            return self
+        elif isinstance(other, Vector2D):
             self.x /= other.x
             self.y /= other.y
             return self
@@ -241,6 +359,9 @@ class Vector2D(object):
         else:
             return NotImplemented
 
+    __itruediv__ = __idiv__  # Python 3 name of the in-place division
+    __rtruediv__ = __rdiv__
+
     def __ipow__(self, other):
         if isinstance(other, int) or isinstance(other, float):
             self.x **= other
@@ -286,10 +407,10 @@ class Vector2D(object):
             return NotImplemented
 
     def __len__(self):
-        return int(sqrt(self.x ** 2 + self.y ** 2))
+        return int(sqrt(self.x * self.x + self.y * self.y))
 
     def get_length(self):
-        return sqrt(self.x ** 2 + self.y ** 2)
+        return sqrt(self.x * self.x + self.y * self.y)
 
     def __getitem__(self, key):
         if key in ['x', 'X', 0, '0']:
@@ -301,12 +422,230 @@ class Vector2D(object):
         return f'[x: {self.x}, y: {self.y}]'
 
     def __repr__(self):
-        return f'{"x": {self.x}, "y": {self.y}}'
+        return f'{{"x": {self.x}, "y": {self.y}}}'
 
     def __neg__(self):
         return Vector2D(-self.x, -self.y)
 
 
+class Vector2DArray(object):
+    """
+    Batch of 2D vectors stored in one (n, 2) float array, the vectorized companion of Vector2D.
+
+    Operators work element wise with another Vector2DArray of the same length, and
+    broadcast a single Vector2D, (x, y) pair or number over all vectors.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data=None):
+        """
+        Creates a new Vector2DArray.
+            :param data: An (n, 2) array-like, a list of Vector2D, or the number of zero vectors.
+        """
+        if data is None:
+            data = np.zeros((0, 2))
+        elif isinstance(data, int):
+            data = np.zeros((data, 2))
+        elif isinstance(data, list) and data and isinstance(data[0], Vector2D):
+            data = np.array([(v.x, v.y) for v in data], dtype=float)
+        else:
+            data = np.asarray(data, dtype=float).reshape(-1, 2)
+        self.data: np.ndarray = data
+
+    @staticmethod
+    def from_vectors(vectors: [Vector2D]) -> Vector2DArray:
+        return Vector2DArray(np.array([(v.x, v.y) for v in vectors], dtype=float).reshape(-1, 2))
+
+    def to_vectors(self) -> [Vector2D]:
+        return [Vector2D(x, y) for x, y in self.data.tolist()]
+
+    @staticmethod
+    def random(n: int, size=1, rng: np.random.Generator = None) -> Vector2DArray:
+        """
+        Random vectors with components in [0, size), like Vector2D.random.
+            :param n: Number of vectors.
+            :param size: Upper bound of the components, a number or an (x, y) pair.
+            :param rng: The random generator to use, a new unseeded one if None.
+        """
+        if isinstance(size, Vector2D):
+            size = (size.x, size.y)
+        rng = np.random.default_rng() if rng is None else rng
+        return Vector2DArray(rng.random((n, 2)) * size)
+
+    @staticmethod
+    def random_unit_circle(n: int, rng: np.random.Generator = None) -> Vector2DArray:
+        rng = np.random.default_rng() if rng is None else rng
+        d = rng.random(n) * 2 * pi
+        return Vector2DArray(np.column_stack((np.cos(d), np.sin(d))))
+
+    @staticmethod
+    def distance_matrix(a: Vector2DArray, b: Vector2DArray = None) -> np.ndarray:
+        """
+        Distances between every vector of a and every vector of b.
+            :param a: The first n vectors.
+            :param b: The second m vectors, a is used when None.
+            :return: (n, m) array of distances.
+        """
+        b = a if b is None else b
+        delta = a.data[:, None, :] - b.data[None, :, :]
+        return np.hypot(delta[..., 0], delta[..., 1])
+
+    @staticmethod
+    def distance(a: Vector2DArray, b) -> np.ndarray:
+        """
+        Element wise distances, like Vector2D.distance.
+            :return: (n,) array of distances.
+        """
+        return (a - b).lengths()
+
+    @staticmethod
+    def angle(v1: Vector2DArray, v2) -> np.ndarray:
+        """
+        Element wise angles between vectors in radians, like Vector2D.angle.
+            :return: (n,) array of angles.
+        """
+        cos_angle = v1.dot_product(v2) / (v1.lengths() * Vector2DArray._wrap(v2).lengths())
+        return np.arccos(np.clip(cos_angle, -1.0, 1.0))
+
+    @staticmethod
+    def angle_deg(v1: Vector2DArray, v2) -> np.ndarray:
+        return np.degrees(Vector2DArray.angle(v1, v2))
+
+    @staticmethod
+    def _wrap(other) -> Vector2DArray:
+        return other if isinstance(other, Vector2DArray) else Vector2DArray(Vector2DArray._operand(other))
+
+    @staticmethod
+    def _operand(other):
+        """
+        Converts the other operand of an operator to something that broadcasts with the data.
+        """
+        if isinstance(other, Vector2DArray):
+            return other.data
+        elif isinstance(other, Vector2D):
+            return np.array((other.x, other.y))
+        elif isinstance(other, tuple) or isinstance(other, list):
+            return np.asarray(other, dtype=float)
+        elif isinstance(other, (int, float, np.ndarray)):
+            if isinstance(other, np.ndarray) and other.ndim == 1:
+                return other[:, None]  # one scalar per vector
+            return other
+        return NotImplemented
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.data[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.data[:, 1]
+
+    def copy(self) -> Vector2DArray:
+        return Vector2DArray(self.data.copy())
+
+    def to_arr(self) -> np.ndarray:
+        return self.data
+
+    def lengths(self) -> np.ndarray:
+        return np.hypot(self.data[:, 0], self.data[:, 1])
+
+    def dot_product(self, other) -> np.ndarray:
+        other = Vector2DArray._operand(other)
+        if other is NotImplemented:
+            return NotImplemented
+        return np.sum(self.data * other, axis=-1)
+
+    def get_normalized(self) -> Vector2DArray:
+        """
+        Unit vectors in the same directions, zero vectors stay zero like in Vector2D.get_normalized.
+        """
+        lengths = self.lengths()[:, None]
+        return Vector2DArray(np.divide(self.data, lengths, out=np.zeros_like(self.data), where=lengths != 0))
+
+    def headings(self) -> np.ndarray:
+        """
+        Angle of every vector to the positive x axis in radians.
+        """
+        return np.arctan2(self.data[:, 1], self.data[:, 0])
+
+    def add_scaled(self, other, scalar):
+        """
+        Adds other * scalar to all vectors in place.
+            :return: This array.
+        """
+        self.data += Vector2DArray._operand(other) * scalar
+        return self
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.to_vectors())
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return Vector2D(*self.data[key].tolist())
+        return Vector2DArray(self.data[key])
+
+    def __setitem__(self, key, value):
+        self.data[key] = Vector2DArray._operand(value)
+
+    def __add__(self, other):
+        other = Vector2DArray._operand(other)
+        return NotImplemented if other is NotImplemented else Vector2DArray(self.data + other)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = Vector2DArray._operand(other)
+        return NotImplemented if other is NotImplemented else Vector2DArray(self.data - other)
+
+    def __rsub__(self, other):
+        other = Vector2DArray._operand(other)
+        return NotImplemented if other is NotImplemented else Vector2DArray(other - self.data)
+
+    def __mul__(self, other):
+        other = Vector2DArray._operand(other)
+        return NotImplemented if other is NotImplemented else Vector2DArray(self.data * other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        other = Vector2DArray._operand(other)
+        return NotImplemented if other is NotImplemented else Vector2DArray(self.data / other)
+
+    def __iadd__(self, other):
+        self.data += Vector2DArray._operand(other)
+        return self
+
+    def __isub__(self, other):
+        self.data -= Vector2DArray._operand(other)
+        return self
+
+    def __imul__(self, other):
+        self.data *= Vector2DArray._operand(other)
+        return self
+
+    def __itruediv__(self, other):
+        self.data /= Vector2DArray._operand(other)
+        return self
+
+    def __neg__(self):
+        return Vector2DArray(-self.data)
+
+    def __eq__(self, other):
+        if isinstance(other, Vector2DArray):
+            return self.data.shape == other.data.shape and bool(np.all(self.data == other.data))
+        return NotImplemented
+
+    def __str__(self):
+        return str(self.data)
+
+    def __repr__(self):
+        return f'Vector2DArray({self.data.tolist()})'
+
+
 class Dimension(object):
     """
     Class that holds a width and height of an item.